@@ -16,6 +16,7 @@ from deepfigures import settings
 from deepfigures.data_generation import arxiv_pipeline
 from deepfigures.data_generation import utils
 from deepfigures.data_generation.paper_tar_processor import PaperTarProcessor
+from deepfigures.utils import watchdog
 
 FILE_NAME = 'file_name'
 PAPER_TAR_NAMES = 'paper_tar_names'
@@ -69,7 +70,10 @@ class ArxivDataSet(torch.utils.data.dataset.IterableDataset):
                  augment_typewriter_font=True,
                  augment_line_spacing_1_5=True,
                  image_augmentation_transform_sequence=settings.seq,
-                 ignore_pages_with_no_figures: bool = False) -> None:
+                 ignore_pages_with_no_figures: bool = False,
+                 paper_timeout: float = settings.PROCESS_PAPER_TAR_TIMEOUT,
+                 paper_max_memory: int = settings.PROCESS_PAPER_TAR_MAX_MEMORY,
+                 failure_manifest_path: str = settings.ARXIV_FAILURE_MANIFEST_PATH) -> None:
         """
         This class initializes the queue and the contexts for each worker.
         Irrespective of the number of workers in the DataLoader, this constructor will be
@@ -88,6 +92,9 @@ class ArxivDataSet(torch.utils.data.dataset.IterableDataset):
 
         :param list_of_files: is the list of the zipped files that we want to read.
         :param shuffle_input: if True, will randomly shuffle the input.
+        :param paper_timeout: the wall clock time in seconds after which processing a paper is killed.
+        :param paper_max_memory: the memory in bytes processing a paper may use before it's killed.
+        :param failure_manifest_path: the json lines manifest the papers that are killed or fail are recorded in.
         """
         super().__init__()
         self.work_dir_prefix = work_dir_prefix
@@ -100,6 +107,9 @@ class ArxivDataSet(torch.utils.data.dataset.IterableDataset):
         self.augment_line_spacing_1_5 = augment_line_spacing_1_5
         self.image_augmentation_transform_sequence = image_augmentation_transform_sequence
         self.ignore_pages_with_no_figures = ignore_pages_with_no_figures
+        self.paper_timeout = paper_timeout
+        self.paper_max_memory = paper_max_memory
+        self.failure_manifest_path = failure_manifest_path
 
         if not list_of_files:
             list_of_files = []
@@ -193,9 +203,18 @@ class ArxivDataSet(torch.utils.data.dataset.IterableDataset):
                                                         image_augmentation_transform_sequence=self.image_augmentation_transform_sequence,
                                                         ignore_pages_with_no_figures=self.ignore_pages_with_no_figures)
                 try:
-                    result_tuple = paper_tar_processor.process_paper_tar()
+                    # Process the paper in its own process group, so that a paper where pdflatex or ghostscript get
+                    # stuck is killed instead of holding on to this worker.
+                    result_tuple = watchdog.run_with_watchdog(
+                        paper_tar_processor.process_paper_tar, timeout=self.paper_timeout,
+                        max_memory=self.paper_max_memory, initializer=arxiv_pipeline.reseed_random_states)
                     if result_tuple:
                         result_path, figure_boundaries, caption_boundaries = result_tuple
+                except watchdog.WatchdogError as e:
+                    logging.warning(
+                        'Failed to process paper tar. Recording it in the failure manifest and moving forward. '
+                        'Worker ID: {}. paper_tar_name: {}. {}'.format(worker_id, paper_tar_name, e))
+                    watchdog.record_failure(self.failure_manifest_path, paper_tar_name, e)
                 except Exception:  # Intentional broad catch clause because the try block should ideally throw nothing.
                     logging.warning(
                         'Unhandled exception caught while processing paper tar. Suppressing it and moving forward. Worker ID: {}. paper_tar_name: {}'.format(
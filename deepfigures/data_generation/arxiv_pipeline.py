@@ -6,16 +6,15 @@ import tarfile
 import logging
 import multiprocessing
 import multiprocessing.pool
-from multiprocessing.dummy import Pool as ThreadPool
 import re
 import time
 import functools
 import collections
-from typing import List, Optional, Tuple
+import random
+from typing import Iterator, List, Optional, Tuple
 import json
 
 import numpy as np
-from skimage import measure
 from PIL import Image
 import bs4
 
@@ -25,7 +24,7 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 
 from deepfigures import settings
-from deepfigures.utils import file_util, config, settings_utils
+from deepfigures.utils import file_util, config, settings_utils, watchdog
 from deepfigures.extraction import figure_utils, renderers
 from deepfigures.extraction.figure_utils import Figure, BoxClass
 
@@ -107,11 +106,11 @@ def parse_arxiv_tarname(tarname: str) -> Tuple[int, int, int]:
     )
 
 
-def generate_diffs(paper_src_dir: str,
-                   dpi: int = settings.DEFAULT_INFERENCE_DPI) -> (Optional[List[str]], Optional[List[str]]):
+def write_color_and_black_tex(paper_src_dir: str) -> Optional[Tuple[str, str]]:
     """
-    Given the directory of a latex source file, create a modified copy of the source that includes colored boxes
-    surrounding each figure and table.
+    Given the directory of a latex source file, write a modified copy of the source that includes colored boxes
+    surrounding each figure and table and colored captions, and one with the same boxes and captions in black and
+    white. Returns the paths of the color and black copies, or None if there isn't exactly one .tex file.
     """
     paper_tex = glob.glob(paper_src_dir + '/' + '*.tex')
     if len(paper_tex) > 1:
@@ -139,6 +138,23 @@ def generate_diffs(paper_src_dir: str,
         print(text.replace(BEGIN_DOC, COLOR_STR), file=f)
     with open(black_filename, 'w') as f:
         print(text.replace(BEGIN_DOC, BLACK_STR), file=f)
+    return color_filename, black_filename
+
+
+def generate_page_images(paper_src_dir: str,
+                         dpi: int = settings.DEFAULT_INFERENCE_DPI) -> Optional[Tuple[str, List[str], List[str]]]:
+    """
+    Given the directory of a latex source file, create a modified copy of the source that includes colored boxes
+    surrounding each figure and table, compile it with and without the colors, and render both.
+    Returns the directory the pdfs were compiled to and the paths of the color and black page images, or None if the
+    source can't be compiled.
+    """
+    tex_filenames = write_color_and_black_tex(paper_src_dir)
+    if tex_filenames is None:
+        return None
+    (color_filename, black_filename) = tex_filenames
+    chunk_dir, paper_id = os.path.split(paper_src_dir)
+    chunk_id = os.path.basename(chunk_dir)
 
     result_dir = ARXIV_DIFF_DIR + chunk_id + '/' + paper_id + '/'
     if not os.path.isdir(result_dir):
@@ -147,35 +163,64 @@ def generate_diffs(paper_src_dir: str,
         # on some PDFs, call_pdflatex doesn't raise an exception even
         # after the timeout, and instead hangs indefinitely (> 24
         # hours).
-        color_pdf = figure_utils.call_pdflatex(
-            src_tex=color_filename,
+        # The color and black variants only differ in their colors, so they share the first pass and their final
+        # passes run concurrently
+        (color_pdf, black_pdf) = figure_utils.call_pdflatex_with_shared_first_pass(
+            src_texs=[color_filename, black_filename],
             src_dir=paper_src_dir,
             dest_dir=result_dir,
-            timeout=PDFLATEX_TIMEOUT
-        )
-        black_pdf = figure_utils.call_pdflatex(
-            src_tex=black_filename,
-            src_dir=paper_src_dir,
-            dest_dir=result_dir,
-            timeout=PDFLATEX_TIMEOUT
+            timeout=PDFLATEX_TIMEOUT,
+            draft_first_pass=settings.PDFLATEX_DRAFT_FIRST_PASS
         )
     except figure_utils.LatexException as e:
         logging.warning('Pdflatex failure: %s' % e.stdout)
         return None
     color_ims = pdf_renderer.render(color_pdf, dpi=dpi, max_pages=MAX_PAGES)
     black_ims = pdf_renderer.render(black_pdf, dpi=dpi, max_pages=MAX_PAGES)
-    diff_names = []
+    return result_dir, color_ims, black_ims
+
+
+def iter_page_diffs(color_ims: List[str], black_ims: List[str],
+                    diff_dir: Optional[str] = None) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+    """
+    Read each pair of color and black page images and yield the black page's path, the black page and their diff,
+    one page at a time. Pages too large to read are skipped.
+    :param color_ims: the paths of the color page images.
+    :param black_ims: the paths of the black page images.
+    :param diff_dir: if given, also write each diff to this directory as diff-<black page name>.
+    """
     for (color_page, black_page) in zip(color_ims, black_ims):
         assert os.path.isfile(color_page) and os.path.isfile(black_page)
-        color_page_im = imageio.imread(color_page)
-        black_page_im = imageio.imread(black_page)
+        try:
+            color_page_im = imageio.imread(color_page)
+            black_page_im = imageio.imread(black_page)
+        except Image.DecompressionBombWarning as e:
+            logging.warning('Image %s too large, failed to read' % black_page)
+            logging.warning(e)
+            continue
         assert color_page_im.shape == black_page_im.shape
         diff_page = figure_utils.im_diff(color_page_im, black_page_im)
-        diff_name = result_dir + 'diff-' + os.path.basename(black_page)
-        imageio.imwrite(diff_name, diff_page)
-        # imageio.imwrite(diff_name, )
-        diff_names.append(diff_name)
-    return diff_names, black_ims
+        if diff_dir is not None:
+            imageio.imwrite(diff_dir + 'diff-' + os.path.basename(black_page), diff_page)
+        yield black_page, black_page_im, diff_page
+
+
+def generate_diffs(paper_src_dir: str,
+                   dpi: int = settings.DEFAULT_INFERENCE_DPI) -> (Optional[List[str]], Optional[List[str]]):
+    """
+    Given the directory of a latex source file, render its pages with and without colored boxes surrounding each
+    figure and table, and write the diff of each page to disk. Returns the paths of the diffs and the black pages.
+    """
+    page_images = generate_page_images(paper_src_dir, dpi=dpi)
+    if page_images is None:
+        return None
+    (result_dir, color_ims, black_ims) = page_images
+    diff_names = []
+    black_page_names = []
+    for (black_page, _, _) in iter_page_diffs(color_ims, black_ims, diff_dir=result_dir):
+        diff_names.append(result_dir + 'diff-' + os.path.basename(black_page))
+        black_page_names.append(black_page)
+    return diff_names, black_page_names
 
 
 CAPTION_LABEL_COLOR = [0, 255, 0]
@@ -238,45 +283,19 @@ def find_figures_and_captions(
         diff_im: np.ndarray, im: np.ndarray, page_num: int
 ) -> List[Figure]:
     figures = []
-    all_box_mask = (
-        np.logical_or(diff_im == FIGURE_BOX_COLOR, diff_im == TABLE_BOX_COLOR)
-    ).all(axis=2)
-    all_caption_mask = (
-        np.logical_or(
-            diff_im == CAPTION_LABEL_COLOR, diff_im == CAPTION_TEXT_COLOR
-        )
-    ).all(axis=2)
-    components = measure.label(all_box_mask)
-    # Component id 0 is for background
-    for component_id in np.unique(components)[1:]:
-        (box_ys, box_xs) = np.where(components == component_id)
-        assert (len(box_ys) > 0
-                )  # It was found from np.unique so it must exist somewhere
-        assert (len(box_xs) > 0)
-        full_box = BoxClass(
-            x1=float(min(box_xs)),
-            y1=float(min(box_ys)),
-            x2=float(max(box_xs) + 1),
-            y2=float(max(box_ys) + 1)
-        )
-        caption_mask = all_caption_mask.copy()
-        caption_mask[:, :round(full_box.x1)] = 0
-        caption_mask[:, round(full_box.x2):] = 0
-        caption_mask[:round(full_box.y1), :] = 0
-        caption_mask[round(full_box.y2):, :] = 0
-        (cap_ys, cap_xs) = np.where(caption_mask)
-        if len(cap_ys) == 0:
+    (all_box_mask, all_caption_mask) = figure_utils.get_channelwise_color_masks(
+        diff_im, [
+            [FIGURE_BOX_COLOR, TABLE_BOX_COLOR],
+            [CAPTION_LABEL_COLOR, CAPTION_TEXT_COLOR]
+        ])
+    for (full_box, cap_box, (first_y, first_x)) in figure_utils.find_box_components(
+            all_box_mask, all_caption_mask):
+        if cap_box is None:
             continue  # Ignore boxes with no captions
-        cap_box = BoxClass(
-            x1=float(min(cap_xs)),
-            y1=float(min(cap_ys)),
-            x2=float(max(cap_xs) + 1),
-            y2=float(max(cap_ys) + 1),
-        )
         fig_box = get_figure_box(full_box, cap_box, im)
         if fig_box is None:
             continue
-        box_color = diff_im[box_ys[0], box_xs[0], :]
+        box_color = diff_im[first_y, first_x, :]
         if np.all(box_color == FIGURE_BOX_COLOR):
             figure_type = 'Figure'
         else:
@@ -378,22 +397,21 @@ def process_paper_tar(paper_tarname: str) -> None:
     except tarfile.ReadError:
         logging.debug('File %s is not a tar' % paper_tarname)
         return
-    try:
-        diffs, black_ims_paths = generate_diffs(paper_dir)
-    except TypeError:
-        return
-    if diffs is None:
+    page_images = generate_page_images(paper_dir)
+    if page_images is None:
         return
+    (result_dir, color_ims, black_ims) = page_images
+    # The diffs are only written to disk for debugging, figures are found from them in memory
+    diff_dir = result_dir if settings.ARXIV_SAVE_DIFF_IMAGES else None
     figures_by_page = dict()
-    for idx, diff in enumerate(diffs):
-        figures = consume_diff_generate_figures(diff)
-        if figures is None:
-            continue
+    for (black_page, black_page_im, diff_page) in iter_page_diffs(color_ims, black_ims, diff_dir=diff_dir):
+        page_num = figure_utils.pagename_to_pagenum(black_page)
+        figures = find_figures_and_captions(diff_page, black_page_im, page_num)
         try:
-            figures = augment_images(black_ims_paths[idx], figures)
+            figures = augment_images(black_page, figures)
         except Exception as e:
-            print("Error augmenting images for image path: {}. Exception message: {}".format(black_ims_paths[idx], e))
-        page_name = os.path.dirname(diff) + '/' + diff[diff.find('black.pdf-'):]
+            print("Error augmenting images for image path: {}. Exception message: {}".format(black_page, e))
+        page_name = result_dir + os.path.basename(black_page)
         figures_by_page[page_name] = figures
     file_util.safe_makedirs(os.path.dirname(result_path))
     file_util.write_json_atomic(
@@ -403,16 +421,32 @@ def process_paper_tar(paper_tarname: str) -> None:
     )
 
 
-def process_paper_tar_with_timeout(paper_tarname: str) -> None:
-    p = ThreadPool(processes=1)
-    result = p.apply_async(process_paper_tar, (paper_tarname,))
+def reseed_random_states() -> None:
+    """
+    Reseed the random states used for image augmentation, which a forked process copies from its parent, so that
+    papers processed in different processes aren't augmented the same way.
+    """
+    seed = int.from_bytes(os.urandom(4), 'little')
+    random.seed(seed)
+    np.random.seed(seed)
+    ia.seed(seed)
+
+
+def process_paper_tar_with_timeout(paper_tarname: str, timeout: float = settings.PROCESS_PAPER_TAR_TIMEOUT,
+                                   max_memory: int = settings.PROCESS_PAPER_TAR_MAX_MEMORY,
+                                   manifest_path: str = settings.ARXIV_FAILURE_MANIFEST_PATH) -> None:
+    """
+    Process a paper tar in its own process group, which is killed along with any pdflatex or ghostscript processes
+    if it runs longer than timeout seconds or uses more than max_memory bytes, so that a stuck paper can't hold on to
+    its worker. Papers that are killed or fail are recorded in the failure manifest at manifest_path.
+    """
     try:
-        out = result.get(timeout=100)  # Wait timeout seconds for func to complete.
-        return out
-    except multiprocessing.TimeoutError:
-        print("Aborting due to timeout")
-        p.terminate()
-        raise
+        return watchdog.run_with_watchdog(
+            process_paper_tar, args=(paper_tarname,), timeout=timeout, max_memory=max_memory,
+            initializer=reseed_random_states)
+    except watchdog.WatchdogError as e:
+        print("Aborting paper tar {}: {}".format(paper_tarname, e))
+        watchdog.record_failure(manifest_path, paper_tarname, e)
 
 
 def download_and_extract_tar(
@@ -476,7 +510,7 @@ def run_on_all() -> None:
         )
         with multiprocessing.Pool(processes=round(settings.PROCESS_PAPER_TAR_THREAD_COUNT)
                                   ) as p:
-            p.map(process_paper_tar, paper_tarnames)
+            p.map(process_paper_tar_with_timeout, paper_tarnames)
 
 
 if __name__ == "__main__":
@@ -8,13 +8,12 @@ from deepfigures.extraction.figure_utils import Figure, BoxClass
 import tarfile
 import logging
 import re
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 import json
 import glob
 import shutil
 
 import numpy as np
-from skimage import measure
 from PIL import Image
 import bs4
 
@@ -123,7 +122,9 @@ class PaperTarProcessor:
                  augment_typewriter_font: bool = True,
                  augment_line_spacing_1_5: bool = True,
                  image_augmentation_transform_sequence: iaa.Sequential = settings.no_op,
-                 ignore_pages_with_no_figures: bool = False
+                 ignore_pages_with_no_figures: bool = False,
+                 save_diff_images: bool = settings.ARXIV_SAVE_DIFF_IMAGES,
+                 pdflatex_draft_first_pass: bool = settings.PDFLATEX_DRAFT_FIRST_PASS
                  ) -> None:
         super().__init__()
 
@@ -138,6 +139,8 @@ class PaperTarProcessor:
         self.augment_line_spacing_1_5 = augment_line_spacing_1_5
         self.image_augmentation_transform_sequence = image_augmentation_transform_sequence
         self.ignore_pages_with_no_figures = ignore_pages_with_no_figures
+        self.save_diff_images = save_diff_images
+        self.pdflatex_draft_first_pass = pdflatex_draft_first_pass
 
         self.ARXIV_SRC_DIR = os.path.join(
             self.arxiv_data_output_dir,
@@ -195,23 +198,22 @@ class PaperTarProcessor:
         except tarfile.ReadError:
             logging.debug('File %s is not a tar' % self.paper_tarname)
             return
-        try:
-            diffs, black_ims_paths = self.generate_diffs(paper_dir)
-        except TypeError:
-            return
-        if diffs is None:
+        page_images = self.generate_page_images(paper_dir)
+        if page_images is None:
             return
+        (result_dir, color_ims, black_ims) = page_images
+        # The diffs are only written to disk for debugging, figures are found from them in memory
+        diff_dir = result_dir if self.save_diff_images else None
         figures_by_page = dict()
-        for idx, diff in enumerate(diffs):
-            figures = self.consume_diff_generate_figures(diff)
-            if figures is None:
-                continue
+        for (black_page, black_page_im, diff_page) in self.iter_page_diffs(color_ims, black_ims, diff_dir=diff_dir):
+            page_num = figure_utils.pagename_to_pagenum(black_page)
+            figures = self.find_figures_and_captions(diff_page, black_page_im, page_num)
             try:
-                figures = self.augment_images(black_ims_paths[idx], figures)
+                figures = self.augment_images(black_page, figures)
             except Exception as e:
                 print(
-                    "Error augmenting images for image path: {}. Exception message: {}".format(black_ims_paths[idx], e))
-            page_name = os.path.dirname(diff) + '/' + diff[diff.find('black.pdf-'):]
+                    "Error augmenting images for image path: {}. Exception message: {}".format(black_page, e))
+            page_name = result_dir + os.path.basename(black_page)
             figures_by_page[page_name] = figures
         file_util.safe_makedirs(os.path.dirname(result_path))
         file_util.write_json_atomic(
@@ -222,11 +224,13 @@ class PaperTarProcessor:
         figure_boundaries, caption_boundaries = transform_figure_json(result_path, self.ignore_pages_with_no_figures)
         return result_path, figure_boundaries, caption_boundaries
 
-    def generate_diffs(self, paper_src_dir: str, dpi: int = settings.DEFAULT_INFERENCE_DPI) -> (
-            Optional[List[str]], Optional[List[str]]):
+    def generate_page_images(self, paper_src_dir: str, dpi: int = settings.DEFAULT_INFERENCE_DPI) -> Optional[
+            Tuple[str, List[str], List[str]]]:
         """
         Given the directory of a latex source file, create a modified copy of the source that includes colored boxes
-        surrounding each figure and table.
+        surrounding each figure and table, compile it with and without the colors, and render both.
+        Returns the directory the pdfs were compiled to and the paths of the color and black page images, or None if
+        the source can't be compiled.
         """
         paper_tex = glob.glob(paper_src_dir + '/' + '*.tex')
         if len(paper_tex) > 1:
@@ -269,34 +273,62 @@ class PaperTarProcessor:
             # on some PDFs, call_pdflatex doesn't raise an exception even
             # after the timeout, and instead hangs indefinitely (> 24
             # hours).
-            color_pdf = figure_utils.call_pdflatex(
-                src_tex=color_filename,
-                src_dir=paper_src_dir,
-                dest_dir=result_dir,
-                timeout=self.PDFLATEX_TIMEOUT
-            )
-            black_pdf = figure_utils.call_pdflatex(
-                src_tex=black_filename,
+            # The color and black variants only differ in their colors, so they share the first pass and their final
+            # passes run concurrently
+            (color_pdf, black_pdf) = figure_utils.call_pdflatex_with_shared_first_pass(
+                src_texs=[color_filename, black_filename],
                 src_dir=paper_src_dir,
                 dest_dir=result_dir,
-                timeout=self.PDFLATEX_TIMEOUT
+                timeout=self.PDFLATEX_TIMEOUT,
+                draft_first_pass=self.pdflatex_draft_first_pass
             )
         except figure_utils.LatexException as e:
             logging.warning('Pdflatex failure: %s' % e.stdout)
             return None
         color_ims = pdf_renderer.render(color_pdf, dpi=dpi, max_pages=self.MAX_PAGES)
         black_ims = pdf_renderer.render(black_pdf, dpi=dpi, max_pages=self.MAX_PAGES)
-        diff_names = []
+        return result_dir, color_ims, black_ims
+
+    def iter_page_diffs(self, color_ims: List[str], black_ims: List[str],
+                        diff_dir: Optional[str] = None) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """
+        Read each pair of color and black page images and yield the black page's path, the black page and their
+        diff, one page at a time. Pages too large to read are skipped.
+        :param color_ims: the paths of the color page images.
+        :param black_ims: the paths of the black page images.
+        :param diff_dir: if given, also write each diff to this directory as diff-<black page name>.
+        """
         for (color_page, black_page) in zip(color_ims, black_ims):
             assert os.path.isfile(color_page) and os.path.isfile(black_page)
-            color_page_im = imageio.imread(color_page)
-            black_page_im = imageio.imread(black_page)
+            try:
+                color_page_im = imageio.imread(color_page)
+                black_page_im = imageio.imread(black_page)
+            except Image.DecompressionBombWarning as e:
+                logging.warning('Image %s too large, failed to read' % black_page)
+                logging.warning(e)
+                continue
             assert color_page_im.shape == black_page_im.shape
             diff_page = figure_utils.im_diff(color_page_im, black_page_im)
-            diff_name = result_dir + 'diff-' + os.path.basename(black_page)
-            imageio.imwrite(uri=diff_name, im=diff_page)
-            diff_names.append(diff_name)
-        return diff_names, black_ims
+            if diff_dir is not None:
+                imageio.imwrite(uri=diff_dir + 'diff-' + os.path.basename(black_page), im=diff_page)
+            yield black_page, black_page_im, diff_page
+
+    def generate_diffs(self, paper_src_dir: str, dpi: int = settings.DEFAULT_INFERENCE_DPI) -> (
+            Optional[List[str]], Optional[List[str]]):
+        """
+        Given the directory of a latex source file, render its pages with and without colored boxes surrounding each
+        figure and table, and write the diff of each page to disk. Returns the paths of the diffs and the black pages.
+        """
+        page_images = self.generate_page_images(paper_src_dir, dpi=dpi)
+        if page_images is None:
+            return None
+        (result_dir, color_ims, black_ims) = page_images
+        diff_names = []
+        black_page_names = []
+        for (black_page, _, _) in self.iter_page_diffs(color_ims, black_ims, diff_dir=result_dir):
+            diff_names.append(result_dir + 'diff-' + os.path.basename(black_page))
+            black_page_names.append(black_page)
+        return diff_names, black_page_names
 
     def make_12_pt(self, input_text):
         return re.sub(self.DOC_CLASS_REGEX, doc_class_replace, input_text)
@@ -348,45 +380,19 @@ class PaperTarProcessor:
             self, diff_im: np.ndarray, im: np.ndarray, page_num: int
     ) -> List[Figure]:
         figures = []
-        all_box_mask = (
-            np.logical_or(diff_im == self.FIGURE_BOX_COLOR, diff_im == self.TABLE_BOX_COLOR)
-        ).all(axis=2)
-        all_caption_mask = (
-            np.logical_or(
-                diff_im == self.CAPTION_LABEL_COLOR, diff_im == self.CAPTION_TEXT_COLOR
-            )
-        ).all(axis=2)
-        components = measure.label(all_box_mask)
-        # Component id 0 is for background
-        for component_id in np.unique(components)[1:]:
-            (box_ys, box_xs) = np.where(components == component_id)
-            assert (len(box_ys) > 0
-                    )  # It was found from np.unique so it must exist somewhere
-            assert (len(box_xs) > 0)
-            full_box = BoxClass(
-                x1=float(min(box_xs)),
-                y1=float(min(box_ys)),
-                x2=float(max(box_xs) + 1),
-                y2=float(max(box_ys) + 1)
-            )
-            caption_mask = all_caption_mask.copy()
-            caption_mask[:, :round(full_box.x1)] = 0
-            caption_mask[:, round(full_box.x2):] = 0
-            caption_mask[:round(full_box.y1), :] = 0
-            caption_mask[round(full_box.y2):, :] = 0
-            (cap_ys, cap_xs) = np.where(caption_mask)
-            if len(cap_ys) == 0:
+        (all_box_mask, all_caption_mask) = figure_utils.get_channelwise_color_masks(
+            diff_im, [
+                [self.FIGURE_BOX_COLOR, self.TABLE_BOX_COLOR],
+                [self.CAPTION_LABEL_COLOR, self.CAPTION_TEXT_COLOR]
+            ])
+        for (full_box, cap_box, (first_y, first_x)) in figure_utils.find_box_components(
+                all_box_mask, all_caption_mask):
+            if cap_box is None:
                 continue  # Ignore boxes with no captions
-            cap_box = BoxClass(
-                x1=float(min(cap_xs)),
-                y1=float(min(cap_ys)),
-                x2=float(max(cap_xs) + 1),
-                y2=float(max(cap_ys) + 1),
-            )
             fig_box = self.get_figure_box(full_box, cap_box, im)
             if fig_box is None:
                 continue
-            box_color = diff_im[box_ys[0], box_xs[0], :]
+            box_color = diff_im[first_y, first_x, :]
             if np.all(box_color == self.FIGURE_BOX_COLOR):
                 figure_type = 'Figure'
             else:
@@ -0,0 +1,288 @@
+"""A content-addressed cache for figure extraction results.
+
+Extraction results live in a directory named after the SHA1 hash of the
+PDF (see ``deepfigures.extraction.pipeline.FigureExtraction``). Within
+that directory, renderings are keyed by rendering engine and dpi and the
+pdffigures2 output only depends on the PDF, so both are shared by every
+model. Detection results additionally depend on the model and settings
+used to produce them, including any page triage, and are stored under a
+result key computed by ``get_result_key``.
+
+The cache directory can be bounded in size with ``evict_lru``, which
+removes the least recently used PDF directories first. Only directories
+that look like PDF results directories are ever removed, so anything
+else kept alongside them in the output directory is left alone. The
+size of each results directory is recorded by ``record_size`` when its
+results are written, so bounding the cache doesn't walk every file in
+it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+from deepfigures import settings
+from deepfigures.utils import misc
+
+
+logger = logging.getLogger(__name__)
+
+# name of the file whose mtime records when a PDF's results were last used
+LAST_USED_FILE_NAME = '_LAST_USED'
+
+# name of the file recording the total size of a PDF's results
+SIZE_FILE_NAME = '_SIZE'
+
+# results directories are named after the SHA1 hash of the PDF
+RESULTS_DIRECTORY_NAME_RE = re.compile(r'^[0-9a-f]{40}$')
+
+
+def get_result_key(
+        model=None,
+        inference_dpi=None,
+        cropped_img_dpi=None,
+        pdf_renderer=None,
+        page_triage_recall_target=None,
+        page_triage_calibration_path=None):
+    """Return the key identifying a configuration of the detector.
+
+    Each parameter left as ``None`` is read from ``settings`` when the
+    key is computed, so the key tracks settings changed after import
+    the same way detection does.
+
+    Parameters
+    ----------
+    model : Optional[Dict[str, Any]]
+        The arguments used to construct the detector, e.g. its save
+        directory and checkpoint iteration. Defaults to
+        ``settings.TENSORBOX_MODEL``.
+    inference_dpi : Optional[int]
+        The dpi of the pages passed to the detector. Defaults to
+        ``settings.DEFAULT_INFERENCE_DPI``.
+    cropped_img_dpi : Optional[int]
+        The dpi at which figures are cropped. Defaults to
+        ``settings.DEFAULT_CROPPED_IMG_DPI``.
+    pdf_renderer : Optional[str]
+        The import path of the PDF renderer. Defaults to
+        ``settings.DEEPFIGURES_PDF_RENDERER``.
+    page_triage_recall_target : Optional[float]
+        The recall target of the page triage. Defaults to
+        ``settings.PAGE_TRIAGE_RECALL_TARGET``, which is ``None`` if
+        detection runs on every page.
+    page_triage_calibration_path : Optional[str]
+        The path to the page triage's calibration, whose contents
+        determine its threshold. Defaults to
+        ``settings.PAGE_TRIAGE_CALIBRATION_PATH``. Ignored if page
+        triage is disabled.
+
+    Returns
+    -------
+    str
+        A hex string which changes whenever any of the parameters do,
+        or the calibration file's contents change while page triage is
+        enabled.
+    """
+    if model is None:
+        model = settings.TENSORBOX_MODEL
+    if inference_dpi is None:
+        inference_dpi = settings.DEFAULT_INFERENCE_DPI
+    if cropped_img_dpi is None:
+        cropped_img_dpi = settings.DEFAULT_CROPPED_IMG_DPI
+    if pdf_renderer is None:
+        pdf_renderer = settings.DEEPFIGURES_PDF_RENDERER
+    if page_triage_recall_target is None:
+        page_triage_recall_target = settings.PAGE_TRIAGE_RECALL_TARGET
+    if page_triage_calibration_path is None:
+        page_triage_calibration_path = settings.PAGE_TRIAGE_CALIBRATION_PATH
+    key_fields = {
+        'model': model,
+        'inference_dpi': inference_dpi,
+        'cropped_img_dpi': cropped_img_dpi,
+        'pdf_renderer': pdf_renderer
+    }
+    # leave the key unchanged when page triage is disabled so results
+    # cached before it existed are still used
+    if page_triage_recall_target is not None:
+        key_fields['page_triage'] = {
+            'recall_target': page_triage_recall_target,
+            'calibration_hash': (
+                misc.hash_out_of_core(
+                    hashlib.sha1, page_triage_calibration_path)
+                if os.path.exists(page_triage_calibration_path)
+                else None)
+        }
+    key_data = json.dumps(key_fields, sort_keys=True)
+    return hashlib.sha1(key_data.encode('utf-8')).hexdigest()[:16]
+
+
+def mark_used(base_path):
+    """Record that the results in ``base_path`` were just used.
+
+    Parameters
+    ----------
+    base_path : str
+        The directory holding the results for a single PDF.
+    """
+    last_used_path = os.path.join(base_path, LAST_USED_FILE_NAME)
+    with open(last_used_path, 'a'):
+        os.utime(last_used_path)
+
+
+def get_last_used(base_path):
+    """Return the time the results in ``base_path`` were last used.
+
+    Parameters
+    ----------
+    base_path : str
+        The directory holding the results for a single PDF.
+
+    Returns
+    -------
+    float
+        The time as seconds since the epoch, falling back to the
+        modification time of ``base_path`` itself.
+    """
+    last_used_path = os.path.join(base_path, LAST_USED_FILE_NAME)
+    if os.path.exists(last_used_path):
+        return os.path.getmtime(last_used_path)
+    return os.path.getmtime(base_path)
+
+
+def get_size(path):
+    """Return the total size in bytes of the files under ``path``.
+
+    Parameters
+    ----------
+    path : str
+        A path to a directory.
+
+    Returns
+    -------
+    int
+        The total size in bytes.
+    """
+    size = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+    return size
+
+
+def record_size(base_path):
+    """Record the total size of the results in ``base_path``.
+
+    Call this whenever the results in ``base_path`` change, so that
+    ``get_recorded_size`` stays up to date.
+
+    Parameters
+    ----------
+    base_path : str
+        The directory holding the results for a single PDF.
+
+    Returns
+    -------
+    int
+        The total size in bytes.
+    """
+    size = get_size(base_path)
+    size_path = os.path.join(base_path, SIZE_FILE_NAME)
+    tmp_size_path = size_path + '.tmp'
+    with open(tmp_size_path, 'w') as f_out:
+        f_out.write(str(size))
+    os.replace(tmp_size_path, size_path)
+    return size
+
+
+def get_recorded_size(base_path):
+    """Return the size of the results in ``base_path`` from its record.
+
+    Parameters
+    ----------
+    base_path : str
+        The directory holding the results for a single PDF.
+
+    Returns
+    -------
+    int
+        The total size in bytes recorded by ``record_size``. If no size
+        has been recorded, e.g. because extraction failed partway, it's
+        computed and recorded now.
+    """
+    try:
+        with open(os.path.join(base_path, SIZE_FILE_NAME)) as f_in:
+            return int(f_in.read())
+    except (OSError, ValueError):
+        return record_size(base_path)
+
+
+def is_results_directory(path):
+    """Return whether ``path`` is a results directory for a single PDF.
+
+    Parameters
+    ----------
+    path : str
+        A path to a directory.
+
+    Returns
+    -------
+    bool
+        ``True`` if ``path`` is named after the SHA1 hash of a PDF and
+        has been marked used by ``mark_used``.
+    """
+    return (
+        os.path.isdir(path)
+        and not os.path.islink(path)
+        and RESULTS_DIRECTORY_NAME_RE.match(os.path.basename(path))
+        is not None
+        and os.path.isfile(os.path.join(path, LAST_USED_FILE_NAME)))
+
+
+def evict_lru(cache_dir, max_size, keep=()):
+    """Delete the least recently used results until under ``max_size``.
+
+    Only results directories (see ``is_results_directory``) are counted
+    towards the size of ``cache_dir`` or evicted, so other files and
+    directories in ``cache_dir`` are never deleted. Their sizes are
+    read from the records kept by ``record_size`` rather than by walking
+    their files.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The directory containing one results directory per PDF.
+    max_size : int
+        The maximum total size in bytes of the results directories in
+        ``cache_dir``.
+    keep : Iterable[str]
+        Paths to results directories which must not be evicted.
+
+    Returns
+    -------
+    List[str]
+        The paths to the evicted results directories.
+    """
+    keep = {os.path.abspath(path) for path in keep}
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if is_results_directory(path):
+            entries.append(
+                (get_last_used(path), get_recorded_size(path), path))
+    total_size = sum(size for _, size, _ in entries)
+
+    evicted = []
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        logger.info('Evicting {} from the cache.'.format(path))
+        shutil.rmtree(path)
+        total_size -= size
+        evicted.append(path)
+    return evicted
@@ -6,10 +6,11 @@ from deepfigures.extraction.datamodels import BoxClass
 from joblib import Parallel, delayed
 import multiprocessing
 
-from typing import List, Tuple, Iterable
+from typing import List, Optional, Tuple, Iterable, Iterator
 
 import cv2  # Need to import OpenCV before tensorflow to avoid import error
 import imageio
+import more_itertools
 import numpy as np
 
 from deepfigures.extraction import (
@@ -21,7 +22,11 @@ from deepfigures.extraction.datamodels import (
     BoxClass,
     Figure,
     PdfDetectionResult,
-    CaptionOnly)
+    CaptionOnly,
+    crop_whitespace_edges_many)
+from deepfigures.extraction.page_triage import (
+    PageTriage,
+    get_default_page_triage)
 from deepfigures import settings
 from deepfigures.utils import (
     file_util,
@@ -29,7 +34,12 @@ from deepfigures.utils import (
 from deepfigures.utils import misc
 
 PAD_FACTOR = 0.02
+# Number of pages held in memory and passed to the detector at a time.
+DETECTION_WINDOW_SIZE = 8
 TENSORBOX_MODEL = settings.TENSORBOX_MODEL
+# Default for extract_figures_json's page_triage, distinct from None
+# which disables page triage.
+DEFAULT_PAGE_TRIAGE = object()
 
 # Holds a cached instantiation of TensorboxCaptionmaskDetector.
 _detector = None
@@ -46,51 +56,116 @@ def get_detector(detector_args=TENSORBOX_MODEL) -> tensorbox_fourchannel.Tensorb
     return _detector
 
 
+def iter_page_detections(
+        page_images: Iterable[np.ndarray],
+        detector: tensorbox_fourchannel.TensorboxCaptionmaskDetector,
+        window_size: int = DETECTION_WINDOW_SIZE,
+        page_triage: Optional[PageTriage] = None
+) -> Iterator[Tuple[int, np.ndarray, List[BoxClass]]]:
+    """Run the detector over page_images a window of pages at a time.
+
+    Only ``window_size`` pages are held in memory at once, so peak
+    memory does not depend on the number of pages in the document, and
+    pages of differing sizes are handled independently.
+
+    :param Iterable[np.ndarray] page_images: the pages to run detection
+      on, in page order.
+    :param TensorboxCaptionmaskDetector detector: the detector to use.
+    :param int window_size: the number of pages passed to the detector
+      at a time.
+    :param Optional[PageTriage] page_triage: if given, pages it considers
+      text only get no figure boxes without going through the detector.
+
+    :yields: tuples of the 0-indexed page number, the page image and
+      the figure boxes detected on that page.
+    """
+    page_num = 0
+    for page_window in more_itertools.chunked(page_images, window_size):
+        if page_triage is None:
+            detect_indices = list(range(len(page_window)))
+        else:
+            detect_indices = [
+                idx for (idx, page_image) in enumerate(page_window)
+                if page_triage.should_detect(page_image)
+            ]
+        figure_boxes_by_page = [[] for _ in page_window]
+        if detect_indices:
+            detected_boxes_by_page = detector.get_detections(
+                [page_window[idx] for idx in detect_indices])
+            for idx, figure_boxes in zip(
+                    detect_indices, detected_boxes_by_page):
+                figure_boxes_by_page[idx] = figure_boxes
+        for page_image, figure_boxes in zip(page_window, figure_boxes_by_page):
+            yield page_num, page_image, figure_boxes
+            page_num += 1
+
+
 def extract_figures_json(
         pdf_path,
         page_image_paths,
         pdffigures_output,
-        output_directory):
+        output_directory,
+        page_images=None,
+        page_triage=DEFAULT_PAGE_TRIAGE):
     """Extract information about figures to JSON and save to disk.
 
+    Pages are read, detected, paired with their captions and cropped a
+    few at a time (see ``iter_page_detections``) rather than loading
+    the whole document into memory.
+
     :param str pdf_path: path to the PDF from which to extract
       figures.
+    :param Optional[List[str]] page_image_paths: paths to the page
+      renderings at the inference dpi. Ignored if ``page_images`` is
+      given.
+    :param dict pdffigures_output: the output of running pdffigures2 on
+      the PDF.
+    :param str output_directory: the directory in which to write the
+      detection results.
+    :param Optional[Iterable[np.ndarray]] page_images: the pages
+      rendered at the inference dpi, e.g. from
+      ``PDFRenderer.render_arrays``. Use this instead of
+      ``page_image_paths`` to avoid reading the pages from disk.
+    :param Optional[PageTriage] page_triage: skips detection on the pages
+      it considers text only, or None to run detection on every page.
+      Defaults to the triage configured by
+      ``settings.PAGE_TRIAGE_RECALL_TARGET``, if any.
 
     :returns: path to the JSON file containing the detection results.
     """
-    page_images_array = np.array([
-        imageio.imread(page_image_path)
-        for page_image_path in page_image_paths
-    ])
+    if page_images is None:
+        page_images = (
+            imageio.imread(page_image_path)
+            for page_image_path in page_image_paths
+        )
+    if page_triage is DEFAULT_PAGE_TRIAGE:
+        page_triage = get_default_page_triage()
     detector = get_detector()
-    figure_boxes_by_page = detector.get_detections(
-        page_images_array)
     pdffigures_captions = pdffigures_wrapper.get_captions(
         pdffigures_output=pdffigures_output,
         target_dpi=settings.DEFAULT_INFERENCE_DPI)
+    figure_boxes_by_page = []
     figures_by_page = []
-    for page_num in range(len(page_image_paths)):
-        figure_boxes = figure_boxes_by_page[page_num]
-        pf_page_captions = [
-            caption
-            for caption in pdffigures_captions
-            if caption.page == page_num
-        ]
-        caption_boxes = [
-            caption.caption_boundary
-            for caption in pf_page_captions
-        ]
+    for page_num, page_image, figure_boxes in iter_page_detections(
+            page_images, detector, page_triage=page_triage):
+        figure_boxes_by_page.append(figure_boxes)
+        pf_page_captions = pdffigures_captions.get_page(page_num)
+        caption_boxes = pdffigures_captions.get_page_boxes(page_num)
         figure_indices, caption_indices = figure_utils.pair_boxes(
             figure_boxes, caption_boxes)
-        page_image = page_images_array[page_num]
         pad_pixels = PAD_FACTOR * min(page_image.shape[:2])
-        for (figure_idx, caption_idx) in zip(figure_indices, caption_indices):
+        figure_boundaries = crop_whitespace_edges_many(
+            [
+                figure_boxes[figure_idx].expand_box(pad_pixels).crop_to_page(
+                    page_image.shape)
+                for figure_idx in figure_indices
+            ],
+            page_image)
+        for (figure_boundary, caption_idx) in zip(
+                figure_boundaries, caption_indices):
             figures_by_page.append(
                 Figure(
-                    figure_boundary=figure_boxes[figure_idx].expand_box(
-                        pad_pixels).crop_to_page(
-                        page_image.shape).crop_whitespace_edges(
-                        page_image),
+                    figure_boundary=figure_boundary,
                     caption_boundary=caption_boxes[caption_idx],
                     caption_text=pf_page_captions[caption_idx].caption_text,
                     name=pf_page_captions[caption_idx].name,
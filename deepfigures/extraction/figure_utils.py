@@ -1,27 +1,26 @@
 import collections
+import concurrent.futures
 import os
+import shutil
 import subprocess
-from typing import Callable, Dict, Iterable, List, Tuple, TypeVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
 
 from matplotlib import axes
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import optimize
+from scipy import ndimage, optimize
 from deepfigures.utils import file_util
 from deepfigures.extraction.renderers import PDFRenderer
 from deepfigures.extraction.exceptions import LatexException
-from deepfigures.extraction.datamodels import (BoxClass, Figure)
+from deepfigures.extraction.datamodels import (BoxArray, BoxClass, Figure)
 from deepfigures.settings import DEFAULT_INFERENCE_DPI
 from deepfigures.settings import PDFLATEX_EXECUTABLE_PATH
 
 
-def call_pdflatex(
-        src_tex: str, src_dir: str, dest_dir: str, timeout: int = 1200
-) -> str:
-    """
-    Call pdflatex on the tex source file src_tex, save its output to dest_dir, and return the path of the
-    resulting pdf.
-    """
+def _run_pdflatex(
+        src_tex: str, src_dir: str, dest_dir: str, timeout: int, draftmode: bool = False
+) -> subprocess.CompletedProcess:
+    """Run a single pdflatex pass over src_tex, writing its output to dest_dir."""
     # Need to be in the same directory as the file to compile it
     file_util.safe_makedirs(dest_dir)
     # Shell-escape required due to https://www.scivision.co/pdflatex-error-epstopdf-output-filename-not-allowed-in-restricted-mode/
@@ -29,52 +28,209 @@ def call_pdflatex(
         PDFLATEX_EXECUTABLE_PATH, '-interaction=nonstopmode', '-shell-escape',
         '-output-directory=' + dest_dir, src_tex
     ]
-    # Run twice so that citations are built correctly
-    # Had some issues getting latexmk to work
+    if draftmode:
+        cmd.insert(1, '-draftmode')
     try:
-        subprocess.run(
-            cmd, stdout=subprocess.PIPE, cwd=src_dir, timeout=timeout
-        )
-        res = subprocess.run(
+        return subprocess.run(
             cmd, stdout=subprocess.PIPE, cwd=src_dir, timeout=timeout
         )
     except subprocess.TimeoutExpired:
         raise LatexException(
             ' '.join(cmd), -1, 'Timeout exception after %d' % timeout
         )
+
+
+def call_pdflatex(
+        src_tex: str, src_dir: str, dest_dir: str, timeout: int = 1200, draft_first_pass: bool = False
+) -> str:
+    """
+    Call pdflatex on the tex source file src_tex, save its output to dest_dir, and return the path of the
+    resulting pdf. If draft_first_pass is set, the first of the two runs uses -draftmode, which resolves references
+    without reading images or writing the pdf.
+    """
+    # Run twice so that citations are built correctly
+    # Had some issues getting latexmk to work
+    _run_pdflatex(src_tex, src_dir, dest_dir, timeout, draftmode=draft_first_pass)
+    res = _run_pdflatex(src_tex, src_dir, dest_dir, timeout)
     if res.returncode != 0:
-        raise LatexException(' '.join(cmd), res.returncode, res.stdout)
+        raise LatexException(' '.join(res.args), res.returncode, res.stdout)
     paperid = os.path.splitext(os.path.basename(src_tex))[0]
     return dest_dir + paperid + '.pdf'
 
 
+def _copy_pdflatex_state(src_dir: str, src_jobname: str, dest_dir: str, dest_jobname: str) -> None:
+    """
+    Copy the aux files a pdflatex pass over src_jobname wrote to src_dir into dest_dir, renaming the ones named after
+    the job, so that a pass over dest_jobname in dest_dir picks them up.
+    """
+    if os.path.exists(dest_dir):
+        shutil.rmtree(dest_dir)
+    shutil.copytree(src_dir, dest_dir, ignore=shutil.ignore_patterns('*.pdf', '*.log'))
+    for name in os.listdir(dest_dir):
+        if name.startswith(src_jobname + '.'):
+            os.rename(os.path.join(dest_dir, name), os.path.join(dest_dir, dest_jobname + name[len(src_jobname):]))
+
+
+def _call_pdflatex_final_pass(
+        src_tex: str, src_dir: str, dest_dir: str, first_pass_dir: str, first_pass_jobname: str, timeout: int
+) -> str:
+    """Run the final pdflatex pass over src_tex from the aux files of a first pass, and move its pdf to dest_dir."""
+    jobname = os.path.splitext(os.path.basename(src_tex))[0]
+    # Each final pass rewrites its aux files, including those of \include'd files which aren't named after the job,
+    # so each gets its own output directory
+    pass_dir = os.path.join(dest_dir, jobname + '-final-pass/')
+    try:
+        _copy_pdflatex_state(first_pass_dir, first_pass_jobname, pass_dir, jobname)
+        res = _run_pdflatex(src_tex, src_dir, pass_dir, timeout)
+        if res.returncode != 0:
+            raise LatexException(' '.join(res.args), res.returncode, res.stdout)
+        pdf = dest_dir + jobname + '.pdf'
+        os.replace(pass_dir + jobname + '.pdf', pdf)
+    finally:
+        shutil.rmtree(pass_dir, ignore_errors=True)
+    return pdf
+
+
+def call_pdflatex_with_shared_first_pass(
+        src_texs: List[str], src_dir: str, dest_dir: str, timeout: int = 1200, draft_first_pass: bool = False
+) -> List[str]:
+    """
+    Call pdflatex on tex source files which only differ in ways that don't change their layout, like the color and
+    black variants generated for each paper, so that their aux files are identical. The first, reference-resolving
+    pass runs once, over src_texs[0], and then the final pass over each source runs concurrently from a copy of its
+    aux files, for len(src_texs) + 1 pdflatex runs instead of 2 * len(src_texs). Returns the paths of the resulting
+    pdfs, in dest_dir, in the same order as src_texs. If any of them fails, the LatexException of the first one to
+    fail in src_texs' order is raised once all of them have finished. The scratch directories the passes run in are
+    removed either way.
+    """
+    first_pass_jobname = os.path.splitext(os.path.basename(src_texs[0]))[0]
+    first_pass_dir = os.path.join(dest_dir, first_pass_jobname + '-first-pass/')
+    if os.path.exists(first_pass_dir):
+        shutil.rmtree(first_pass_dir)
+    try:
+        _run_pdflatex(src_texs[0], src_dir, first_pass_dir, timeout, draftmode=draft_first_pass)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(src_texs)) as executor:
+            futures = [
+                executor.submit(
+                    _call_pdflatex_final_pass,
+                    src_tex=src_tex,
+                    src_dir=src_dir,
+                    dest_dir=dest_dir,
+                    first_pass_dir=first_pass_dir,
+                    first_pass_jobname=first_pass_jobname,
+                    timeout=timeout
+                )
+                for src_tex in src_texs
+            ]
+            concurrent.futures.wait(futures)
+    finally:
+        # every final pass has copied the first pass's state by now
+        shutil.rmtree(first_pass_dir, ignore_errors=True)
+    return [future.result() for future in futures]
+
+
 def im_diff(a: np.ndarray, b: np.ndarray) -> np.ndarray:
     """Returns a copy of image 'a' with all pixels where 'a' and 'b' are equal set to white."""
     assert (np.array_equal(np.shape(a), np.shape(b)))
-    diff = a - b
-    mask = np.any(diff != 0, axis=2)  # Check if any channel is different
-    rgb_mask = np.transpose(np.tile(mask, (3, 1, 1)), axes=[1, 2, 0])
-    diff_image = np.copy(a)
-    diff_image[np.logical_not(rgb_mask)] = 255
+    # Check if any channel is different, one channel at a time since reducing
+    # over the interleaved channel axis is slow
+    changed = a[:, :, 0] != b[:, :, 0]
+    for channel in range(1, a.shape[2]):
+        changed |= a[:, :, channel] != b[:, :, channel]
+    # Most pixels are unchanged, so start from white and copy over the rest
+    diff_image = np.full_like(a, 255)
+    diff_image[changed] = a[changed]
     return diff_image
 
 
-def pair_boxes(a_boxes: List[BoxClass],
-               b_boxes: List[BoxClass]) -> Tuple[List[int], List[int]]:
+def get_channelwise_color_masks(im: np.ndarray, color_groups: List[List[List[int]]]) -> List[np.ndarray]:
+    """
+    Return, for each group of colors, the mask of the pixels of the uint8 image im whose every channel is equal to
+    that channel of one of the group's colors, i.e. np.logical_or(im == a, im == b, ...).all(axis=2).
+    All the masks are computed together, with a single lookup per channel.
+    :param im: a (height, width, channels) uint8 image.
+    :param color_groups: up to 8 lists of colors.
+    :return: a boolean (height, width) mask for each group.
+    """
+    assert len(color_groups) <= 8
+    n_channels = im.shape[2]
+    # bit i of luts[c][v] is set if some color of group i has value v in channel c
+    luts = np.zeros((n_channels, 256), dtype=np.uint8)
+    for group_idx, colors in enumerate(color_groups):
+        for color in colors:
+            for channel, value in enumerate(color):
+                luts[channel, value] |= 1 << group_idx
+    matches = luts[0][im[:, :, 0]]
+    for channel in range(1, n_channels):
+        matches &= luts[channel][im[:, :, channel]]
+    return [(matches & (1 << group_idx)) != 0 for group_idx in range(len(color_groups))]
+
+
+def find_box_components(
+        box_mask: np.ndarray,
+        caption_mask: np.ndarray
+) -> List[Tuple[BoxClass, Optional[BoxClass], Tuple[int, int]]]:
+    """
+    Find the bounding box of each 8-connected region of box_mask and of the caption_mask pixels inside it.
+    The regions are labeled once and find_objects gives all their bounding slices in a single pass over the page. The
+    caption pixels inside each box are then found with prefix sums of caption_mask along its rows and columns, so
+    each box costs time proportional to its perimeter rather than to the page.
+    :param box_mask: a boolean (height, width) mask of the figure and table box outlines.
+    :param caption_mask: a boolean (height, width) mask of the caption pixels.
+    :return: for each region, in the order skimage.measure.label numbers them (by their first pixel in row major
+    order): its bounding box, the bounding box of the caption pixels inside it (None if there are none) and the
+    (row, column) of its first pixel.
+    """
+    (labels, _) = ndimage.label(box_mask, structure=np.ones((3, 3), dtype=bool))
+    (height, width) = caption_mask.shape
+    # row_sums[y, x] counts the caption pixels in row y left of x
+    row_sums = np.zeros((height, width + 1), dtype=np.int32)
+    np.cumsum(caption_mask, axis=1, out=row_sums[:, 1:])
+    # col_sums[y, x] counts the caption pixels in column x above y
+    col_sums = np.zeros((height + 1, width), dtype=np.int32)
+    np.cumsum(caption_mask, axis=0, out=col_sums[1:])
+    components = []
+    for label, (y_slice, x_slice) in enumerate(ndimage.find_objects(labels), start=1):
+        (y1, y2, x1, x2) = (y_slice.start, y_slice.stop, x_slice.start, x_slice.stop)
+        full_box = BoxClass(x1=float(x1), y1=float(y1), x2=float(x2), y2=float(y2))
+        first_pixel = (y1, x1 + int(np.argmax(labels[y1, x1:x2] == label)))
+        caption_rows = np.flatnonzero(row_sums[y1:y2, x2] - row_sums[y1:y2, x1])
+        if len(caption_rows) == 0:
+            components.append((full_box, None, first_pixel))
+            continue
+        caption_columns = np.flatnonzero(col_sums[y2, x1:x2] - col_sums[y1, x1:x2])
+        caption_box = BoxClass(
+            x1=float(x1 + caption_columns[0]),
+            y1=float(y1 + caption_rows[0]),
+            x2=float(x1 + caption_columns[-1] + 1),
+            y2=float(y1 + caption_rows[-1] + 1))
+        components.append((full_box, caption_box, first_pixel))
+    return components
+
+
+def pair_boxes(a_boxes: Union[List[BoxClass], BoxArray],
+               b_boxes: Union[List[BoxClass], BoxArray]) -> Tuple[List[int], List[int]]:
     """
     Find the pairing between boxes with the lowest total distance, e.g. for matching figures to their captions.
     This is an instance of the linear assignment problem and can be solved efficiently using the Hungarian algorithm.
     Return the indices of matched boxes. If a_boxes and b_boxes are of unequal length, not all boxes will be paired.
     Length of returned lists is min(len(a_boxes), len(b_boxes)).
     """
+    if not isinstance(a_boxes, BoxArray):
+        a_boxes = BoxArray.from_boxes(a_boxes)
+    if not isinstance(b_boxes, BoxArray):
+        b_boxes = BoxArray.from_boxes(b_boxes)
     a_len = len(a_boxes)
     b_len = len(b_boxes)
-    cost_matrix = np.zeros([a_len, b_len])
-    cost_matrix[:] = np.nan
-    for (a_idx, a_box) in enumerate(a_boxes):
-        for (b_idx, b_box) in enumerate(b_boxes):
-            cost_matrix[a_idx, b_idx] = a_box.distance_to_other(b_box)
-    assert (cost_matrix != np.nan).all()
+    if a_len == 0 or b_len == 0:
+        return np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+    cost_matrix = a_boxes.distance_matrix(b_boxes)
+    # with a single box on either side the assignment is just the closest
+    # box, with ties going to the lowest index as in linear_sum_assignment.
+    if a_len == 1:
+        return np.array([0]), np.array([np.argmin(cost_matrix[0])])
+    if b_len == 1:
+        return np.array([np.argmin(cost_matrix[:, 0])]), np.array([0])
     (a_indices, b_indices) = optimize.linear_sum_assignment(cost_matrix)
     assert len(a_indices) == len(b_indices)
     return a_indices, b_indices
@@ -0,0 +1,172 @@
+"""Cheap page statistics for skipping detection on text only pages.
+
+Most pages of a thesis or dissertation are plain text, and running the
+detection network on them is the most expensive part of extraction.
+The statistics here are computed on a small copy of each page and
+summarized into a score, the share of the page that looks like
+something other than text. Pages scoring below a threshold calibrated
+on the gold standard (see scripts/page_triage_benchmark.py) are assumed
+to have no figures.
+"""
+
+import math
+from typing import List, Optional
+
+import cv2
+import numpy as np
+import traitlets
+
+from deepfigures import settings
+from deepfigures.utils import file_util
+from deepfigures.utils.config import JsonSerializable
+
+
+# the width pages are shrunk to before computing their statistics
+TRIAGE_PAGE_WIDTH = 425
+# gray levels below this (on the shrunk page) count as ink
+INK_THRESHOLD = 200
+# connected ink regions taller than this fraction of the page height are
+# larger than any line of text
+MAX_TEXT_HEIGHT = 0.03
+# pixels whose channels differ by more than this are colored
+COLOR_THRESHOLD = 48
+
+
+class PageStatistics(JsonSerializable):
+    """Statistics of a page that tell text only pages from the others.
+
+    All the statistics are fractions of the shrunk page's area.
+    """
+    ink_density = traitlets.Float()
+    large_component_ink = traitlets.Float()
+    nontext_area = traitlets.Float()
+    color_area = traitlets.Float()
+
+    def get_score(self) -> float:
+        """Return the share of the page that doesn't look like text."""
+        return max(self.nontext_area, self.color_area)
+
+
+def get_page_statistics(page_image: np.ndarray) -> PageStatistics:
+    """Compute the triage statistics of a page image.
+
+    The page is shrunk to TRIAGE_PAGE_WIDTH pixels wide and binarized,
+    so text becomes short blobs, one per word or line, while figures,
+    tables and photos become connected regions taller than any line of
+    text.
+
+    Parameters
+    ----------
+    page_image : np.ndarray
+        The page, as a (height, width) grayscale or (height, width,
+        channels) RGB(A) image.
+
+    Returns
+    -------
+    PageStatistics
+        The page's statistics.
+    """
+    (height, width) = page_image.shape[:2]
+    scale = min(TRIAGE_PAGE_WIDTH / width, 1.)
+    small_size = (
+        max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    small_page = cv2.resize(
+        page_image if page_image.ndim == 2 else page_image[:, :, :3],
+        small_size, interpolation=cv2.INTER_AREA)
+    if small_page.ndim == 2:
+        gray = small_page
+        color_area = 0.
+    else:
+        gray = cv2.cvtColor(small_page, cv2.COLOR_RGB2GRAY)
+        (red, green, blue) = cv2.split(small_page)
+        channel_range = cv2.subtract(
+            cv2.max(cv2.max(red, green), blue),
+            cv2.min(cv2.min(red, green), blue))
+        color_area = cv2.countNonZero(
+            (channel_range > COLOR_THRESHOLD).view(np.uint8)
+        ) / channel_range.size
+    is_ink = (gray < INK_THRESHOLD).astype(np.uint8)
+    n_ink = int(is_ink.sum())
+    page_area = is_ink.size
+    if n_ink == 0:
+        return PageStatistics(
+            ink_density=0., large_component_ink=0., nontext_area=0.,
+            color_area=color_area)
+    (_, _, stats, _) = cv2.connectedComponentsWithStats(
+        is_ink, connectivity=8)
+    # drop the background component
+    stats = stats[1:]
+    is_large = stats[:, cv2.CC_STAT_HEIGHT] > MAX_TEXT_HEIGHT * gray.shape[0]
+    large_boxes = stats[is_large]
+    return PageStatistics(
+        ink_density=n_ink / page_area,
+        large_component_ink=float(
+            large_boxes[:, cv2.CC_STAT_AREA].sum()) / page_area,
+        nontext_area=float(np.sum(
+            large_boxes[:, cv2.CC_STAT_WIDTH] *
+            large_boxes[:, cv2.CC_STAT_HEIGHT])) / page_area,
+        color_area=color_area)
+
+
+def get_threshold_for_recall(
+        figure_page_scores: List[float],
+        recall_target: float) -> float:
+    """Return the highest score threshold that keeps recall_target.
+
+    Parameters
+    ----------
+    figure_page_scores : List[float]
+        The score of the page of each figure in a labeled dataset.
+    recall_target : float
+        The fraction of those figures whose pages must score at or above
+        the threshold.
+
+    Returns
+    -------
+    float
+        The threshold, 0. if there are no figures.
+    """
+    if not 0. <= recall_target <= 1.:
+        raise ValueError(
+            'recall_target must be between 0 and 1, got %s' % recall_target)
+    if len(figure_page_scores) == 0:
+        return 0.
+    n_kept = max(math.ceil(recall_target * len(figure_page_scores)), 1)
+    return sorted(figure_page_scores, reverse=True)[n_kept - 1]
+
+
+class PageTriage(object):
+    """Decide which pages need to go through figure detection."""
+
+    def __init__(self, threshold: float) -> None:
+        """
+        Parameters
+        ----------
+        threshold : float
+            Pages scoring below this are assumed to be text only.
+        """
+        self.threshold = threshold
+
+    @classmethod
+    def from_calibration(
+            cls,
+            calibration_path: str,
+            recall_target: float) -> 'PageTriage':
+        """Load the figure page scores written by the benchmark and keep
+        recall_target of those figures."""
+        calibration = file_util.read_json(calibration_path)
+        return cls(threshold=get_threshold_for_recall(
+            calibration['figure_page_scores'], recall_target))
+
+    def should_detect(self, page_image: np.ndarray) -> bool:
+        """Return whether page_image may contain figures."""
+        return get_page_statistics(page_image).get_score() >= self.threshold
+
+
+def get_default_page_triage() -> Optional[PageTriage]:
+    """Return the triage configured in settings, or None if disabled."""
+    if settings.PAGE_TRIAGE_RECALL_TARGET is None:
+        return None
+    return PageTriage.from_calibration(
+        settings.PAGE_TRIAGE_CALIBRATION_PATH,
+        settings.PAGE_TRIAGE_RECALL_TARGET)
@@ -1,6 +1,8 @@
 import os
+import shutil
 import subprocess
-from typing import List, Optional, Iterable
+from collections.abc import Sequence
+from typing import Dict, List, Optional, Iterable
 import tempfile
 from deepfigures.utils import file_util
 from deepfigures.extraction import datamodels
@@ -28,44 +30,131 @@ class PDFFiguresExtractor(object):
 
         :returns: results from running pdffigures2 on the PDF.
         """
-        pdffigures_dir = os.path.join(output_dir, 'pdffigures/')
-        if not os.path.exists(pdffigures_dir):
-            os.makedirs(pdffigures_dir)
+        pdffigures_dir = self._get_pdffigures_dir(output_dir)
 
         success_file_path = os.path.join(pdffigures_dir, '_SUCCESS')
 
-        pdffigures_jar_path = file_util.cache_file(
-            settings.PDFFIGURES_JAR_PATH)
-
         if not os.path.exists(success_file_path) or not use_cache:
             subprocess.check_call(
-                'java'
-                ' -jar {pdffigures_jar_path}'
-                ' --figure-data-prefix {pdffigures_dir}'
-                ' --save-regionless-captions'
-                ' {pdf_path}'.format(
-                    pdffigures_jar_path=pdffigures_jar_path,
-                    pdf_path=pdf_path,
-                    pdffigures_dir=pdffigures_dir),
-                shell=True)
+                self._get_command(
+                    input_path=pdf_path,
+                    figure_data_prefix=pdffigures_dir))
 
             # add a success file to verify that the operation completed
             with open(success_file_path, 'w') as f_out:
                 f_out.write('')
 
         return file_util.read_json(
-            os.path.join(
-                pdffigures_dir,
-                os.path.basename(pdf_path)[:-4] + '.json'))
+            self._get_output_path(pdf_path, pdffigures_dir))
+
+    def extract_batch(self, pdf_paths, output_dirs, use_cache=True):
+        """Return results from extracting several PDFs with one JVM.
+
+        pdffigures2 is run once over a directory of links to all the
+        PDFs that aren't already cached, and its per-PDF outputs are
+        then moved into each PDF's output directory, so the results and
+        cache are laid out exactly as if ``extract`` had been called on
+        each PDF. Any PDF that pdffigures2 fails to produce output for
+        in the batch is retried on its own with ``extract``.
+
+        :param List[str] pdf_paths: paths to the PDFs to extract.
+        :param List[str] output_dirs: path to the output directory for
+          each PDF in ``pdf_paths``.
+        :param bool use_cache: whether or not to use cached data from
+          disk if it's available.
+
+        :returns: the results from running pdffigures2 on each PDF, in
+          the same order as ``pdf_paths``.
+        """
+        assert len(pdf_paths) == len(output_dirs)
+        uncached = [
+            (idx, pdf_path, self._get_pdffigures_dir(output_dir))
+            for idx, (pdf_path, output_dir) in enumerate(
+                zip(pdf_paths, output_dirs))
+            if not use_cache or not os.path.exists(os.path.join(
+                self._get_pdffigures_dir(output_dir), '_SUCCESS'))
+        ]
+        if len(uncached) > 1:
+            for _, _, pdffigures_dir in uncached:
+                success_file_path = os.path.join(pdffigures_dir, '_SUCCESS')
+                if os.path.exists(success_file_path):
+                    os.remove(success_file_path)
+            with tempfile.TemporaryDirectory(
+                    prefix='deepfigures-pdffigures') as tmp_dir:
+                input_dir = os.path.join(tmp_dir, 'input')
+                output_prefix = os.path.join(tmp_dir, 'output') + '/'
+                os.makedirs(input_dir)
+                os.makedirs(output_prefix)
+                # link each PDF under a unique name so that PDFs with
+                # the same file name don't collide.
+                for idx, pdf_path, _ in uncached:
+                    os.symlink(
+                        os.path.abspath(pdf_path),
+                        os.path.join(input_dir, '{:06d}.pdf'.format(idx)))
+                subprocess.call(
+                    self._get_command(
+                        input_path=input_dir,
+                        figure_data_prefix=output_prefix))
+                for idx, pdf_path, pdffigures_dir in uncached:
+                    batch_output_path = self._get_output_path(
+                        '{:06d}.pdf'.format(idx), output_prefix)
+                    if not os.path.exists(batch_output_path):
+                        logging.warning(
+                            'pdffigures2 produced no output for %s in'
+                            ' batch mode.' % pdf_path)
+                        continue
+                    shutil.move(
+                        batch_output_path,
+                        self._get_output_path(pdf_path, pdffigures_dir))
+                    # add a success file to verify that the operation
+                    # completed
+                    with open(os.path.join(pdffigures_dir, '_SUCCESS'), 'w') as f_out:
+                        f_out.write('')
+            # the batch has populated the cache, so only PDFs that
+            # failed in the batch are extracted again below.
+            use_cache = True
+        return [
+            self.extract(pdf_path, output_dir, use_cache=use_cache)
+            for pdf_path, output_dir in zip(pdf_paths, output_dirs)
+        ]
+
+    def _get_pdffigures_dir(self, output_dir):
+        """Return the pdffigures directory in ``output_dir``, creating it."""
+        pdffigures_dir = os.path.join(output_dir, 'pdffigures/')
+        if not os.path.exists(pdffigures_dir):
+            os.makedirs(pdffigures_dir)
+        return pdffigures_dir
+
+    def _get_output_path(self, pdf_path, figure_data_prefix):
+        """Return the path pdffigures2 writes the output for a PDF to."""
+        return os.path.join(
+            figure_data_prefix,
+            os.path.basename(pdf_path)[:-4] + '.json')
+
+    def _get_command(self, input_path, figure_data_prefix):
+        """Return the command running pdffigures2 on ``input_path``.
+
+        :param str input_path: path to a PDF or to a directory of PDFs.
+        :param str figure_data_prefix: the prefix for the output paths.
+        """
+        pdffigures_jar_path = file_util.cache_file(
+            settings.PDFFIGURES_JAR_PATH)
+        return [
+            'java',
+            '-jar', pdffigures_jar_path,
+            '--figure-data-prefix', figure_data_prefix,
+            '--save-regionless-captions',
+            input_path
+        ]
 
 
 pdffigures_extractor = PDFFiguresExtractor()
 
 
-def figure_to_caption(figure: dict) -> datamodels.CaptionOnly:
+def figure_to_caption(figure: dict, ratio: float = 1.) -> datamodels.CaptionOnly:
     return datamodels.CaptionOnly(
         caption_boundary=datamodels.BoxClass.
-        from_dict(figure['captionBoundary']),
+        from_dict(figure['captionBoundary']).rescale(ratio),
         page=figure['page'],
         caption_text=figure['caption'],
         name=figure['name'],
@@ -73,9 +162,10 @@ def figure_to_caption(figure: dict) -> datamodels.CaptionOnly:
     )
 
 
-def regionless_to_caption(regionless: dict) -> datamodels.CaptionOnly:
+def regionless_to_caption(regionless: dict, ratio: float = 1.) -> datamodels.CaptionOnly:
     return datamodels.CaptionOnly(
-        caption_boundary=datamodels.BoxClass.from_dict(regionless['boundary']),
+        caption_boundary=datamodels.BoxClass.from_dict(
+            regionless['boundary']).rescale(ratio),
         page=regionless['page'],
         caption_text=regionless['text'],
         name=regionless['name'],
@@ -83,20 +173,57 @@ def regionless_to_caption(regionless: dict) -> datamodels.CaptionOnly:
     )
 
 
+class PageCaptions(Sequence):
+    """The captions of a document, indexed by page.
+
+    Behaves as the read-only flat list of all the captions, in the
+    order pdffigures2 gave them, while get_page and get_page_boxes look
+    up a single page's captions without scanning the others.
+    """
+
+    def __init__(self, captions: Iterable[datamodels.CaptionOnly]) -> None:
+        self._captions = list(captions)
+        self._captions_by_page = {}  # type: Dict[int, List[datamodels.CaptionOnly]]
+        for caption in self._captions:
+            self._captions_by_page.setdefault(caption.page, []).append(caption)
+        self._boxes_by_page = {
+            page: [caption.caption_boundary for caption in page_captions]
+            for page, page_captions in self._captions_by_page.items()
+        }
+
+    def __getitem__(self, idx):
+        return self._captions[idx]
+
+    def __len__(self) -> int:
+        return len(self._captions)
+
+    def __repr__(self) -> str:
+        return 'PageCaptions(%r)' % self._captions
+
+    def get_page(self, page: int) -> List[datamodels.CaptionOnly]:
+        """Return the captions on page (0-indexed), in order."""
+        return self._captions_by_page.get(page, [])
+
+    def get_page_boxes(self, page: int) -> List[datamodels.BoxClass]:
+        """Return the boundaries of the captions on page, in order."""
+        return self._boxes_by_page.get(page, [])
+
+
 def get_captions(
     pdffigures_output: dict, target_dpi: int=settings.DEFAULT_INFERENCE_DPI
-) -> List[datamodels.CaptionOnly]:
+) -> PageCaptions:
+    """Return the captions found by pdffigures2, indexed by page.
+
+    The caption boundaries are scaled from pdffigures2's dpi to
+    target_dpi as the captions are built.
+    """
+    ratio = target_dpi / PDFFIGURES_DPI
     figures = pdffigures_output.get('figures', [])
     regionless_captions = pdffigures_output.get('regionless-captions', [])
-    captions = (
-        [figure_to_caption(fig) for fig in figures] +
-        [regionless_to_caption(reg) for reg in regionless_captions]
+    return PageCaptions(
+        [figure_to_caption(fig, ratio) for fig in figures] +
+        [regionless_to_caption(reg, ratio) for reg in regionless_captions]
     )
-    for caption in captions:
-        caption.caption_boundary = caption.caption_boundary.rescale(
-            target_dpi / PDFFIGURES_DPI
-        )
-    return captions
 
 
 def get_figures(pdffigures_output: dict, target_dpi: int=settings.DEFAULT_INFERENCE_DPI
@@ -107,13 +234,11 @@ def get_figures(pdffigures_output: dict, target_dpi: int=settings.DEFAULT_INFERE
     ]
 
 
-def detect_batch(src_pdfs: List[str], target_dpi: int = settings.DEFAULT_INFERENCE_DPI, chunksize=1) -> \
-        Iterable[datamodels.PdfDetectionResult]:
+def detect_batch(src_pdfs: List[str], target_dpi: int = settings.DEFAULT_INFERENCE_DPI,
+                 chunksize=settings.PDFFIGURES_BATCH_SIZE) -> Iterable[datamodels.PdfDetectionResult]:
     for chunk in more_itertools.chunked(src_pdfs, chunksize):
-        results = [
-            pdffigures_extractor.extract(pdf_path, os.path.dirname(pdf_path))
-            for pdf_path in chunk
-        ]
+        results = pdffigures_extractor.extract_batch(
+            chunk, [os.path.dirname(pdf_path) for pdf_path in chunk])
         for (result, pdf) in zip(results, chunk):
             figs = get_figures(result, target_dpi=target_dpi)
             yield datamodels.PdfDetectionResult(
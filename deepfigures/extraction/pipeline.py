@@ -6,22 +6,35 @@ location, rendering a PDF, finding captions for figures, detecting the
 figures and cropping out the images.
 """
 
+import collections
+import concurrent.futures
+import glob
 import hashlib
+import json
+import logging
 import os
 import shutil
+import time
 
+import more_itertools
 from PIL import Image
 
 from deepfigures import settings
 from deepfigures.extraction import (
+    cache,
     detection,
     pdffigures_wrapper,
     renderers)
+from deepfigures.extraction.datamodels import BoxClass
 from deepfigures.utils import (
+    file_util,
     misc,
     settings_utils)
 
 
+logger = logging.getLogger(__name__)
+
+
 class FigureExtraction(object):
     """A class representing the data extracted from a PDF.
 
@@ -30,7 +43,13 @@ class FigureExtraction(object):
     the ``FigureExtractionPipeline`` class.
 
     The data stored for a ``FigureExtraction`` instance sits on disk
-    in a directory. See `Attributes`_ for more information.
+    in a directory named after the SHA1 hash of the PDF, so the same
+    PDF always maps to the same directory. Renderings and pdffigures2
+    output only depend on the PDF and the renderer, while detection
+    results and figure images are stored under a subdirectory named
+    after the result key (see ``cache.get_result_key``) so that results
+    from different models or settings never collide. See `Attributes`_
+    for more information.
 
     Attributes
     ----------
@@ -48,11 +67,21 @@ class FigureExtraction(object):
         predicting the bounding boxes).
     hi_res_rendering_paths : Optional[str]
         Paths to the high resolution renderings of the PDF (used for
-        cropping out the figure images).
+        cropping out the figure images). ``extract`` only renders the
+        pages containing figures at high resolution and doesn't save
+        them, so it leaves this as ``None``.
     pdffigures_output_path : Optional[str]
         Path to the output of running pdffigures2 on the PDF.
     deepfigures_json_path : Optional[str]
         Path to the deepfigures JSON predicting the bounding boxes.
+    figure_image_paths : Optional[List[str]]
+        Paths to the images of the figures cropped out of the PDF.
+    stage_timings : Optional[Dict[str, float]]
+        The wall clock time in seconds taken by each stage of the
+        pipeline, keyed by stage name.
+    from_cache : bool
+        ``True`` if the detection results were found in the cache
+        rather than computed.
     """
 
     """Templates for paths to the data extracted from a PDF."""
@@ -61,11 +90,11 @@ class FigureExtraction(object):
         'PDF_PATH': '{base}/{pdf_name}',
         'RENDERINGS_PATH': '{base}/page-renderings',
         'PDFFIGURES_OUTPUT_PATH': '{base}/pdffigures-output',
-        'DEEPFIGURES_OUTPUT_PATH': '{base}/deepfigures-output',
-        'FIGURE_IMAGES_PATH': '{base}/figure-images'
+        'DEEPFIGURES_OUTPUT_PATH': '{base}/deepfigures-output/{result_key}',
+        'FIGURE_IMAGES_PATH': '{base}/deepfigures-output/{result_key}/figure-images'
     }
 
-    def __init__(self, pdf_path, parent_directory):
+    def __init__(self, pdf_path, parent_directory, result_key=None):
         """Initialize a ``FigureExtraction`` instance.
 
         Parameters
@@ -75,15 +104,21 @@ class FigureExtraction(object):
         parent_directory : str
             The parent directory for the directory in which the figure
             extraction results will be stored.
+        result_key : Optional[str]
+            The key identifying the model and settings used for
+            detection. Defaults to the key for the current settings.
         """
         # compute strings to fill in the path templates
         pdf_hash = misc.hash_out_of_core(hashlib.sha1, pdf_path)
         pdf_name = os.path.basename(pdf_path)
         base = self.path_templates['BASE'].format(pdf_hash=pdf_hash)
+        if result_key is None:
+            result_key = cache.get_result_key()
         template_vars = {
             'pdf_hash': pdf_hash,
             'pdf_name': pdf_name,
-            'base': base
+            'base': base,
+            'result_key': result_key
         }
         # set the paths attribute
         self.paths = {
@@ -95,6 +130,212 @@ class FigureExtraction(object):
         self.hi_res_rendering_paths = None
         self.pdf_figures_output_path = None
         self.deepfigures_json_path = None
+        self.figure_image_paths = None
+        self.stage_timings = None
+        self.from_cache = False
+
+
+class PipelineStage(object):
+    """A single stage of the figure extraction pipeline.
+
+    Attributes
+    ----------
+    name : str
+        The name of the stage, which must be a valid python identifier.
+    func : Callable
+        The function to run for the stage. ``func`` is called with the
+        result of each of its dependencies passed as a keyword argument
+        named after that dependency.
+    dependencies : List[str]
+        The names of the stages that must finish before this stage
+        starts.
+    """
+
+    def __init__(self, name, func, dependencies=()):
+        """Initialize a ``PipelineStage`` instance.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        func : Callable
+            The function to run for the stage.
+        dependencies : Iterable[str]
+            The names of the stages this stage depends on.
+        """
+        self.name = name
+        self.func = func
+        self.dependencies = list(dependencies)
+
+
+def _run_timed(func, kwargs):
+    """Return the result of ``func(**kwargs)`` and its run time."""
+    start_time = time.time()
+    result = func(**kwargs)
+    return result, time.time() - start_time
+
+
+def run_stages(stages):
+    """Run ``stages`` concurrently, respecting their dependencies.
+
+    Every stage starts as soon as all of its dependencies have
+    finished. Stages run on threads, which suits the pipeline's stages
+    since they spend most of their time in subprocesses (ghostscript,
+    pdffigures2) or in tensorflow, both of which release the GIL.
+
+    Parameters
+    ----------
+    stages : List[PipelineStage]
+        The stages to run.
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], Dict[str, float]]
+        A dictionary mapping each stage's name to its result and a
+        dictionary mapping each stage's name to the wall clock time in
+        seconds it took to run.
+    """
+    pending = collections.OrderedDict(
+        (stage.name, stage) for stage in stages)
+    if len(pending) != len(stages):
+        raise ValueError("Stage names must be unique.")
+    for stage in stages:
+        for dependency in stage.dependencies:
+            if dependency not in pending:
+                raise ValueError(
+                    "Stage {} depends on unknown stage {}.".format(
+                        stage.name, dependency))
+
+    results = {}
+    timings = {}
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(stages), 1)) as executor:
+        while pending or running:
+            ready = [
+                stage for stage in pending.values()
+                if all(dependency in results
+                       for dependency in stage.dependencies)
+            ]
+            for stage in ready:
+                del pending[stage.name]
+                future = executor.submit(
+                    _run_timed,
+                    stage.func,
+                    {
+                        dependency: results[dependency]
+                        for dependency in stage.dependencies
+                    })
+                running[future] = stage.name
+            if not running:
+                raise ValueError(
+                    "Stages {} have circular dependencies.".format(
+                        ', '.join(pending.keys())))
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], timings[name] = future.result()
+                logger.info(
+                    'Stage {} finished in {:.2f}s.'.format(name, timings[name]))
+    return results, timings
+
+
+def _copy_pdf(pdf_path, figure_extraction):
+    """Copy the PDF into its extraction results directory.
+
+    The copy is skipped if the results directory already holds a copy
+    of the PDF, e.g. from an earlier run or from ``extract_batch``.
+    Results directories are named after the PDF's hash, so a file of
+    the same size is a complete copy of the same PDF.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The path to the PDF.
+    figure_extraction : FigureExtraction
+        The ``FigureExtraction`` instance for the PDF.
+    """
+    copy_path = figure_extraction.paths['PDF_PATH']
+    if (os.path.exists(copy_path)
+            and os.path.getsize(copy_path) == os.path.getsize(pdf_path)):
+        return
+    os.makedirs(figure_extraction.paths['BASE'], exist_ok=True)
+    shutil.copy(pdf_path, copy_path)
+
+
+def crop_figure_images(
+        pdf_path,
+        deepfigures_json_path,
+        pdf_renderer,
+        output_directory,
+        dpi=settings.DEFAULT_CROPPED_IMG_DPI):
+    """Crop the figures in ``deepfigures_json_path`` and save them.
+
+    Only the pages containing figures are rendered, at ``dpi``, and
+    each figure boundary is rescaled from the dpi of the detection
+    results before cropping. The ``uri`` of every figure in the JSON is
+    set to the path of its image.
+
+    Parameters
+    ----------
+    pdf_path : str
+        The path to the PDF.
+    deepfigures_json_path : str
+        The path to the deepfigures JSON detection results for the PDF.
+    pdf_renderer : renderers.PDFRenderer
+        The renderer to use for rendering the pages.
+    output_directory : str
+        The directory in which to save the figure images.
+    dpi : int
+        The dpi at which to crop the figures.
+
+    Returns
+    -------
+    List[str]
+        The paths to the figure images, in the order of the figures in
+        the JSON.
+    """
+    with open(deepfigures_json_path, 'r') as f_in:
+        pdf_detection_result = json.load(f_in)
+    figures = pdf_detection_result['figures']
+    scale = dpi / pdf_detection_result['dpi']
+
+    os.makedirs(output_directory, exist_ok=True)
+    pdf_stem = os.path.basename(pdf_path)[:-4]
+    figures_by_page = collections.defaultdict(list)
+    for figure in figures:
+        figures_by_page[figure['page']].append(figure)
+
+    # figure pages are 0-indexed while renderer pages are 1-indexed
+    page_arrays = pdf_renderer.render_pages_arrays(
+        pdf_path=pdf_path,
+        page_nums=[page + 1 for page in figures_by_page],
+        dpi=dpi)
+    for page_num, page_array in page_arrays:
+        for figure_idx, figure in enumerate(figures_by_page[page_num - 1]):
+            figure_box = BoxClass.from_dict(
+                figure['figure_boundary']).rescale(scale).crop_to_page(
+                page_array.shape)
+            figure_image = figure_box.crop_image(page_array)
+            if figure_image.size == 0:
+                continue
+            figure_image_path = os.path.join(
+                output_directory,
+                '{pdf_stem}-page{page_num:04d}-figure{figure_idx:02d}.png'
+                .format(
+                    pdf_stem=pdf_stem,
+                    page_num=page_num,
+                    figure_idx=figure_idx))
+            Image.fromarray(figure_image).save(figure_image_path)
+            figure['uri'] = figure_image_path
+
+    file_util.write_json_atomic(
+        deepfigures_json_path,
+        pdf_detection_result,
+        indent=2,
+        sort_keys=True)
+    return [figure['uri'] for figure in figures if figure.get('uri')]
 
 
 class FigureExtractionPipeline(object):
@@ -107,14 +348,36 @@ class FigureExtractionPipeline(object):
 
     See the ``FigureExtraction`` class's doc string for details on
     the format that this extracted data takes.
+
+    The output directory doubles as a cache: extracting a PDF whose
+    results are already on disk for the current model and settings
+    returns them immediately, and when only the model has changed the
+    cached renderings and pdffigures2 output are reused. If
+    ``cache_max_size`` is set, the least recently used results are
+    evicted once the output directory grows beyond that many bytes.
+    Eviction assumes no other process is writing to the same output
+    directory.
     """
 
-    def extract(self, pdf_path, output_directory):
+    def __init__(self, cache_max_size=settings.EXTRACTION_CACHE_MAX_SIZE):
+        """Initialize a ``FigureExtractionPipeline`` instance.
+
+        Parameters
+        ----------
+        cache_max_size : Optional[int]
+            The maximum size in bytes of the output directory, or
+            ``None`` to never evict results.
+        """
+        self.cache_max_size = cache_max_size
+
+    def extract(self, pdf_path, output_directory, write_page_images=True):
         """Return a ``FigureExtraction`` instance for ``pdf_path``.
 
         Extract the figures and additional information from the PDF at
         ``pdf_path``, saving the results to disk in ``output_directory``
         and returning the corresponding ``FigureExtraction`` instance.
+        If the results are already cached in ``output_directory`` they
+        are returned without running any of the pipeline.
 
         Parameters
         ----------
@@ -122,51 +385,247 @@ class FigureExtractionPipeline(object):
             The path to the PDF.
         output_directory : str
             The directory in which to save the results from extraction.
+        write_page_images : bool
+            If ``True``, save the page renderings to disk. Otherwise,
+            stream the pages straight from the renderer into detection
+            without writing or reading any page images.
 
         Returns
         -------
         FigureExtraction
             A ``FigureExtraction`` instance for the PDF at ``pdf_path``.
         """
-        figure_extraction = FigureExtraction(
+        figure_extraction = self._extract(
             pdf_path=pdf_path,
-            parent_directory=output_directory)
+            output_directory=output_directory,
+            write_page_images=write_page_images)
+        self._evict(
+            output_directory=output_directory,
+            keep=[figure_extraction.paths['BASE']])
+        return figure_extraction
+
+    def _extract(
+            self,
+            pdf_path,
+            output_directory,
+            write_page_images,
+            figure_extraction=None):
+        """Run ``extract`` without evicting anything from the cache.
+
+        ``figure_extraction`` may be given if it was already built for
+        ``pdf_path``, to avoid hashing the PDF again.
+        """
+        if figure_extraction is None:
+            figure_extraction = FigureExtraction(
+                pdf_path=pdf_path,
+                parent_directory=output_directory)
 
         # create the extraction results directory
-        os.makedirs(figure_extraction.paths['BASE'])
+        os.makedirs(figure_extraction.paths['BASE'], exist_ok=True)
+        cache.mark_used(figure_extraction.paths['BASE'])
+
+        # return the results straight away if they're cached
+        deepfigures_output_path = figure_extraction.paths[
+            'DEEPFIGURES_OUTPUT_PATH']
+        success_file_path = os.path.join(deepfigures_output_path, '_SUCCESS')
+        if os.path.exists(success_file_path):
+            deepfigures_json_paths = glob.glob(
+                os.path.join(
+                    deepfigures_output_path, '*deepfigures-results.json'))
+            if deepfigures_json_paths:
+                logger.info(
+                    'Using cached results for {}.'.format(pdf_path))
+                figure_extraction.deepfigures_json_path = \
+                    deepfigures_json_paths[0]
+                figure_extraction.figure_image_paths = sorted(glob.glob(
+                    os.path.join(
+                        figure_extraction.paths['FIGURE_IMAGES_PATH'],
+                        '*.png')))
+                figure_extraction.from_cache = True
+                return figure_extraction
+        os.makedirs(deepfigures_output_path, exist_ok=True)
 
         # copy the PDF into the extraction results directory
-        shutil.copy(pdf_path, figure_extraction.paths['PDF_PATH'])
+        _copy_pdf(pdf_path, figure_extraction)
 
         pdf_renderer = settings_utils.import_setting(
             settings.DEEPFIGURES_PDF_RENDERER)()
+        pdf_path = figure_extraction.paths['PDF_PATH']
+        base_path = figure_extraction.paths['BASE']
 
-        # render the PDF into low-res images
-        figure_extraction.low_res_rendering_paths = \
-            pdf_renderer.render(
-                pdf_path=figure_extraction.paths['PDF_PATH'],
-                output_dir=figure_extraction.paths['BASE'],
+        def render():
+            """Render the PDF into low-res images."""
+            if not write_page_images:
+                # pages are streamed straight into detection instead
+                return None
+            return pdf_renderer.render(
+                pdf_path=pdf_path,
+                output_dir=base_path,
                 dpi=settings.DEFAULT_INFERENCE_DPI)
 
-        # render the PDF into hi-res images
-        figure_extraction.hi_res_rendering_paths = \
-            pdf_renderer.render(
-                pdf_path=figure_extraction.paths['PDF_PATH'],
-                output_dir=figure_extraction.paths['BASE'],
-                dpi=settings.DEFAULT_CROPPED_IMG_DPI)
-
-        # extract captions from PDF using pdffigures2
-        figure_extraction.pdffigures_output_path = \
-            pdffigures_wrapper.pdffigures_extractor.extract(
-                pdf_path=figure_extraction.paths['PDF_PATH'],
-                output_dir=figure_extraction.paths['BASE'])
-
-        # run deepfigures / neural networks on the PDF images
-        figure_extraction.deepfigures_json_path = \
-            detection.extract_figures_json(
-                pdf_path=figure_extraction.paths['PDF_PATH'],
-                page_image_paths=figure_extraction.low_res_rendering_paths,
-                pdffigures_output=figure_extraction.pdffigures_output_path,
-                output_directory=figure_extraction.paths['BASE'])
+        def pdffigures():
+            """Extract captions from the PDF using pdffigures2."""
+            return pdffigures_wrapper.pdffigures_extractor.extract(
+                pdf_path=pdf_path,
+                output_dir=base_path)
+
+        def load_detector():
+            """Build the detection graph and restore its weights."""
+            return detection.get_detector()
+
+        def detect(render, pdffigures, load_detector):
+            """Run deepfigures / neural networks on the PDF images."""
+            if render is None:
+                page_image_paths = None
+                page_images = pdf_renderer.render_arrays(
+                    pdf_path=pdf_path,
+                    dpi=settings.DEFAULT_INFERENCE_DPI)
+            else:
+                page_image_paths = render
+                page_images = None
+            return detection.extract_figures_json(
+                pdf_path=pdf_path,
+                page_image_paths=page_image_paths,
+                pdffigures_output=pdffigures,
+                output_directory=deepfigures_output_path,
+                page_images=page_images)
+
+        def crop(detect):
+            """Crop the detected figures out of hi-res renderings."""
+            return crop_figure_images(
+                pdf_path=pdf_path,
+                deepfigures_json_path=detect,
+                pdf_renderer=pdf_renderer,
+                output_directory=figure_extraction.paths[
+                    'FIGURE_IMAGES_PATH'])
+
+        results, figure_extraction.stage_timings = run_stages([
+            PipelineStage('render', render),
+            PipelineStage('pdffigures', pdffigures),
+            PipelineStage('load_detector', load_detector),
+            PipelineStage(
+                'detect',
+                detect,
+                dependencies=['render', 'pdffigures', 'load_detector']),
+            PipelineStage('crop', crop, dependencies=['detect'])
+        ])
+
+        figure_extraction.low_res_rendering_paths = results['render']
+        figure_extraction.pdffigures_output_path = results['pdffigures']
+        figure_extraction.deepfigures_json_path = results['detect']
+        figure_extraction.figure_image_paths = results['crop']
+
+        # mark the detection results as complete for the cache
+        with open(success_file_path, 'w') as f_out:
+            f_out.write('')
+        cache.record_size(figure_extraction.paths['BASE'])
 
         return figure_extraction
+
+    def _evict(self, output_directory, keep):
+        """Bound the size of ``output_directory`` if a limit is set."""
+        if self.cache_max_size is None:
+            return
+        cache.evict_lru(
+            cache_dir=output_directory,
+            max_size=self.cache_max_size,
+            keep=keep)
+
+    def extract_batch(
+            self,
+            pdf_paths,
+            output_directory,
+            write_page_images=True,
+            pdffigures_batch_size=settings.PDFFIGURES_BATCH_SIZE):
+        """Yield the extraction results for each PDF in ``pdf_paths``.
+
+        Run ``extract`` on each PDF in turn within a single process, so
+        that expensive state such as the tensorflow graph and restored
+        checkpoint (see ``detection.get_detector``) is set up once and
+        reused for every PDF rather than once per PDF. Before the PDFs
+        in each chunk of ``pdffigures_batch_size`` are extracted,
+        pdffigures2 is run over the whole chunk in a single JVM and
+        ``extract`` then picks up its cached output. The cache is
+        bounded once per chunk rather than after every PDF. A failure on
+        one PDF is logged and reported without stopping the batch.
+
+        Parameters
+        ----------
+        pdf_paths : Iterable[str]
+            The paths to the PDFs.
+        output_directory : str
+            The directory in which to save the results from extraction.
+        write_page_images : bool
+            Passed through to ``extract``.
+        pdffigures_batch_size : int
+            The number of PDFs to hand to each pdffigures2 JVM.
+
+        Yields
+        ------
+        Tuple[str, Optional[FigureExtraction], Optional[str]]
+            The path to the PDF, its ``FigureExtraction`` instance (or
+            ``None`` if extraction failed) and the error message (or
+            ``None`` if extraction succeeded).
+        """
+        for chunk in more_itertools.chunked(pdf_paths, pdffigures_batch_size):
+            # hash each PDF once, for both pdffigures2 and extract
+            figure_extractions = []
+            for pdf_path in chunk:
+                try:
+                    figure_extractions.append(
+                        FigureExtraction(
+                            pdf_path=pdf_path,
+                            parent_directory=output_directory))
+                except Exception:
+                    # _extract raises the error again and reports it
+                    figure_extractions.append(None)
+            self._run_pdffigures_batch(chunk, figure_extractions)
+            base_paths = []
+            for pdf_path, figure_extraction in zip(chunk, figure_extractions):
+                try:
+                    figure_extraction = self._extract(
+                        pdf_path,
+                        output_directory,
+                        write_page_images=write_page_images,
+                        figure_extraction=figure_extraction)
+                except Exception as e:
+                    logger.exception(
+                        'Failed to extract figures from {}.'.format(pdf_path))
+                    yield pdf_path, None, repr(e)
+                    continue
+                base_paths.append(figure_extraction.paths['BASE'])
+                yield pdf_path, figure_extraction, None
+            self._evict(output_directory=output_directory, keep=base_paths)
+
+    def _run_pdffigures_batch(self, pdf_paths, figure_extractions):
+        """Populate the pdffigures2 cache for ``pdf_paths`` with one JVM.
+
+        PDFs whose detection results are already cached are skipped, as
+        are PDFs whose ``FigureExtraction`` is ``None``. Errors are only
+        logged, since ``extract`` runs pdffigures2 again on any PDF
+        whose output isn't cached and reports its failure.
+        """
+        try:
+            uncached_figure_extractions = []
+            for pdf_path, figure_extraction in zip(
+                    pdf_paths, figure_extractions):
+                if figure_extraction is None or os.path.exists(
+                        os.path.join(
+                            figure_extraction.paths[
+                                'DEEPFIGURES_OUTPUT_PATH'],
+                            '_SUCCESS')):
+                    continue
+                _copy_pdf(pdf_path, figure_extraction)
+                uncached_figure_extractions.append(figure_extraction)
+            figure_extractions = uncached_figure_extractions
+            pdffigures_wrapper.pdffigures_extractor.extract_batch(
+                pdf_paths=[
+                    figure_extraction.paths['PDF_PATH']
+                    for figure_extraction in figure_extractions
+                ],
+                output_dirs=[
+                    figure_extraction.paths['BASE']
+                    for figure_extraction in figure_extractions
+                ])
+        except Exception:
+            logger.exception('Failed to run pdffigures2 in batch mode.')
@@ -1,5 +1,6 @@
 """PDF Rendering engines for deepfigures."""
 
+import concurrent.futures
 import glob
 import json
 import logging
@@ -9,9 +10,13 @@ import re
 import shutil
 import string
 import subprocess
+import tempfile
 import typing
 
 import bs4
+import more_itertools
+import numpy as np
+from PIL import Image
 
 from deepfigures.utils import file_util
 from deepfigures.extraction import exceptions
@@ -110,11 +115,160 @@ class PDFRenderer(object):
         -------
         :return: the list of generated paths
         """
+        self._check_ext(ext)
+
+        images_dir, image_output_path_prefix, success_file_path = \
+            self._get_output_paths(
+                pdf_path=pdf_path, output_dir=output_dir, dpi=dpi)
+
+        if not os.path.exists(success_file_path) or not use_cache:
+            self._reset_images_dir(images_dir)
+
+            self._rasterize_pdf(
+                pdf_path=pdf_path,
+                image_output_path_prefix=image_output_path_prefix,
+                dpi=dpi,
+                ext=ext,
+                max_pages=max_pages,
+                check_retcode=check_retcode)
+
+            # add a success file to verify that the operation completed
+            with open(success_file_path, 'w') as f_out:
+                f_out.write('')
+
+        generated_image_paths = glob.glob(
+            image_output_path_prefix + '*.' + ext)
+
+        return sort_by_page_num(generated_image_paths)
+
+    def render_arrays(
+        self,
+        pdf_path: str,
+        dpi: int=settings.DEFAULT_INFERENCE_DPI,
+        max_pages: typing.Optional[int]=None,
+        check_retcode: bool=False,
+        output_dir: typing.Optional[str]=None,
+        ext: str='png'
+    ) -> typing.Iterator[np.ndarray]:
+        """Render pdf_path and yield each page as an RGB array.
+
+        Render the pdf at pdf_path and yield its pages in order as
+        uint8 arrays of shape (height, width, 3) without round tripping
+        them through image files on disk. If output_dir is given, each
+        page is additionally saved to disk using the same layout and
+        file names as PDFRenderer.render, and the _SUCCESS file is
+        written once every page has been yielded.
+
+        Parameters
+        ----------
+        :param str pdf_path: path to the pdf that should be rendered.
+        :param int dpi: the dpi at which to render the PDF.
+        :param Optional[int] max_pages: the maximum number of pages to
+          render from the PDF.
+        :param bool check_retcode: whether or not to check the return
+          code from the subprocess used to render the PDF.
+        :param Optional[str] output_dir: if not None, the directory in
+          which to also save the rendered pages as images.
+        :param str ext: the extension or file type of the images saved
+          to output_dir, should be either 'png' or 'jpg'.
+
+        Returns
+        -------
+        :return: an iterator over the rendered pages.
+        """
+        page_arrays = self._rasterize_pdf_arrays(
+            pdf_path=pdf_path,
+            dpi=dpi,
+            max_pages=max_pages,
+            check_retcode=check_retcode)
+
+        if output_dir is None:
+            yield from page_arrays
+            return
+
+        self._check_ext(ext)
+        images_dir, image_output_path_prefix, success_file_path = \
+            self._get_output_paths(
+                pdf_path=pdf_path, output_dir=output_dir, dpi=dpi)
+        self._reset_images_dir(images_dir)
+        for page_num, page_array in enumerate(page_arrays, 1):
+            Image.fromarray(page_array).save(
+                '{prefix}{page_num:04d}.{ext}'.format(
+                    prefix=image_output_path_prefix,
+                    page_num=page_num,
+                    ext=ext))
+            yield page_array
+
+        # add a success file to verify that the operation completed
+        with open(success_file_path, 'w') as f_out:
+            f_out.write('')
+
+    def render_pages_arrays(
+        self,
+        pdf_path: str,
+        page_nums: typing.Iterable[int],
+        dpi: int=settings.DEFAULT_CROPPED_IMG_DPI,
+        check_retcode: bool=False
+    ) -> typing.Iterator[typing.Tuple[int, np.ndarray]]:
+        """Render only the pages page_nums of pdf_path as RGB arrays.
+
+        Render the given pages of the pdf at pdf_path without rendering
+        the rest of the document, yielding them in page order. Each run
+        of consecutive pages is rasterized in one pass.
+
+        Parameters
+        ----------
+        :param str pdf_path: path to the pdf that should be rendered.
+        :param Iterable[int] page_nums: the 1-indexed numbers of the
+          pages to render.
+        :param int dpi: the dpi at which to render the pages.
+        :param bool check_retcode: whether or not to check the return
+          code from the subprocess used to render the PDF.
+
+        Returns
+        -------
+        :return: an iterator over tuples of the page number and the page
+          as a uint8 array of shape (height, width, 3).
+        """
+        for page_run in more_itertools.consecutive_groups(
+                sorted(set(page_nums))):
+            page_run = list(page_run)
+            page_arrays = self._rasterize_page_range_arrays(
+                pdf_path=pdf_path,
+                dpi=dpi,
+                first_page=page_run[0],
+                last_page=page_run[-1],
+                check_retcode=check_retcode)
+            yield from zip(page_run, page_arrays)
+
+    def _check_ext(self, ext: str) -> None:
+        """Raise a ValueError if ext is not a supported image type."""
         image_types = ['png', 'jpg']
         if ext not in image_types:
             raise ValueError(
                 "ext must be one of {}".format(', '.join(image_types)))
 
+    def _get_output_paths(
+        self,
+        pdf_path: str,
+        output_dir: typing.Optional[str],
+        dpi: int
+    ) -> typing.Tuple[str, str, str]:
+        """Return the paths used for rendering pdf_path at dpi.
+
+        Parameters
+        ----------
+        :param str pdf_path: path to the pdf that should be rendered.
+        :param Optional[str] output_dir: path to the directory in which
+          to save output. If None, then output is saved in the same
+          directory as the PDF.
+        :param int dpi: the dpi at which the PDF is rendered.
+
+        Returns
+        -------
+        :return: a tuple of the images directory, the prefix for the
+          path of each rendered page and the path to the _SUCCESS file.
+        """
         if output_dir is None:
             output_dir = os.path.dirname(pdf_path)
 
@@ -141,28 +295,14 @@ class PDFRenderer(object):
             images_dir, image_filename_prefix)
         success_file_path = os.path.join(images_dir, '_SUCCESS')
 
-        if not os.path.exists(success_file_path) or not use_cache:
-            if os.path.exists(images_dir):
-                logger.info("Overwriting {}.".format(images_dir))
-                shutil.rmtree(images_dir)
-            os.makedirs(images_dir)
+        return images_dir, image_output_path_prefix, success_file_path
 
-            self._rasterize_pdf(
-                pdf_path=pdf_path,
-                image_output_path_prefix=image_output_path_prefix,
-                dpi=dpi,
-                ext=ext,
-                max_pages=max_pages,
-                check_retcode=check_retcode)
-
-            # add a success file to verify that the operation completed
-            with open(success_file_path, 'w') as f_out:
-                f_out.write('')
-
-        generated_image_paths = glob.glob(
-            image_output_path_prefix + '*.' + ext)
-
-        return sort_by_page_num(generated_image_paths)
+    def _reset_images_dir(self, images_dir: str) -> None:
+        """Create images_dir, removing any previous contents."""
+        if os.path.exists(images_dir):
+            logger.info("Overwriting {}.".format(images_dir))
+            shutil.rmtree(images_dir)
+        os.makedirs(images_dir)
 
     def _rasterize_pdf(
         self,
@@ -198,6 +338,88 @@ class PDFRenderer(object):
             "Subclasses of PDFRenderer must implement _rasterize_pdf."
         )
 
+    def _rasterize_pdf_arrays(
+        self,
+        pdf_path: str,
+        dpi: int,
+        max_pages: typing.Optional[int],
+        check_retcode: bool
+    ) -> typing.Iterator[np.ndarray]:
+        """Rasterize the PDF at pdf_path and yield each page as an array.
+
+        Subclasses should override this method when their backend can
+        produce raw pixels directly. The default implementation renders
+        the PDF into a temporary directory with _rasterize_pdf and reads
+        the pages back.
+
+        Parameters
+        ----------
+        :param str pdf_path: path to the pdf that should be rendered.
+        :param int dpi: the dpi at which to render the pdf.
+        :param int max_pages: the maximum number of pages to render
+          from the pdf.
+        :param bool check_retcode: whether or not to check the return
+          code from the subprocess used to render the PDF.
+
+        Returns
+        -------
+        :return: an iterator over the pages as uint8 RGB arrays.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            image_output_path_prefix = os.path.join(
+                tmp_dir,
+                self.IMAGE_FILENAME_PREFIX_TEMPLATE.format(
+                    pdf_name=os.path.basename(pdf_path), dpi=dpi))
+            self._rasterize_pdf(
+                pdf_path=pdf_path,
+                image_output_path_prefix=image_output_path_prefix,
+                dpi=dpi,
+                ext='png',
+                max_pages=max_pages,
+                check_retcode=check_retcode)
+            for image_path in sort_by_page_num(
+                    glob.glob(image_output_path_prefix + '*.png')):
+                with Image.open(image_path) as im:
+                    yield np.asarray(im.convert('RGB'))
+
+    def _rasterize_page_range_arrays(
+        self,
+        pdf_path: str,
+        dpi: int,
+        first_page: int,
+        last_page: int,
+        check_retcode: bool
+    ) -> typing.Iterator[np.ndarray]:
+        """Rasterize pages first_page through last_page as arrays.
+
+        Subclasses should override this method when their backend can
+        start rendering from an arbitrary page. The default
+        implementation rasterizes the PDF from its first page and
+        discards the pages before first_page.
+
+        Parameters
+        ----------
+        :param str pdf_path: path to the pdf that should be rendered.
+        :param int dpi: the dpi at which to render the pdf.
+        :param int first_page: the 1-indexed first page to render.
+        :param int last_page: the 1-indexed last page to render,
+          inclusive.
+        :param bool check_retcode: whether or not to check the return
+          code from the subprocess used to render the PDF.
+
+        Returns
+        -------
+        :return: an iterator over the pages as uint8 RGB arrays.
+        """
+        page_arrays = self._rasterize_pdf_arrays(
+            pdf_path=pdf_path,
+            dpi=dpi,
+            max_pages=last_page,
+            check_retcode=check_retcode)
+        for page_num, page_array in enumerate(page_arrays, 1):
+            if page_num >= first_page:
+                yield page_array
+
     def extract_text(self, pdf_path: str, encoding: str='UTF-8'
                     ) -> typing.Optional[bs4.BeautifulSoup]:
         """Extract info about a PDF as XML returning the parser for it.
@@ -253,9 +475,37 @@ class PDFRenderer(object):
 
 
 class GhostScriptRenderer(PDFRenderer):
-    """Render PDFs using GhostScript."""
+    """Render PDFs using GhostScript.
+
+    Large PDFs are split into contiguous page ranges which are
+    rasterized concurrently by separate ghostscript processes, since a
+    single ghostscript process only parallelizes work within a page.
+    """
     RENDERING_ENGINE_NAME = 'ghostscript'
 
+    def __init__(
+        self,
+        max_shards: int=settings.GHOSTSCRIPT_MAX_SHARDS,
+        min_pages_per_shard: int=settings.GHOSTSCRIPT_MIN_PAGES_PER_SHARD
+    ):
+        """Initialize the GhostScriptRenderer.
+
+        Parameters
+        ----------
+        :param int max_shards: the maximum number of ghostscript
+          processes to use when rendering a single PDF. Use 1 to always
+          render a PDF with one process.
+        :param int min_pages_per_shard: the minimum number of pages
+          each ghostscript process should render.
+        """
+        super().__init__()
+        if max_shards < 1:
+            raise ValueError("max_shards must be at least 1.")
+        if min_pages_per_shard < 1:
+            raise ValueError("min_pages_per_shard must be at least 1.")
+        self.max_shards = max_shards
+        self.min_pages_per_shard = min_pages_per_shard
+
     def _rasterize_pdf(
         self,
         pdf_path: str,
@@ -266,10 +516,188 @@ class GhostScriptRenderer(PDFRenderer):
         check_retcode: bool
     ) -> typing.List[str]:
         """Rasterize a PDF using GhostScript."""
-        # ghostscript requires a template string for the output path
-        image_output_path_template = image_output_path_prefix + '%04d.{ext}'.format(
-            ext=ext)
-        sdevice = 'png16m' if ext == 'png' else 'jpeg'
+        page_ranges = self._get_page_ranges(
+            pdf_path=pdf_path, max_pages=max_pages)
+        if len(page_ranges) <= 1:
+            # ghostscript requires a template string for the output path
+            image_output_path_template = image_output_path_prefix + '%04d.{ext}'.format(
+                ext=ext)
+            subprocess.run(
+                self._get_gs_args(
+                    pdf_path=pdf_path,
+                    image_output_path_template=image_output_path_template,
+                    dpi=dpi,
+                    ext=ext,
+                    last_page=max_pages),
+                check=check_retcode)
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(page_ranges)) as executor:
+            futures = [
+                executor.submit(
+                    self._rasterize_page_range,
+                    pdf_path=pdf_path,
+                    image_output_path_prefix=image_output_path_prefix,
+                    dpi=dpi,
+                    ext=ext,
+                    first_page=first_page,
+                    last_page=last_page,
+                    check_retcode=check_retcode)
+                for first_page, last_page in page_ranges
+            ]
+            for future in futures:
+                future.result()
+
+    def _rasterize_pdf_arrays(
+        self,
+        pdf_path: str,
+        dpi: int,
+        max_pages: typing.Optional[int],
+        check_retcode: bool
+    ) -> typing.Iterator[np.ndarray]:
+        """Rasterize a PDF using GhostScript's raw ppm output on a pipe."""
+        yield from self._stream_gs_pages(
+            gs_args=self._get_gs_args(
+                pdf_path=pdf_path,
+                image_output_path_template='-',
+                dpi=dpi,
+                ext='ppm',
+                last_page=max_pages),
+            check_retcode=check_retcode)
+
+    def _rasterize_page_range_arrays(
+        self,
+        pdf_path: str,
+        dpi: int,
+        first_page: int,
+        last_page: int,
+        check_retcode: bool
+    ) -> typing.Iterator[np.ndarray]:
+        """Rasterize a range of pages using GhostScript on a pipe."""
+        yield from self._stream_gs_pages(
+            gs_args=self._get_gs_args(
+                pdf_path=pdf_path,
+                image_output_path_template='-',
+                dpi=dpi,
+                ext='ppm',
+                first_page=first_page,
+                last_page=last_page),
+            check_retcode=check_retcode)
+
+    def _stream_gs_pages(
+        self,
+        gs_args: typing.List[str],
+        check_retcode: bool
+    ) -> typing.Iterator[np.ndarray]:
+        """Run ghostscript writing ppm to stdout and yield its pages."""
+        process = subprocess.Popen(gs_args, stdout=subprocess.PIPE)
+        completed = False
+        try:
+            yield from read_ppm_stream(process.stdout)
+            completed = True
+        finally:
+            if not completed:
+                # the consumer stopped early, so don't wait on gs to
+                # render the remaining pages.
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+        if check_retcode and returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode=returncode, cmd=gs_args)
+
+    def _rasterize_page_range(
+        self,
+        pdf_path: str,
+        image_output_path_prefix: str,
+        dpi: int,
+        ext: str,
+        first_page: int,
+        last_page: int,
+        check_retcode: bool
+    ) -> None:
+        """Rasterize pages first_page through last_page of a PDF.
+
+        Ghostscript numbers its output files starting from 1 regardless
+        of -dFirstPage, so the pages are written to a scratch directory
+        and then renamed to their page numbers in the full document.
+        """
+        shard_dir = '{prefix}-shard{first_page:04d}'.format(
+            prefix=image_output_path_prefix, first_page=first_page)
+        os.makedirs(shard_dir)
+        shard_output_path_template = os.path.join(
+            shard_dir, '%04d.{ext}'.format(ext=ext))
+        subprocess.run(
+            self._get_gs_args(
+                pdf_path=pdf_path,
+                image_output_path_template=shard_output_path_template,
+                dpi=dpi,
+                ext=ext,
+                first_page=first_page,
+                last_page=last_page,
+                num_rendering_threads=1),
+            check=check_retcode)
+        for shard_page_num in range(1, last_page - first_page + 2):
+            shard_page_path = shard_output_path_template % shard_page_num
+            if not os.path.exists(shard_page_path):
+                continue
+            os.rename(
+                shard_page_path,
+                '{prefix}{page_num:04d}.{ext}'.format(
+                    prefix=image_output_path_prefix,
+                    page_num=first_page + shard_page_num - 1,
+                    ext=ext))
+        shutil.rmtree(shard_dir)
+
+    def _get_page_ranges(
+        self,
+        pdf_path: str,
+        max_pages: typing.Optional[int]
+    ) -> typing.List[typing.Tuple[int, int]]:
+        """Return the 1-indexed, inclusive page ranges for each shard.
+
+        An empty list is returned if the PDF should be rendered by a
+        single ghostscript process.
+        """
+        if self.max_shards == 1:
+            return []
+        num_pages = get_page_count(pdf_path)
+        if num_pages is None:
+            return []
+        if max_pages is not None:
+            num_pages = min(num_pages, max_pages)
+        num_shards = min(
+            self.max_shards, num_pages // self.min_pages_per_shard)
+        if num_shards <= 1:
+            return []
+        shard_size, remainder = divmod(num_pages, num_shards)
+        page_ranges = []
+        first_page = 1
+        for shard in range(num_shards):
+            last_page = first_page + shard_size - 1
+            if shard < remainder:
+                last_page += 1
+            page_ranges.append((first_page, last_page))
+            first_page = last_page + 1
+        return page_ranges
+
+    def _get_gs_args(
+        self,
+        pdf_path: str,
+        image_output_path_template: str,
+        dpi: int,
+        ext: str,
+        first_page: typing.Optional[int]=None,
+        last_page: typing.Optional[int]=None,
+        num_rendering_threads: int=4
+    ) -> typing.List[str]:
+        """Return the ghostscript command for rasterizing a PDF."""
+        sdevice = {
+            'png': 'png16m',
+            'jpg': 'jpeg',
+            'ppm': 'ppmraw'
+        }[ext]
         gs_args = [
             'gs', '-dGraphicsAlphaBits=4', '-dTextAlphaBits=4', '-dNOPAUSE', '-dBATCH', '-dSAFER', '-dQUIET',
             '-sDEVICE=' + sdevice,
@@ -278,17 +706,90 @@ class GhostScriptRenderer(PDFRenderer):
             '-dBandBufferSpace=%d' % int(5e8), '-sBandListStorage=memory',
             '-c',
             '%d setvmthreshold' % int(1e9), '-dNOGC',
-            '-dNumRenderingThreads=4', "-f", pdf_path
+            '-dNumRenderingThreads=%d' % num_rendering_threads, "-f", pdf_path
         ]
-        if max_pages is not None:
-            gs_args.insert(-2, '-dLastPage=%d' % max_pages)
-        subprocess.run(gs_args, check=check_retcode)
+        if first_page is not None:
+            gs_args.insert(-2, '-dFirstPage=%d' % first_page)
+        if last_page is not None:
+            gs_args.insert(-2, '-dLastPage=%d' % last_page)
+        return gs_args
 
     def _extract_text(self, pdf_path: str, encoding: str) -> None:
         """Extract text using pdftotext."""
         subprocess.run(['pdftotext', '-bbox', '-enc', encoding, pdf_path])
 
 
+def get_page_count(pdf_path: str) -> typing.Optional[int]:
+    """Return the number of pages in the PDF at pdf_path.
+
+    Parameters
+    ----------
+    :param str pdf_path: path to the PDF.
+
+    Returns
+    -------
+    :return: the number of pages in the PDF, or None if it could not be
+      determined.
+    """
+    try:
+        res = subprocess.run(
+            ['pdfinfo', pdf_path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+    except OSError:
+        logger.warning("Could not run pdfinfo on {}.".format(pdf_path))
+        return None
+    match = re.search(
+        r'^Pages:\s+(\d+)\s*$',
+        res.stdout.decode('utf-8', errors='replace'),
+        flags=re.MULTILINE)
+    if res.returncode != 0 or match is None:
+        return None
+    return int(match.group(1))
+
+
+def read_ppm_stream(stream: typing.BinaryIO) -> typing.Iterator[np.ndarray]:
+    """Yield the images in a stream of concatenated binary ppm files.
+
+    Parameters
+    ----------
+    :param BinaryIO stream: a binary file object containing zero or
+      more binary (P6) ppm images with a maxval of 255, one after
+      another, such as the output of ghostscript's ppmraw device.
+
+    Returns
+    -------
+    :return: an iterator over the images as uint8 arrays of shape
+      (height, width, 3).
+    """
+    while True:
+        header = []
+        while len(header) < 4:
+            line = stream.readline()
+            if not line:
+                if header:
+                    raise exceptions.PDFProcessingError(
+                        "Truncated ppm header in rendered output.")
+                return
+            header.extend(line.split(b'#', 1)[0].split())
+        magic, width, height, maxval = header
+        if magic != b'P6' or maxval != b'255':
+            raise exceptions.PDFProcessingError(
+                "Unsupported ppm header in rendered output: {}.".format(
+                    b' '.join(header)))
+        (width, height) = (int(width), int(height))
+        page = np.empty((height, width, 3), dtype=np.uint8)
+        buf = memoryview(page).cast('B')
+        n_read = 0
+        while n_read < len(buf):
+            n = stream.readinto(buf[n_read:])
+            if not n:
+                raise exceptions.PDFProcessingError(
+                    "Truncated ppm data in rendered output.")
+            n_read += n
+        yield page
+
+
 def sort_by_page_num(file_paths: typing.List[str]) -> typing.List[str]:
     """Sort file_paths by the page number.
 
@@ -2,8 +2,9 @@
 
 import os
 import tempfile
-from typing import List, Tuple, Iterable
+from typing import List, Optional, Sequence, Tuple, Iterable
 
+import more_itertools
 import numpy as np
 import tensorflow as tf
 
@@ -12,7 +13,8 @@ from deepfigures.extraction.datamodels import (
     BoxClass,
     Figure,
     PdfDetectionResult,
-    CaptionOnly)
+    CaptionOnly,
+    crop_whitespace_edges_many)
 from deepfigures.extraction import (
     figure_utils,
     pdffigures_wrapper)
@@ -31,6 +33,107 @@ pdf_renderer = settings_utils.import_setting(
     settings.DEEPFIGURES_PDF_RENDERER)()
 
 
+def draw_caption_mask(
+        caption_boxes: List[BoxClass],
+        page_shape: Tuple[int, ...],
+        out: np.ndarray) -> np.ndarray:
+    """Draw the caption mask channel of a page directly at out's size.
+
+    The result is the page sized mask (CAPTION_CHANNEL_MASK inside the
+    rounded caption boxes and CAPTION_CHANNEL_BACKGROUND elsewhere)
+    resized to out's size the way image_util.imresize_multichannel would
+    resize it, but the page sized mask is never built. Instead the union
+    of the caption boxes is computed with a prefix sum over the grid
+    formed by their edges, and each output pixel is shaded by the
+    interpolation weights its rows and columns put on that grid's cells.
+
+    :param List[BoxClass] caption_boxes: the caption boxes, in page
+      coordinates.
+    :param Tuple[int, ...] page_shape: the shape of the page image.
+    :param np.ndarray out: the (height, width) array to draw into.
+    :return: out.
+    """
+    (page_height, page_width) = page_shape[:2]
+    (out_height, out_width) = out.shape[:2]
+    clipped_boxes = [
+        box._get_clipped_rounded(page_shape) for box in caption_boxes
+    ]
+    clipped_boxes = np.array(
+        [box for box in clipped_boxes if box is not None],
+        dtype=np.int64).reshape(-1, 4)
+    if len(clipped_boxes) == 0:
+        out[...] = CAPTION_CHANNEL_BACKGROUND
+        return out
+    xs = np.unique(clipped_boxes[:, [0, 2]])
+    ys = np.unique(clipped_boxes[:, [1, 3]])
+    (x1s, x2s) = (
+        np.searchsorted(xs, clipped_boxes[:, 0]),
+        np.searchsorted(xs, clipped_boxes[:, 2]))
+    (y1s, y2s) = (
+        np.searchsorted(ys, clipped_boxes[:, 1]),
+        np.searchsorted(ys, clipped_boxes[:, 3]))
+    # mark each box's corners, so the 2d prefix sum counts the boxes
+    # covering each cell of the grid
+    corners = np.zeros((len(ys), len(xs)), dtype=np.int64)
+    np.add.at(corners, (y1s, x1s), 1)
+    np.add.at(corners, (y1s, x2s), -1)
+    np.add.at(corners, (y2s, x1s), -1)
+    np.add.at(corners, (y2s, x2s), 1)
+    is_covered = (corners.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0)
+    # imresize_multichannel averages areas when shrinking in both
+    # dimensions and interpolates bilinearly otherwise
+    get_weights = (
+        _get_area_weights
+        if out_height < page_height and out_width < page_width else
+        _get_bilinear_weights)
+    coverage = (
+        get_weights(ys, page_height, out_height) @
+        is_covered.astype(np.float64) @
+        get_weights(xs, page_width, out_width).T)
+    out[...] = np.rint(
+        CAPTION_CHANNEL_BACKGROUND +
+        (CAPTION_CHANNEL_MASK - CAPTION_CHANNEL_BACKGROUND) * coverage)
+    return out
+
+
+def _get_area_weights(
+        edges: np.ndarray,
+        page_size: int,
+        out_size: int) -> np.ndarray:
+    """Return the weights of each output pixel on each interval between
+    edges when averaging the page's pixels over equal bins."""
+    bin_edges = np.arange(out_size + 1) * (page_size / out_size)
+    lengths = np.clip(
+        bin_edges[:, None] - edges[None, :-1], 0, np.diff(edges)[None, :])
+    return np.diff(lengths, axis=0) * (out_size / page_size)
+
+
+def _get_bilinear_weights(
+        edges: np.ndarray,
+        page_size: int,
+        out_size: int) -> np.ndarray:
+    """Return the weights of each output pixel on each interval between
+    edges when interpolating the page's pixels linearly, as cv2 does."""
+    centers = (np.arange(out_size) + .5) * (page_size / out_size) - .5
+    lower = np.floor(centers).astype(np.int64)
+    fractions = centers - lower
+    fractions[lower < 0] = 0
+    fractions[lower >= page_size - 1] = 0
+    lower = np.clip(lower, 0, page_size - 1)
+    upper = np.minimum(lower + 1, page_size - 1)
+    weights = np.zeros((out_size, len(edges) + 1))
+    out_pixels = np.arange(out_size)
+    # column k + 1 holds the weight on the interval between edges k and
+    # k + 1; the first and last columns catch the pixels outside them
+    np.add.at(
+        weights, (out_pixels, np.searchsorted(edges, lower, side='right')),
+        1 - fractions)
+    np.add.at(
+        weights, (out_pixels, np.searchsorted(edges, upper, side='right')),
+        fractions)
+    return weights[:, 1:-1]
+
+
 class TensorboxCaptionmaskDetector(object):
     """Interface for using the neural network model to detect figures.
 
@@ -45,10 +148,29 @@ class TensorboxCaptionmaskDetector(object):
             self,
             save_dir,
             iteration,
-            batch_size=1  # Batch sizes greater than 1 will change results due to batch norm in inception_v1
+            batch_size=1,
+            use_moving_statistics=False
     ):
+        """
+        :param str save_dir: the directory containing hypes.json and the
+          model checkpoints.
+        :param int iteration: the iteration of the checkpoint to restore.
+        :param int batch_size: the number of pages passed to the network
+          in each session run.
+        :param bool use_moving_statistics: if True, batch norm uses its
+          moving statistics, so a page's detections don't depend on the
+          other pages in its batch. Otherwise batch norm normalizes with
+          the statistics of the current batch, which is how the model is
+          evaluated during training; in that mode batch sizes greater
+          than 1 would change the results, so they aren't allowed.
+        """
+        if batch_size > 1 and not use_moving_statistics:
+            raise ValueError(
+                'batch_size > 1 requires use_moving_statistics, otherwise'
+                ' batch norm makes detections depend on the batch.')
         self.save_dir = save_dir
         self.iteration = iteration
+        self.use_moving_statistics = use_moving_statistics
 
         self.hypes = self._get_hypes()
         self.hypes['batch_size'] = batch_size
@@ -56,23 +178,28 @@ class TensorboxCaptionmaskDetector(object):
             self.hypes['image_height'], self.hypes['image_width'],
             self.hypes['image_channels']
         ]  # type: Tuple[float, float, float]
+        # the network's input, reused for every batch of pages
+        self.input_batch = np.zeros(
+            [batch_size] + self.input_shape, dtype=np.float32)
         self.graph = tf.Graph()
         with self.graph.as_default():
             self.x_in = tf.placeholder(
-                tf.float32, name='x_in', shape=self.input_shape
+                tf.float32, name='x_in', shape=[batch_size] + self.input_shape
             )
             assert (self.hypes['use_rezoom'])
             pred_boxes, self.pred_logits, self.pred_confidences, self.pred_confs_deltas, pred_boxes_deltas = \
-                train.build_forward(self.hypes, tf.expand_dims(self.x_in, 0), 'test', reuse=None)
+                train.build_forward(
+                    self.hypes, self.x_in, 'test', reuse=None,
+                    is_training=not use_moving_statistics)
             self.pred_boxes = pred_boxes + pred_boxes_deltas
             grid_area = self.hypes['grid_height'] * self.hypes['grid_width']
             pred_confidences = tf.reshape(
                 tf.nn.softmax(
                     tf.reshape(
                         self.pred_confs_deltas,
-                        [grid_area * self.hypes['rnn_len'], 2]
+                        [batch_size * grid_area * self.hypes['rnn_len'], 2]
                     )
-                ), [grid_area, self.hypes['rnn_len'], 2]
+                ), [batch_size * grid_area, self.hypes['rnn_len'], 2]
             )
             assert (self.hypes['reregress'])
             self.sess = tf.Session()
@@ -100,55 +227,115 @@ class TensorboxCaptionmaskDetector(object):
     def detect_page(
             self,
             page_tensor: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        feed = {self.x_in: page_tensor}
+        return self.detect_pages([page_tensor])[0]
+
+    def detect_pages(
+            self,
+            page_tensors: List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Run the network on page_tensors, batch_size pages per session run.
+
+        The last batch is padded with blank pages whose outputs are
+        discarded.
+        """
+        predictions = []
+        for page_batch in more_itertools.chunked(
+                page_tensors, self.hypes['batch_size']):
+            self.input_batch[:len(page_batch)] = page_batch
+            predictions.extend(self._run_input_batch(len(page_batch)))
+        return predictions
+
+    def _run_input_batch(
+            self,
+            n_pages: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Run the network on the first n_pages pages of self.input_batch."""
+        batch_size = self.hypes['batch_size']
+        self.input_batch[n_pages:] = 0
+        feed = {self.x_in: self.input_batch}
         (np_pred_boxes, np_pred_confidences) = self.sess.run(
             [self.pred_boxes, self.pred_confidences],
             feed_dict=feed)
-        return (np_pred_boxes, np_pred_confidences)
+        # outputs are stacked along the first axis, one grid per page
+        np_pred_boxes = np.reshape(
+            np_pred_boxes, (batch_size, -1) + np_pred_boxes.shape[1:])
+        np_pred_confidences = np.reshape(
+            np_pred_confidences, (batch_size, -1) + np_pred_confidences.shape[1:])
+        return list(
+            zip(np_pred_boxes[:n_pages], np_pred_confidences[:n_pages]))
 
     def get_detections(
             self,
             page_images: List[np.ndarray],
             crop_whitespace: bool = True,
-            conf_threshold: float = .5) -> List[List[BoxClass]]:
-        page_datas = [
-            {
-                'page_image': page_image,
-                'orig_size': page_image.shape[:2],
-                'resized_page_image': image_util.imresize_multichannel(
-                    page_image, self.input_shape),
-            }
-            for page_image in page_images
-        ]
+            conf_threshold: float = .5,
+            page_caption_boxes: Optional[List[List[BoxClass]]] = None
+    ) -> List[List[BoxClass]]:
+        """Return the figure boxes detected on each of page_images.
 
-        predictions = [
-            self.detect_page(page_data['resized_page_image'])
-            for page_data in page_datas
-        ]
+        Each page is resized straight into self.input_batch, so no
+        network sized copies of the pages are allocated.
+
+        :param List[np.ndarray] page_images: the page images, with
+          image_channels channels unless page_caption_boxes is given.
+        :param bool crop_whitespace: whether to crop the whitespace edges
+          of the detected boxes.
+        :param float conf_threshold: the minimum confidence of the
+          returned boxes.
+        :param Optional[List[List[BoxClass]]] page_caption_boxes: if given,
+          page_images are RGB and the caption mask channel of each page is
+          drawn from its caption boxes directly at network resolution
+          (see draw_caption_mask), rather than being part of the page
+          image.
+        :return: the list of detected boxes for each page, in page image
+          coordinates.
+        """
+        batch_size = self.hypes['batch_size']
+        predictions = []
+        for batch_start in range(0, len(page_images), batch_size):
+            batch_end = min(batch_start + batch_size, len(page_images))
+            for page_num in range(batch_start, batch_end):
+                page_input = self.input_batch[page_num - batch_start]
+                page_image = page_images[page_num]
+                if page_caption_boxes is None:
+                    image_util.imresize_multichannel(
+                        page_image, self.input_shape, out=page_input)
+                else:
+                    image_util.imresize_multichannel(
+                        page_image, self.input_shape,
+                        out=page_input[:, :, :3])
+                    draw_caption_mask(
+                        page_caption_boxes[page_num], page_image.shape,
+                        out=page_input[:, :, 3])
+            predictions.extend(
+                self._run_input_batch(batch_end - batch_start))
 
-        for (page_data, prediction) in zip(page_datas, predictions):
-            (np_pred_boxes, np_pred_confidences) = prediction
-            new_img, rects = train_utils.add_rectangles(
+        if predictions:
+            (np_pred_boxes, np_pred_confidences) = zip(*predictions)
+            # stitch all the pages in one call, which releases the GIL
+            rects_batch = train_utils.decode_rectangles_batch(
                 self.hypes,
-                page_data['resized_page_image'],
-                np_pred_confidences,
-                np_pred_boxes,
-                use_stitching=True,
-                min_conf=conf_threshold,
-                show_suppressed=False)
+                np.stack(np_pred_confidences),
+                np.stack(np_pred_boxes),
+                rnn_len=self.hypes['rnn_len'])
+        else:
+            rects_batch = []
+
+        detected_boxes_by_page = []
+        for (page_num, rects) in enumerate(rects_batch):
+            page_image = page_images[page_num]
             detected_boxes = [
                 BoxClass(x1=r.x1, y1=r.y1, x2=r.x2, y2=r.y2).resize_by_page(
-                    self.input_shape, page_data['orig_size'])
+                    self.input_shape, page_image.shape[:2])
                 for r in rects if r.score > conf_threshold
             ]
             if crop_whitespace:
-                detected_boxes = [
-                    box.crop_whitespace_edges(page_data['page_image'])
-                    for box in detected_boxes
-                ]
+                detected_boxes = crop_whitespace_edges_many(
+                    detected_boxes, page_image,
+                    foreground_boxes=(
+                        page_caption_boxes[page_num]
+                        if page_caption_boxes is not None else ()))
                 detected_boxes = list(filter(None, detected_boxes))
-            page_data['detected_boxes'] = detected_boxes
-        return [page_data['detected_boxes'] for page_data in page_datas]
+            detected_boxes_by_page.append(detected_boxes)
+        return detected_boxes_by_page
 
     def close(self):
         self.sess.close()
@@ -159,38 +346,34 @@ class TensorboxCaptionmaskDetector(object):
 
 def detect_figures(
         pdf: str,
-        pdffigures_captions: List[CaptionOnly],
+        pdffigures_captions: Sequence[CaptionOnly],
         detector: TensorboxCaptionmaskDetector,
         conf_threshold: float
 ) -> Tuple[List[Figure], List[List[BoxClass]]]:
+    if not isinstance(pdffigures_captions, pdffigures_wrapper.PageCaptions):
+        pdffigures_captions = pdffigures_wrapper.PageCaptions(
+            pdffigures_captions)
     page_image_files = pdf_renderer.render(pdf, dpi=settings.DEFAULT_INFERENCE_DPI)
-    page_tensors = []
-    for f in page_image_files:
-        page_im = image_util.read_tensor(f)
-        if detector.hypes['image_channels'] == 3:
-            page_tensors.append(page_im)
-        else:
-            im_with_mask = np.pad(
-                page_im,
-                pad_width=[(0, 0), (0, 0), (0, 1)],
-                mode='constant',
-                constant_values=CAPTION_CHANNEL_BACKGROUND
-            )
-            for caption in pdffigures_captions:
-                (x1, y1, x2, y2) = caption.caption_boundary.get_rounded()
-                im_with_mask[y1:y2, x1:x2, 3] = CAPTION_CHANNEL_MASK
-            page_tensors.append(im_with_mask)
+    page_images = [image_util.read_tensor(f) for f in page_image_files]
+    if detector.hypes['image_channels'] == 3:
+        page_caption_boxes = None
+    else:
+        # every page is masked with the captions from the whole document
+        caption_boxes = [
+            caption.caption_boundary for caption in pdffigures_captions
+        ]
+        page_caption_boxes = [caption_boxes] * len(page_images)
     figure_boxes_by_page = detector.get_detections(
-        page_tensors, conf_threshold=conf_threshold
+        page_images,
+        conf_threshold=conf_threshold,
+        page_caption_boxes=page_caption_boxes
     )
     figures_by_page = []
     for page_num in range(len(page_image_files)):
         # Page numbers are always 0 indexed
         figure_boxes = figure_boxes_by_page[page_num]
-        pf_page_captions = [
-            cap for cap in pdffigures_captions if cap.page == page_num
-        ]
-        caption_boxes = [cap.caption_boundary for cap in pf_page_captions]
+        pf_page_captions = pdffigures_captions.get_page(page_num)
+        caption_boxes = pdffigures_captions.get_page_boxes(page_num)
         (figure_indices, caption_indices) = figure_utils.pair_boxes(
             figure_boxes, caption_boxes
         )
@@ -0,0 +1,187 @@
+"""Test deepfigures.extraction.cache"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import unittest
+
+from deepfigures import settings
+from deepfigures.extraction import cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class TestGetResultKey(unittest.TestCase):
+    """Test ``get_result_key``."""
+
+    def test_changes_with_model(self):
+        """Test the key depends on the model iteration."""
+        model = {'save_dir': '/weights/', 'iteration': 1}
+        other_model = {'save_dir': '/weights/', 'iteration': 2}
+        self.assertEqual(
+            cache.get_result_key(model=model),
+            cache.get_result_key(model=dict(model)))
+        self.assertNotEqual(
+            cache.get_result_key(model=model),
+            cache.get_result_key(model=other_model))
+
+    def test_changes_with_dpi(self):
+        """Test the key depends on the dpis."""
+        self.assertNotEqual(
+            cache.get_result_key(inference_dpi=100),
+            cache.get_result_key(inference_dpi=150))
+
+    def test_changes_with_page_triage(self):
+        """Test the key depends on the page triage and its calibration."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            calibration_path = os.path.join(tmp_dir, 'calibration.json')
+            with open(calibration_path, 'w') as f_out:
+                f_out.write('[[0.1, 1]]')
+            keys = [
+                cache.get_result_key(),
+                cache.get_result_key(
+                    page_triage_recall_target=0.99,
+                    page_triage_calibration_path=calibration_path),
+                cache.get_result_key(
+                    page_triage_recall_target=0.9,
+                    page_triage_calibration_path=calibration_path)
+            ]
+            with open(calibration_path, 'w') as f_out:
+                f_out.write('[[0.2, 1]]')
+            keys.append(
+                cache.get_result_key(
+                    page_triage_recall_target=0.9,
+                    page_triage_calibration_path=calibration_path))
+        self.assertEqual(len(set(keys)), len(keys))
+        # the calibration is ignored while page triage is disabled
+        self.assertEqual(
+            cache.get_result_key(),
+            cache.get_result_key(page_triage_calibration_path='/missing.json'))
+
+    def test_reads_settings_when_called(self):
+        """Test settings changed after import change the key."""
+        recall_target = settings.PAGE_TRIAGE_RECALL_TARGET
+        inference_dpi = settings.DEFAULT_INFERENCE_DPI
+        default_key = cache.get_result_key()
+        try:
+            settings.PAGE_TRIAGE_RECALL_TARGET = 0.99
+            triage_key = cache.get_result_key()
+            settings.PAGE_TRIAGE_RECALL_TARGET = recall_target
+            settings.DEFAULT_INFERENCE_DPI = inference_dpi + 50
+            dpi_key = cache.get_result_key()
+        finally:
+            settings.PAGE_TRIAGE_RECALL_TARGET = recall_target
+            settings.DEFAULT_INFERENCE_DPI = inference_dpi
+        self.assertNotEqual(triage_key, default_key)
+        self.assertNotEqual(dpi_key, default_key)
+        self.assertEqual(
+            triage_key, cache.get_result_key(page_triage_recall_target=0.99))
+        self.assertEqual(cache.get_result_key(), default_key)
+
+
+class TestRecordSize(unittest.TestCase):
+    """Test ``record_size`` and ``get_recorded_size``."""
+
+    def test_reads_record(self):
+        """Test the recorded size is used until it's recorded again."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'data'), 'wb') as f_out:
+                f_out.write(b'0' * 100)
+            self.assertEqual(cache.record_size(tmp_dir), 100)
+            with open(os.path.join(tmp_dir, 'more-data'), 'wb') as f_out:
+                f_out.write(b'0' * 50)
+            self.assertEqual(cache.get_recorded_size(tmp_dir), 100)
+            self.assertGreaterEqual(cache.record_size(tmp_dir), 150)
+            self.assertGreaterEqual(cache.get_recorded_size(tmp_dir), 150)
+
+    def test_records_missing_size(self):
+        """Test a missing size is computed and recorded."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'data'), 'wb') as f_out:
+                f_out.write(b'0' * 100)
+            self.assertEqual(cache.get_recorded_size(tmp_dir), 100)
+            self.assertTrue(
+                os.path.isfile(os.path.join(tmp_dir, cache.SIZE_FILE_NAME)))
+
+
+class TestEvictLRU(unittest.TestCase):
+    """Test ``evict_lru``."""
+
+    def _make_entry(self, cache_dir, name, size, last_used):
+        # name results directories after a hash, like the pipeline does
+        name = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        path = os.path.join(cache_dir, name)
+        os.makedirs(path)
+        with open(os.path.join(path, 'data'), 'wb') as f_out:
+            f_out.write(b'0' * size)
+        cache.mark_used(path)
+        os.utime(
+            os.path.join(path, cache.LAST_USED_FILE_NAME),
+            (last_used, last_used))
+        return path
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest entries are evicted first."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            oldest = self._make_entry(tmp_dir, 'a', 100, 1000)
+            middle = self._make_entry(tmp_dir, 'b', 100, 2000)
+            newest = self._make_entry(tmp_dir, 'c', 100, 3000)
+
+            evicted = cache.evict_lru(tmp_dir, max_size=150)
+
+            self.assertEqual(evicted, [oldest, middle])
+            self.assertTrue(os.path.exists(newest))
+
+    def test_keeps_protected_entries(self):
+        """Test entries in ``keep`` are never evicted."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            oldest = self._make_entry(tmp_dir, 'a', 100, 1000)
+            newest = self._make_entry(tmp_dir, 'b', 100, 2000)
+
+            evicted = cache.evict_lru(tmp_dir, max_size=150, keep=[oldest])
+
+            self.assertEqual(evicted, [newest])
+            self.assertTrue(os.path.exists(oldest))
+
+    def test_uses_recorded_sizes(self):
+        """Test entries are sized from their records, not their files."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            oldest = self._make_entry(tmp_dir, 'a', 100, 1000)
+            newest = self._make_entry(tmp_dir, 'b', 100, 2000)
+            for path in [oldest, newest]:
+                size_path = os.path.join(path, cache.SIZE_FILE_NAME)
+                with open(size_path, 'w') as f_out:
+                    f_out.write('10')
+
+            self.assertEqual(cache.evict_lru(tmp_dir, max_size=50), [])
+
+    def test_no_eviction_under_limit(self):
+        """Test nothing is evicted while under the limit."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self._make_entry(tmp_dir, 'a', 100, 1000)
+
+            self.assertEqual(cache.evict_lru(tmp_dir, max_size=1000), [])
+
+    def test_keeps_other_directories(self):
+        """Test directories that aren't results are never evicted."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            entry = self._make_entry(tmp_dir, 'a', 100, 2000)
+            other = os.path.join(tmp_dir, 'figures')
+            os.makedirs(other)
+            with open(os.path.join(other, 'data'), 'wb') as f_out:
+                f_out.write(b'0' * 100)
+            os.utime(other, (1000, 1000))
+            # named like a results directory but never marked used
+            unmarked = os.path.join(tmp_dir, '0' * 40)
+            os.makedirs(unmarked)
+            with open(os.path.join(unmarked, 'data'), 'wb') as f_out:
+                f_out.write(b'0' * 100)
+            os.utime(unmarked, (1000, 1000))
+
+            evicted = cache.evict_lru(tmp_dir, max_size=50)
+
+            self.assertEqual(evicted, [entry])
+            self.assertTrue(os.path.exists(other))
+            self.assertTrue(os.path.exists(unmarked))
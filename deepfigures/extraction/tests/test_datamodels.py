@@ -0,0 +1,170 @@
+"""Test deepfigures.extraction.datamodels"""
+
+import logging
+import unittest
+
+import numpy as np
+
+from deepfigures.extraction import datamodels
+from deepfigures.settings import BACKGROUND_COLOR
+
+
+logger = logging.getLogger(__name__)
+
+
+def _crop_whitespace_edges_reference(box, im):
+    """Crop whitespace by painting the whole page outside ``box``."""
+    (x1, y1, x2, y2) = box.get_rounded()
+    white_im = im.copy()
+    white_im[:, :x1] = BACKGROUND_COLOR
+    white_im[:, x2:] = BACKGROUND_COLOR
+    white_im[:y1, :] = BACKGROUND_COLOR
+    white_im[y2:, :] = BACKGROUND_COLOR
+    is_white = (white_im == BACKGROUND_COLOR).all(axis=2)
+    nonwhite_columns = np.where(~is_white.all(axis=0))[0]
+    nonwhite_rows = np.where(~is_white.all(axis=1))[0]
+    if len(nonwhite_columns) == 0 or len(nonwhite_rows) == 0:
+        return None
+    return datamodels.BoxClass(
+        x1=float(nonwhite_columns.min()),
+        y1=float(nonwhite_rows.min()),
+        x2=float(nonwhite_columns.max() + 1),
+        y2=float(nonwhite_rows.max() + 1))
+
+
+class TestCropWhitespaceEdges(unittest.TestCase):
+    """Test ``BoxClass.crop_whitespace_edges`` and the batched version."""
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.im = np.full((120, 90, 3), BACKGROUND_COLOR, dtype=np.uint8)
+        for _ in range(10):
+            (y, x) = random_state.randint(0, 110), random_state.randint(0, 80)
+            self.im[y:y + random_state.randint(1, 10),
+                    x:x + random_state.randint(1, 10)] = 0
+        self.boxes = [datamodels.BoxClass(x1=0, y1=0, x2=90, y2=120)]
+        for _ in range(50):
+            (x1, x2) = sorted(random_state.uniform(0, 90, size=2))
+            (y1, y2) = sorted(random_state.uniform(0, 120, size=2))
+            self.boxes.append(
+                datamodels.BoxClass(x1=x1, y1=y1, x2=x2, y2=y2))
+
+    def test_matches_reference(self):
+        """Test cropping matches painting the page outside the box."""
+        for box in self.boxes:
+            expected = _crop_whitespace_edges_reference(box, self.im)
+            actual = box.crop_whitespace_edges(self.im)
+            if expected is None:
+                self.assertIsNone(actual)
+            else:
+                self.assertEqual(expected.to_dict(), actual.to_dict())
+
+    def test_many_matches_single(self):
+        """Test crop_whitespace_edges_many matches cropping each box."""
+        actual_boxes = datamodels.crop_whitespace_edges_many(
+            self.boxes, self.im)
+        self.assertEqual(len(actual_boxes), len(self.boxes))
+        for box, actual in zip(self.boxes, actual_boxes):
+            expected = box.crop_whitespace_edges(self.im)
+            if expected is None:
+                self.assertIsNone(actual)
+            else:
+                self.assertEqual(expected.to_dict(), actual.to_dict())
+
+    def test_clips_to_page(self):
+        """Test boxes extending off the page are clipped to it."""
+        im = np.full((10, 10, 3), BACKGROUND_COLOR, dtype=np.uint8)
+        im[0, 0] = 0
+        box = datamodels.BoxClass(x1=-5, y1=-5, x2=20, y2=20)
+        expected = {'x1': 0.0, 'y1': 0.0, 'x2': 1.0, 'y2': 1.0}
+        self.assertEqual(box.crop_whitespace_edges(im).to_dict(), expected)
+        self.assertEqual(
+            datamodels.crop_whitespace_edges_many([box], im)[0].to_dict(),
+            expected)
+
+    def test_foreground_boxes(self):
+        """Test foreground boxes count as a masked out extra channel."""
+        foreground_boxes = [
+            datamodels.BoxClass(x1=10.4, y1=20.6, x2=50.2, y2=30.5),
+            datamodels.BoxClass(x1=-5, y1=100, x2=30, y2=130)
+        ]
+        im_with_mask = np.pad(
+            self.im, pad_width=[(0, 0), (0, 0), (0, 1)],
+            mode='constant', constant_values=BACKGROUND_COLOR)
+        for foreground_box in foreground_boxes:
+            (x1, y1, x2, y2) = foreground_box._get_clipped_rounded(
+                self.im.shape)
+            im_with_mask[y1:y2, x1:x2, 3] = 0
+        expected_boxes = datamodels.crop_whitespace_edges_many(
+            self.boxes, im_with_mask)
+        actual_boxes = datamodels.crop_whitespace_edges_many(
+            self.boxes, self.im, foreground_boxes=foreground_boxes)
+        self.assertEqual(
+            [box and box.to_dict() for box in expected_boxes],
+            [box and box.to_dict() for box in actual_boxes])
+
+
+class TestBoxArray(unittest.TestCase):
+    """Test ``BoxArray``."""
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.boxes = []
+        for _ in range(20):
+            (x1, x2) = sorted(random_state.uniform(0, 1000, size=2))
+            (y1, y2) = sorted(random_state.uniform(0, 1000, size=2))
+            self.boxes.append(
+                datamodels.BoxClass(x1=x1, y1=y1, x2=x2, y2=y2))
+        self.box_array = datamodels.BoxArray.from_boxes(self.boxes)
+
+    def test_round_trips(self):
+        """Test converting to and from BoxClass and JSON is lossless."""
+        self.assertEqual(
+            [box.to_dict() for box in self.box_array.to_boxes()],
+            [box.to_dict() for box in self.boxes])
+        self.assertEqual(
+            self.box_array.to_dicts(),
+            [box.to_dict() for box in self.boxes])
+        self.assertEqual(
+            datamodels.BoxArray.from_dicts(
+                self.box_array.to_dicts()).coords.tolist(),
+            self.box_array.coords.tolist())
+
+    def test_empty(self):
+        """Test an empty BoxArray has shape (0, 4)."""
+        box_array = datamodels.BoxArray.from_boxes([])
+        self.assertEqual(len(box_array), 0)
+        self.assertEqual(box_array.iou_matrix(self.box_array).shape, (0, 20))
+
+    def test_operations_match_box_class(self):
+        """Test the elementwise operations match BoxClass."""
+        page_shape = (500, 400, 3)
+        operations = [
+            (lambda b: b.rescale(0.5), lambda b: b.rescale(0.5)),
+            (lambda b: b.expand_box(7.5), lambda b: b.expand_boxes(7.5)),
+            (lambda b: b.crop_to_page(page_shape),
+             lambda b: b.crop_to_page(page_shape)),
+            (lambda b: b.resize_by_page((1000, 800), page_shape),
+             lambda b: b.resize_by_page((1000, 800), page_shape))
+        ]
+        for box_op, array_op in operations:
+            self.assertEqual(
+                array_op(self.box_array).to_dicts(),
+                [box_op(box).to_dict() for box in self.boxes])
+        self.assertEqual(
+            self.box_array.get_areas().tolist(),
+            [box.get_area() for box in self.boxes])
+
+    def test_matrices_match_box_class(self):
+        """Test the pairwise matrices exactly match BoxClass."""
+        (a_boxes, b_boxes) = (self.boxes[:8], self.boxes[8:])
+        (a_array, b_array) = (self.box_array[:8], self.box_array[8:])
+        self.assertEqual(
+            a_array.distance_matrix(b_array).tolist(),
+            [[a.distance_to_other(b) for b in b_boxes] for a in a_boxes])
+        self.assertEqual(
+            a_array.iou_matrix(b_array).tolist(),
+            [[a.iou(b) for b in b_boxes] for a in a_boxes])
+        self.assertEqual(
+            a_array.iou(b_array[:8]).tolist(),
+            [a.iou(b) for a, b in zip(a_boxes, b_boxes[:8])])
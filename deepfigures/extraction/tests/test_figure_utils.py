@@ -0,0 +1,244 @@
+"""Test deepfigures.extraction.figure_utils"""
+
+import json
+import logging
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import optimize
+from skimage import measure
+
+from deepfigures.extraction import figure_utils
+from deepfigures.extraction.datamodels import BoxArray, BoxClass
+
+
+logger = logging.getLogger(__name__)
+
+
+def _pair_boxes_reference(a_boxes, b_boxes):
+    """Pair boxes by filling the cost matrix one pair at a time."""
+    cost_matrix = np.zeros([len(a_boxes), len(b_boxes)])
+    for (a_idx, a_box) in enumerate(a_boxes):
+        for (b_idx, b_box) in enumerate(b_boxes):
+            cost_matrix[a_idx, b_idx] = a_box.distance_to_other(b_box)
+    return optimize.linear_sum_assignment(cost_matrix)
+
+
+def _find_box_components_reference(box_mask, caption_mask):
+    """Scan the whole page for each labeled component and its caption."""
+    components = []
+    labels = measure.label(box_mask)
+    for label in np.unique(labels)[1:]:
+        (box_ys, box_xs) = np.where(labels == label)
+        full_box = BoxClass(
+            x1=float(min(box_xs)), y1=float(min(box_ys)),
+            x2=float(max(box_xs) + 1), y2=float(max(box_ys) + 1))
+        inside_mask = np.zeros_like(caption_mask)
+        inside_mask[min(box_ys):max(box_ys) + 1, min(box_xs):max(box_xs) + 1] = True
+        (cap_ys, cap_xs) = np.where(caption_mask & inside_mask)
+        caption_box = None
+        if len(cap_ys) > 0:
+            caption_box = BoxClass(
+                x1=float(min(cap_xs)), y1=float(min(cap_ys)),
+                x2=float(max(cap_xs) + 1), y2=float(max(cap_ys) + 1))
+        components.append((full_box, caption_box, (box_ys[0], box_xs[0])))
+    return components
+
+
+def _im_diff_reference(a, b):
+    """Mask each channel with a tiled copy of the changed pixels."""
+    mask = np.any(a - b != 0, axis=2)
+    rgb_mask = np.transpose(np.tile(mask, (3, 1, 1)), axes=[1, 2, 0])
+    diff_image = np.copy(a)
+    diff_image[np.logical_not(rgb_mask)] = 255
+    return diff_image
+
+
+# a stand-in for pdflatex that logs its arguments, run times and whether it
+# found an aux file from a previous pass, takes a while, and writes an aux
+# file and an empty pdf, or fails on sources named fail.tex
+FAKE_PDFLATEX = """#!{python}
+import json, os, sys, time
+args = sys.argv[1:]
+start = time.time()
+time.sleep(0.5)
+(src_tex, out_arg) = (args[-1], [arg for arg in args if arg.startswith('-output-directory=')][0])
+(out_dir, jobname) = (out_arg.split('=', 1)[1], os.path.splitext(os.path.basename(src_tex))[0])
+aux_path = os.path.join(out_dir, jobname + '.aux')
+found_aux = os.path.isfile(aux_path)
+with open(os.path.join(os.path.dirname(__file__), 'calls.jsonl'), 'a') as f_out:
+    f_out.write(json.dumps([args, start, time.time(), found_aux]) + '\\n')
+if jobname == 'fail':
+    sys.exit(1)
+open(aux_path, 'w').close()
+if '-draftmode' not in args:
+    open(os.path.join(out_dir, jobname + '.pdf'), 'w').close()
+"""
+
+
+class TestCallPdflatex(unittest.TestCase):
+    """Test ``call_pdflatex`` and ``call_pdflatex_with_shared_first_pass``."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.bin_path = os.path.join(self.tmpdir.name, 'pdflatex')
+        with open(self.bin_path, 'w') as f_out:
+            f_out.write(FAKE_PDFLATEX.format(python=sys.executable))
+        os.chmod(self.bin_path, os.stat(self.bin_path).st_mode | stat.S_IEXEC)
+        self.executable_path = figure_utils.PDFLATEX_EXECUTABLE_PATH
+        figure_utils.PDFLATEX_EXECUTABLE_PATH = self.bin_path
+        self.dest_dir = os.path.join(self.tmpdir.name, 'out/')
+
+    def tearDown(self):
+        figure_utils.PDFLATEX_EXECUTABLE_PATH = self.executable_path
+        self.tmpdir.cleanup()
+
+    def get_calls(self):
+        with open(os.path.join(self.tmpdir.name, 'calls.jsonl')) as f_in:
+            return [json.loads(line) for line in f_in]
+
+    def test_draft_first_pass(self):
+        """Test only the first pass runs with -draftmode."""
+        pdf = figure_utils.call_pdflatex(
+            'color.tex', self.tmpdir.name, self.dest_dir, draft_first_pass=True)
+        self.assertEqual(pdf, self.dest_dir + 'color.pdf')
+        self.assertTrue(os.path.isfile(pdf))
+        self.assertEqual(
+            [('-draftmode' in call[0], call[3]) for call in self.get_calls()],
+            [(True, False), (False, True)])
+
+    def test_shared_first_pass(self):
+        """Test the first pass's aux files are used by every final pass."""
+        pdfs = figure_utils.call_pdflatex_with_shared_first_pass(
+            ['color.tex', 'black.tex'], self.tmpdir.name, self.dest_dir,
+            draft_first_pass=True)
+        self.assertEqual(
+            pdfs, [self.dest_dir + 'color.pdf', self.dest_dir + 'black.pdf'])
+        for pdf in pdfs:
+            self.assertTrue(os.path.isfile(pdf))
+        calls = self.get_calls()
+        self.assertEqual(
+            [(call[0][-1], '-draftmode' in call[0]) for call in calls[:1]],
+            [('color.tex', True)])
+        self.assertEqual(
+            sorted((call[0][-1], call[3]) for call in calls[1:]),
+            [('black.tex', True), ('color.tex', True)])
+        # the final passes each have their own output directory
+        self.assertEqual(
+            len({arg for call in calls for arg in call[0]
+                 if arg.startswith('-output-directory=')}), 3)
+        # and only the pdfs are left behind
+        self.assertEqual(
+            sorted(os.listdir(self.dest_dir)), ['black.pdf', 'color.pdf'])
+
+    def test_shared_first_pass_failure(self):
+        """Test a failing final pass raises a LatexException."""
+        with self.assertRaises(figure_utils.LatexException):
+            figure_utils.call_pdflatex_with_shared_first_pass(
+                ['black.tex', 'fail.tex'], self.tmpdir.name, self.dest_dir)
+        self.assertTrue(os.path.isfile(self.dest_dir + 'black.pdf'))
+        self.assertEqual(os.listdir(self.dest_dir), ['black.pdf'])
+
+
+class TestImDiff(unittest.TestCase):
+    """Test ``im_diff``."""
+
+    def test_matches_reference(self):
+        """Test only pixels with a changed channel keep a's colors."""
+        random_state = np.random.RandomState(0)
+        a = random_state.randint(0, 256, size=(40, 30, 3)).astype(np.uint8)
+        b = a.copy()
+        changed = random_state.rand(40, 30) < 0.2
+        b[changed, random_state.randint(0, 3, size=changed.sum())] ^= 1
+        diff = figure_utils.im_diff(a, b)
+        np.testing.assert_array_equal(diff, _im_diff_reference(a, b))
+        np.testing.assert_array_equal(diff[changed], a[changed])
+        self.assertTrue((diff[~changed] == 255).all())
+        # a isn't modified
+        self.assertFalse(np.array_equal(a, diff))
+
+
+class TestGetChannelwiseColorMasks(unittest.TestCase):
+    """Test ``get_channelwise_color_masks``."""
+
+    def test_matches_reference(self):
+        """Test the masks match comparing each group's colors."""
+        random_state = np.random.RandomState(0)
+        palette = np.array(
+            [[255, 0, 0], [255, 242, 0], [0, 255, 0], [0, 0, 255],
+             [0, 0, 0], [0, 255, 255], [255, 255, 255], [17, 0, 0]],
+            dtype=np.uint8)
+        im = palette[random_state.randint(0, len(palette), size=(40, 30))]
+        color_groups = [
+            [[255, 0, 0], [255, 242, 0]],
+            [[0, 255, 0], [0, 0, 255]],
+        ]
+        masks = figure_utils.get_channelwise_color_masks(im, color_groups)
+        self.assertEqual(len(masks), 2)
+        for (mask, (color_a, color_b)) in zip(masks, color_groups):
+            np.testing.assert_array_equal(
+                mask, np.logical_or(im == color_a, im == color_b).all(axis=2))
+        # channelwise, so black matches the caption colors' channels too
+        self.assertTrue(masks[1][(im == 0).all(axis=2)].all())
+
+
+class TestFindBoxComponents(unittest.TestCase):
+    """Test ``find_box_components``."""
+
+    def test_matches_reference(self):
+        """Test the components match scanning the page for each label."""
+        random_state = np.random.RandomState(0)
+        for _ in range(20):
+            box_mask = np.zeros((200, 150), dtype=bool)
+            caption_mask = np.zeros((200, 150), dtype=bool)
+            for _ in range(random_state.randint(0, 8)):
+                (y1, x1) = random_state.randint(0, 180), random_state.randint(0, 130)
+                (y2, x2) = (
+                    min(y1 + random_state.randint(3, 80), 199),
+                    min(x1 + random_state.randint(3, 80), 149))
+                box_mask[y1:y2 + 1, [x1, x2]] = True
+                box_mask[[y1, y2], x1:x2 + 1] = True
+                (cy, cx) = random_state.randint(y1, y2 + 1), random_state.randint(x1, x2 + 1)
+                caption_mask[cy:cy + 4, cx:cx + 20] = True
+            # diagonal neighbours are connected
+            box_mask[random_state.randint(0, 200, 10), random_state.randint(0, 150, 10)] = True
+            expected = _find_box_components_reference(box_mask, caption_mask)
+            actual = figure_utils.find_box_components(box_mask, caption_mask)
+            self.assertEqual(len(actual), len(expected))
+            for ((full_box, caption_box, first_pixel),
+                 (expected_full_box, expected_caption_box, expected_first_pixel)) in zip(actual, expected):
+                self.assertEqual(full_box.to_dict(), expected_full_box.to_dict())
+                self.assertEqual(
+                    caption_box and caption_box.to_dict(),
+                    expected_caption_box and expected_caption_box.to_dict())
+                self.assertEqual(first_pixel, expected_first_pixel)
+
+
+class TestPairBoxes(unittest.TestCase):
+    """Test ``pair_boxes``."""
+
+    def _random_boxes(self, random_state, num_boxes):
+        boxes = []
+        for _ in range(num_boxes):
+            # round to a coarse grid so that ties in distance are common
+            (x1, x2) = sorted(random_state.randint(0, 20, size=2) * 10.0)
+            (y1, y2) = sorted(random_state.randint(0, 20, size=2) * 10.0)
+            boxes.append(BoxClass(x1=x1, y1=y1, x2=x2, y2=y2))
+        return boxes
+
+    def test_matches_reference(self):
+        """Test pairings are identical to the per-pair cost matrix."""
+        random_state = np.random.RandomState(0)
+        for _ in range(200):
+            a_boxes = self._random_boxes(random_state, random_state.randint(0, 5))
+            b_boxes = self._random_boxes(random_state, random_state.randint(0, 5))
+            expected = _pair_boxes_reference(a_boxes, b_boxes)
+            for (a, b) in [(a_boxes, b_boxes),
+                           (BoxArray.from_boxes(a_boxes), BoxArray.from_boxes(b_boxes))]:
+                actual = figure_utils.pair_boxes(a, b)
+                self.assertEqual(list(actual[0]), list(expected[0]))
+                self.assertEqual(list(actual[1]), list(expected[1]))
@@ -0,0 +1,109 @@
+"""Test deepfigures.extraction.page_triage"""
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from deepfigures.extraction import page_triage
+
+
+def make_text_page(height=1100, width=850):
+    """Make a white page with lines of dark words on it."""
+    random_state = np.random.RandomState(0)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y in range(100, height - 100, 16):
+        x = 100
+        while x < width - 150:
+            word_width = random_state.randint(15, 60)
+            page[y:y + 9, x:x + word_width] = 0
+            x += word_width + 8
+    return page
+
+
+class TestGetPageStatistics(unittest.TestCase):
+    """Test ``get_page_statistics``."""
+
+    def test_blank_page(self):
+        """Test a blank page has no ink and scores 0."""
+        page = np.full((1100, 850, 3), 255, dtype=np.uint8)
+        statistics = page_triage.get_page_statistics(page)
+        self.assertEqual(statistics.ink_density, 0.)
+        self.assertEqual(statistics.get_score(), 0.)
+
+    def test_text_page(self):
+        """Test a page of text has ink but no non-text regions."""
+        statistics = page_triage.get_page_statistics(make_text_page())
+        self.assertGreater(statistics.ink_density, 0.1)
+        self.assertEqual(statistics.nontext_area, 0.)
+        self.assertEqual(statistics.get_score(), 0.)
+
+    def test_figure_page(self):
+        """Test a figure's outline counts its whole area as non-text."""
+        page = make_text_page()
+        page[280:720] = 255
+        page[300:700, 200:204] = 0
+        page[696:700, 200:600] = 0
+        statistics = page_triage.get_page_statistics(page)
+        self.assertAlmostEqual(
+            statistics.nontext_area, 400 * 400 / (1100 * 850), delta=0.01)
+        self.assertEqual(statistics.get_score(), statistics.nontext_area)
+
+    def test_color_page(self):
+        """Test colored pixels are measured, even if they aren't ink."""
+        page = make_text_page()
+        page[:550, :, 0] = 255
+        page[:550, :, 1:] = 128
+        statistics = page_triage.get_page_statistics(page)
+        self.assertAlmostEqual(statistics.color_area, 0.5, delta=0.01)
+        self.assertGreaterEqual(statistics.get_score(), statistics.color_area)
+
+    def test_grayscale_page(self):
+        """Test grayscale pages match their RGB counterparts."""
+        page = make_text_page()
+        page[300:700, 200:600] = 0
+        rgb_statistics = page_triage.get_page_statistics(page)
+        gray_statistics = page_triage.get_page_statistics(page[:, :, 0])
+        self.assertEqual(rgb_statistics.to_dict(), gray_statistics.to_dict())
+
+
+class TestGetThresholdForRecall(unittest.TestCase):
+    """Test ``get_threshold_for_recall``."""
+
+    def test_threshold(self):
+        """Test the threshold keeps at least the target share."""
+        scores = [0., 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+        self.assertEqual(
+            page_triage.get_threshold_for_recall(scores, 1.), 0.)
+        self.assertEqual(
+            page_triage.get_threshold_for_recall(scores, 0.9), 0.1)
+        self.assertEqual(
+            page_triage.get_threshold_for_recall(scores, 0.85), 0.1)
+        self.assertEqual(
+            page_triage.get_threshold_for_recall(scores, 0.), 0.9)
+        self.assertEqual(page_triage.get_threshold_for_recall([], 0.9), 0.)
+
+    def test_invalid_recall_target(self):
+        """Test recall targets outside [0, 1] are rejected."""
+        with self.assertRaises(ValueError):
+            page_triage.get_threshold_for_recall([0.5], 1.5)
+
+
+class TestPageTriage(unittest.TestCase):
+    """Test ``PageTriage``."""
+
+    def test_should_detect(self):
+        """Test text pages are skipped and figure pages are not."""
+        figure_page = make_text_page()
+        figure_page[300:700, 200:600] = 0
+        with tempfile.TemporaryDirectory() as tmpdir:
+            calibration_path = os.path.join(tmpdir, 'calibration.json')
+            with open(calibration_path, 'w') as f_out:
+                json.dump({'figure_page_scores': [0.05, 0.1, 0.2]}, f_out)
+            triage = page_triage.PageTriage.from_calibration(
+                calibration_path, recall_target=1.)
+        self.assertEqual(triage.threshold, 0.05)
+        self.assertFalse(triage.should_detect(make_text_page()))
+        self.assertTrue(triage.should_detect(figure_page))
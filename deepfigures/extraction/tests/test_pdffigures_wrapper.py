@@ -0,0 +1,83 @@
+"""Test deepfigures.extraction.pdffigures_wrapper"""
+
+import unittest
+
+from deepfigures.extraction import pdffigures_wrapper
+
+
+def make_boundary(x1, y1):
+    return {'x1': x1, 'y1': y1, 'x2': x1 + 100., 'y2': y1 + 10.}
+
+
+PDFFIGURES_OUTPUT = {
+    'figures': [
+        {
+            'captionBoundary': make_boundary(72., 144.),
+            'page': 2,
+            'caption': 'Figure 1: A plot.',
+            'name': '1',
+            'figType': 'Figure'
+        },
+        {
+            'captionBoundary': make_boundary(36., 72.),
+            'page': 0,
+            'caption': 'Table 1: Some numbers.',
+            'name': '1',
+            'figType': 'Table'
+        },
+    ],
+    'regionless-captions': [
+        {
+            'boundary': make_boundary(0., 720.),
+            'page': 2,
+            'text': 'Figure 2: Another plot.',
+            'name': '2',
+            'figType': 'Figure'
+        },
+    ]
+}
+
+
+class TestGetCaptions(unittest.TestCase):
+    """Test ``get_captions``."""
+
+    def setUp(self):
+        self.captions = pdffigures_wrapper.get_captions(
+            PDFFIGURES_OUTPUT, target_dpi=144)
+
+    def test_flat_list(self):
+        """Test the captions behave as a list in pdffigures2's order."""
+        self.assertEqual(len(self.captions), 3)
+        self.assertEqual(
+            [caption.caption_text for caption in self.captions],
+            ['Figure 1: A plot.', 'Table 1: Some numbers.',
+             'Figure 2: Another plot.'])
+        self.assertEqual(self.captions[-1].name, '2')
+        self.assertEqual(len(self.captions[:2]), 2)
+
+    def test_boxes_are_rescaled(self):
+        """Test caption boundaries are scaled from 72 dpi."""
+        self.assertEqual(
+            self.captions[0].caption_boundary.to_dict(),
+            {'x1': 144., 'y1': 288., 'x2': 344., 'y2': 308.})
+
+    def test_get_page(self):
+        """Test looking up the captions and boxes of a page."""
+        self.assertEqual(
+            [caption.name for caption in self.captions.get_page(2)],
+            ['1', '2'])
+        self.assertEqual(
+            [box.to_dict() for box in self.captions.get_page_boxes(2)],
+            [caption.caption_boundary.to_dict()
+             for caption in self.captions.get_page(2)])
+        self.assertEqual(
+            [caption.figure_type for caption in self.captions.get_page(0)],
+            ['Table'])
+        self.assertEqual(self.captions.get_page(1), [])
+        self.assertEqual(self.captions.get_page_boxes(1), [])
+
+    def test_empty_output(self):
+        """Test outputs without captions give no captions."""
+        captions = pdffigures_wrapper.get_captions({})
+        self.assertEqual(len(captions), 0)
+        self.assertEqual(captions.get_page(0), [])
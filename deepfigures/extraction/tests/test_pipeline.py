@@ -2,6 +2,7 @@
 
 import logging
 import tempfile
+import threading
 import unittest
 
 from deepfigures.extraction import pipeline
@@ -27,3 +28,52 @@ class TestFigureExtractionPipeline(unittest.TestCase):
                 self,
                 expected_json='/work/tests/data/endtoend/_work_tests_data_endtoend_paper.pdf-result.json',
                 actual_json=figure_extraction.deepfigures_json_path)
+
+
+class TestRunStages(unittest.TestCase):
+    """Test ``run_stages``."""
+
+    def test_passes_dependency_results(self):
+        """Test stages receive their dependencies' results."""
+        results, timings = pipeline.run_stages([
+            pipeline.PipelineStage('a', lambda: 1),
+            pipeline.PipelineStage('b', lambda: 2),
+            pipeline.PipelineStage(
+                'c', lambda a, b: a + b, dependencies=['a', 'b'])
+        ])
+        self.assertEqual(results, {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(sorted(timings.keys()), ['a', 'b', 'c'])
+
+    def test_runs_independent_stages_concurrently(self):
+        """Test independent stages overlap in time."""
+        barrier = threading.Barrier(2, timeout=10)
+        # each stage waits for the other, so this only finishes if they
+        # run at the same time.
+        results, _ = pipeline.run_stages([
+            pipeline.PipelineStage('a', barrier.wait),
+            pipeline.PipelineStage('b', barrier.wait)
+        ])
+        self.assertEqual(sorted(results.keys()), ['a', 'b'])
+
+    def test_raises_stage_errors(self):
+        """Test an error in a stage is raised from run_stages."""
+        def fail():
+            raise RuntimeError('stage failed')
+
+        with self.assertRaises(RuntimeError):
+            pipeline.run_stages([pipeline.PipelineStage('fail', fail)])
+
+    def test_rejects_bad_dependencies(self):
+        """Test unknown and circular dependencies are rejected."""
+        with self.assertRaises(ValueError):
+            pipeline.run_stages([
+                pipeline.PipelineStage(
+                    'a', lambda b: b, dependencies=['b'])
+            ])
+        with self.assertRaises(ValueError):
+            pipeline.run_stages([
+                pipeline.PipelineStage(
+                    'a', lambda b: b, dependencies=['b']),
+                pipeline.PipelineStage(
+                    'b', lambda a: a, dependencies=['a'])
+            ])
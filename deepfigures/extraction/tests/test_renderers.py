@@ -1,6 +1,7 @@
 """Tests for deepfigures.extraction.renderers"""
 
 import contextlib
+import io
 import logging
 import os
 import shutil
@@ -12,7 +13,9 @@ import numpy as np
 from scipy.misc.pilutil import imread
 import pytest
 
-from deepfigures.extraction import renderers
+from deepfigures.extraction import (
+    exceptions,
+    renderers)
 from deepfigures import settings
 
 
@@ -42,6 +45,36 @@ class IsPrintableTest(unittest.TestCase):
         self.assertFalse(renderers.isprintable('afj\x0eqq'))
 
 
+class ReadPpmStreamTest(unittest.TestCase):
+    """Test deepfigures.renderers.read_ppm_stream."""
+
+    def test_reads_concatenated_images(self):
+        """Test read_ppm_stream yields each image in the stream."""
+        images = [
+            np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3),
+            np.full((4, 1, 3), 255, dtype=np.uint8)
+        ]
+        stream = io.BytesIO(b''.join(
+            'P6\n{width} {height}\n255\n'.format(
+                width=image.shape[1],
+                height=image.shape[0]).encode('ascii') + image.tobytes()
+            for image in images))
+        read_images = list(renderers.read_ppm_stream(stream))
+        self.assertEqual(len(read_images), len(images))
+        for read_image, image in zip(read_images, images):
+            np.testing.assert_array_equal(read_image, image)
+
+    def test_empty_stream(self):
+        """Test read_ppm_stream yields nothing for an empty stream."""
+        self.assertEqual(list(renderers.read_ppm_stream(io.BytesIO())), [])
+
+    def test_truncated_stream(self):
+        """Test read_ppm_stream raises an error on truncated data."""
+        stream = io.BytesIO(b'P6\n2 2\n255\n' + bytes(5))
+        with self.assertRaises(exceptions.PDFProcessingError):
+            list(renderers.read_ppm_stream(stream))
+
+
 class PDFRendererTest(unittest.TestCase):
     """Tests for deepfigures.renderers.PDFRenderer.
 
@@ -219,6 +252,69 @@ class PDFRendererSubclassTestMixin(object):
         with self.setup_and_teardown(ext=ext):
             self._test_render_image_ext(ext=ext)
 
+    def test_render_arrays(self):
+        """Test render_arrays yields the same pages as render."""
+        ext = 'png'
+        with self.setup_and_teardown(ext=ext):
+            page_arrays = list(self.pdf_renderer.render_arrays(
+                pdf_path=self.pdf_path,
+                check_retcode=True))
+            self.assertEqual(len(page_arrays), self.pdf_num_pages)
+            # nothing should be written to disk by default
+            self.assertEqual(os.listdir(self.tmp_output_dir), [])
+            for page_num, page_array in enumerate(page_arrays, 1):
+                reference_image = imread(
+                    os.path.join(
+                        self.MANUALLY_INSPECTED_RENDERINGS_DIR,
+                        self.pdf_rendered_page_template.format(
+                            page_num=page_num, ext=ext)))
+                self.assertEqual(page_array.shape, reference_image.shape)
+                self.assertLess(
+                    np.sum(np.abs(page_array - reference_image)) / page_array.size, 5.0)
+
+    def test_render_arrays_writes_images(self):
+        """Test render_arrays saves pages to disk like render."""
+        ext = 'png'
+        with self.setup_and_teardown(ext=ext):
+            for _ in self.pdf_renderer.render_arrays(
+                    pdf_path=self.pdf_path,
+                    check_retcode=True,
+                    output_dir=self.tmp_output_dir,
+                    ext=ext):
+                pass
+            output_dir_paths = [
+                os.path.join(dir_path, file_name)
+                for dir_path, dir_names, file_names in os.walk(
+                        self.tmp_output_dir)
+                for file_name in file_names
+            ]
+            self.assertEqual(
+                sorted(output_dir_paths),
+                sorted(self.expected_dir_structure))
+
+    def test_render_pages_arrays(self):
+        """Test render_pages_arrays renders only the requested pages."""
+        ext = 'png'
+        with self.setup_and_teardown(ext=ext):
+            page_nums = [5, 2, 3]
+            rendered_pages = list(self.pdf_renderer.render_pages_arrays(
+                pdf_path=self.pdf_path,
+                page_nums=page_nums,
+                dpi=settings.DEFAULT_INFERENCE_DPI,
+                check_retcode=True))
+            self.assertEqual(
+                [page_num for page_num, _ in rendered_pages],
+                sorted(page_nums))
+            for page_num, page_array in rendered_pages:
+                reference_image = imread(
+                    os.path.join(
+                        self.MANUALLY_INSPECTED_RENDERINGS_DIR,
+                        self.pdf_rendered_page_template.format(
+                            page_num=page_num, ext=ext)))
+                self.assertEqual(page_array.shape, reference_image.shape)
+                self.assertLess(
+                    np.sum(np.abs(page_array - reference_image)) / page_array.size, 5.0)
+
     def test_uses_cache(self):
         """Test that the rendered uses existing copies of the files."""
         ext = 'png'
@@ -301,3 +397,34 @@ class GhostScriptRendererTest(
     MANUALLY_INSPECTED_RENDERINGS_DIR = os.path.join(
         settings.TEST_DATA_DIR,
         'pdfrenderer/ghostscript-renderings/')
+
+
+class ShardedGhostScriptRendererTest(
+        PDFRendererSubclassTestMixin,
+        unittest.TestCase):
+    """Test deepfigures.renderers.GhostScriptRenderer rendering in shards.
+
+    The test PDF has 6 pages, so this renderer splits it into 3
+    concurrently rendered page ranges.
+    """
+    PDF_RENDERER = renderers.GhostScriptRenderer(
+        max_shards=3,
+        min_pages_per_shard=2)
+    MANUALLY_INSPECTED_RENDERINGS_DIR = os.path.join(
+        settings.TEST_DATA_DIR,
+        'pdfrenderer/ghostscript-renderings/')
+
+    def test_get_page_ranges(self):
+        """Test the page ranges cover every page exactly once."""
+        pdf_path = os.path.join(
+            settings.TEST_DATA_DIR,
+            'pdfrenderer/paper.pdf')
+        self.assertEqual(
+            self.PDF_RENDERER._get_page_ranges(pdf_path, max_pages=None),
+            [(1, 2), (3, 4), (5, 6)])
+        self.assertEqual(
+            self.PDF_RENDERER._get_page_ranges(pdf_path, max_pages=5),
+            [(1, 3), (4, 5)])
+        self.assertEqual(
+            self.PDF_RENDERER._get_page_ranges(pdf_path, max_pages=3),
+            [])
@@ -0,0 +1,117 @@
+"""Test deepfigures.extraction.tensorbox_fourchannel"""
+
+import glob
+import logging
+import os
+import unittest
+
+import imageio
+import numpy as np
+
+from deepfigures import settings
+from deepfigures.extraction import tensorbox_fourchannel
+from deepfigures.extraction.datamodels import BoxClass
+from deepfigures.utils import image_util
+
+
+logger = logging.getLogger(__name__)
+
+
+class TestTensorboxCaptionmaskDetector(unittest.TestCase):
+    """Test ``TensorboxCaptionmaskDetector``."""
+
+    def setUp(self):
+        """Load the rendered pages of the test paper."""
+        self.page_images = [
+            imageio.imread(page_image_path)
+            for page_image_path in sorted(glob.glob(os.path.join(
+                settings.TEST_DATA_DIR,
+                'pdfrenderer/ghostscript-renderings/*.png')))
+        ]
+
+    def test_batch_size_requires_moving_statistics(self):
+        """Test batching with batch statistics is rejected."""
+        with self.assertRaises(ValueError):
+            tensorbox_fourchannel.TensorboxCaptionmaskDetector(
+                batch_size=4,
+                **settings.TENSORBOX_MODEL)
+
+    def test_batched_matches_unbatched(self):
+        """Test batched inference gives the same output as unbatched."""
+        # use a batch size that doesn't divide the number of pages so
+        # the padded final batch is exercised as well.
+        batch_size = 4
+        with tensorbox_fourchannel.TensorboxCaptionmaskDetector(
+                batch_size=1,
+                use_moving_statistics=True,
+                **settings.TENSORBOX_MODEL) as unbatched_detector:
+            resized_pages = [
+                tensorbox_fourchannel.image_util.imresize_multichannel(
+                    page_image, unbatched_detector.input_shape)
+                for page_image in self.page_images
+            ]
+            unbatched_predictions = unbatched_detector.detect_pages(
+                resized_pages)
+            unbatched_detections = unbatched_detector.get_detections(
+                self.page_images)
+        with tensorbox_fourchannel.TensorboxCaptionmaskDetector(
+                batch_size=batch_size,
+                use_moving_statistics=True,
+                **settings.TENSORBOX_MODEL) as batched_detector:
+            batched_predictions = batched_detector.detect_pages(
+                resized_pages)
+            batched_detections = batched_detector.get_detections(
+                self.page_images)
+
+        self.assertEqual(len(batched_predictions), len(self.page_images))
+        for unbatched, batched in zip(
+                unbatched_predictions, batched_predictions):
+            for unbatched_output, batched_output in zip(unbatched, batched):
+                np.testing.assert_allclose(
+                    batched_output, unbatched_output, rtol=1e-4, atol=1e-4)
+        self.assertEqual(
+            [[box.to_dict() for box in boxes] for boxes in batched_detections],
+            [[box.to_dict() for box in boxes] for boxes in unbatched_detections])
+
+
+class TestDrawCaptionMask(unittest.TestCase):
+    """Test ``draw_caption_mask``."""
+
+    def get_resized_page_mask(self, caption_boxes, page_shape, out_shape):
+        """Mask the captions out of a page sized channel and resize it."""
+        page_mask = np.full(
+            tuple(page_shape[:2]) + (1,),
+            tensorbox_fourchannel.CAPTION_CHANNEL_BACKGROUND,
+            dtype=np.uint8)
+        for caption_box in caption_boxes:
+            clipped_box = caption_box._get_clipped_rounded(page_shape)
+            if clipped_box is not None:
+                (x1, y1, x2, y2) = clipped_box
+                page_mask[y1:y2, x1:x2] = (
+                    tensorbox_fourchannel.CAPTION_CHANNEL_MASK)
+        return image_util.imresize_multichannel(page_mask, out_shape)[:, :, 0]
+
+    def test_matches_resized_page_mask(self):
+        """Test drawing at network size matches resizing a page mask."""
+        random_state = np.random.RandomState(0)
+        out_shape = (640, 480)
+        # shrinking averages areas, enlarging interpolates bilinearly
+        for page_shape in [(1100, 850, 3), (1280, 960, 3), (600, 450, 3)]:
+            for _ in range(10):
+                caption_boxes = []
+                for _ in range(random_state.randint(0, 6)):
+                    x1 = random_state.uniform(-20, page_shape[1])
+                    y1 = random_state.uniform(-20, page_shape[0])
+                    caption_boxes.append(BoxClass(
+                        x1=x1, y1=y1,
+                        x2=x1 + random_state.uniform(0, 400),
+                        y2=y1 + random_state.uniform(0, 80)))
+                expected = self.get_resized_page_mask(
+                    caption_boxes, page_shape, out_shape)
+                out = np.zeros(out_shape, dtype=np.float32)
+                self.assertIs(
+                    tensorbox_fourchannel.draw_caption_mask(
+                        caption_boxes, page_shape, out=out),
+                    out)
+                # opencv's bilinear interpolation is fixed point
+                np.testing.assert_allclose(out, expected, atol=1)
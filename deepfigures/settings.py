@@ -60,12 +60,39 @@ PDFFIGURES_JAR_PATH = os.path.join(
     BASE_DIR,
     'bin/',
     PDFFIGURES_JAR_NAME)
+# number of PDFs handed to a single pdffigures2 JVM in batch mode
+PDFFIGURES_BATCH_SIZE = 16
 
 # PDF Rendering backend settings
 DEEPFIGURES_PDF_RENDERER = 'deepfigures.extraction.renderers.GhostScriptRenderer'
+# maximum number of ghostscript processes used to render a single PDF
+GHOSTSCRIPT_MAX_SHARDS = os.cpu_count() or 1
+# minimum number of pages rendered by each ghostscript process
+GHOSTSCRIPT_MIN_PAGES_PER_SHARD = 25
+
+# maximum total size in bytes of a figure extraction output directory
+# before the least recently used results are evicted, or None for no limit
+EXTRACTION_CACHE_MAX_SIZE = None
+
+# the fraction of the gold standard's figures that page triage must keep;
+# pages that score too low to meet it are assumed to be text only and
+# skip figure detection. None runs detection on every page.
+PAGE_TRIAGE_RECALL_TARGET = None
+# the figure page scores written by scripts/page_triage_benchmark.py
+PAGE_TRIAGE_CALIBRATION_PATH = os.path.join(
+    BASE_DIR, 'weights/page_triage_calibration.json')
 
 # settings for data generation
 
+# run the first of the two pdflatex passes over each paper with -draftmode,
+# which resolves references without reading images or writing the pdf
+PDFLATEX_DRAFT_FIRST_PASS = False
+
+# write the diff of each page's color and black renderings to the diff
+# directory as it's generated, to debug the figure and caption boxes found
+# on it; figures are found from the in-memory diffs either way.
+ARXIV_SAVE_DIFF_IMAGES = False
+
 if IN_DOCKER:
     # The location to temporarily store arxiv source data
     ARXIV_DATA_TMP_DIR = '/work/host-output/arxiv_data_temp'
@@ -126,6 +153,14 @@ else:
     FILE_LIST = '/home/sampanna/workspace/bdts2/deepfigures-results/files.json'
     PDFLATEX_EXECUTABLE_PATH = 'pdflatex'
 
+# the wall clock time in seconds and the memory in bytes processing a single
+# paper may take while generating data, before its processes, including
+# pdflatex and ghostscript, are killed
+PROCESS_PAPER_TAR_TIMEOUT = 600
+PROCESS_PAPER_TAR_MAX_MEMORY = 8 * 1024 ** 3
+# the json lines manifest of the papers that were killed or failed
+ARXIV_FAILURE_MANIFEST_PATH = os.path.join(ARXIV_DATA_OUTPUT_DIR, 'failed_papers.jsonl')
+
 # The location of the PMC open access data
 PUBMED_INPUT_DIR = ''
 # A directory for storing intermediate results
@@ -7,12 +7,25 @@ import traitlets
 
 JsonData = typing.Union[list, dict, str, int, float]
 
+# traits whose values are already valid json and need no conversion
+_JSON_SCALAR_TRAITS = (
+    traitlets.Float,
+    traitlets.Int,
+    traitlets.Unicode,
+    traitlets.Bool)
+
+# per class mappings from trait name to the function converting that
+# trait's values to or from json, see _get_encoders and _get_decoders
+_ENCODERS = {}
+_DECODERS = {}
+
 
 class JsonSerializable(traitlets.HasTraits):
     def to_dict(self) -> dict:
         """Recursively convert objects to dicts to allow json serialization."""
+        encoders = _get_encoders(type(self))
         return {
-            JsonSerializable.serialize(k): JsonSerializable.serialize(v)
+            k: encoders[k](v) if k in encoders else JsonSerializable.serialize(v)
             for (k, v) in self._trait_values.items()
         }
 
@@ -34,10 +47,9 @@ class JsonSerializable(traitlets.HasTraits):
     @classmethod
     def from_dict(cls, json_data: dict):
         assert (type(json_data) == dict)
-        args = {}
-        for (k, v) in cls.class_traits().items():
-            args[k] = JsonSerializable.deserialize(v, json_data[k])
-        return cls(**args)
+        return cls(**{
+            k: decoder(json_data[k]) for (k, decoder) in _get_decoders(cls)
+        })
 
     @staticmethod
     def deserialize(target_trait: traitlets.TraitType, json_data: JsonData):
@@ -67,3 +79,111 @@ class JsonSerializable(traitlets.HasTraits):
     def __repr__(self):
         traits_list = ['%s=%s' % (k, repr(v)) for (k, v) in self._trait_values.items()]
         return type(self).__name__ + '(' + ', '.join(traits_list) + ')'
+
+
+def _get_encoders(cls: type) -> typing.Dict[str, typing.Callable]:
+    """Return the functions converting each of cls's traits to json.
+
+    The functions are built once per class from its traits so that
+    serializing an instance doesn't inspect the types of its values.
+    Each function returns exactly what JsonSerializable.serialize would.
+    """
+    encoders = _ENCODERS.get(cls)
+    if encoders is None:
+        encoders = {
+            name: _compile_encoder(trait)
+            for (name, trait) in cls.class_traits().items()
+        }
+        _ENCODERS[cls] = encoders
+    return encoders
+
+
+def _compile_encoder(trait: traitlets.TraitType) -> typing.Callable:
+    """Return a function converting values of trait to json."""
+    if isinstance(trait, _JSON_SCALAR_TRAITS):
+        return _identity
+    elif _is_serializable_instance(trait):
+        return _encode_instance
+    elif isinstance(trait, traitlets.List) and trait._trait is not None:
+        element_encoder = _compile_encoder(trait._trait)
+        if element_encoder is _identity:
+            return _allow_none(list)
+        return _allow_none(
+            lambda values: [element_encoder(value) for value in values])
+    else:
+        return JsonSerializable.serialize
+
+
+def _get_decoders(cls: type) -> typing.List[typing.Tuple[str, typing.Callable]]:
+    """Return the functions converting json to each of cls's traits.
+
+    The counterpart of _get_encoders, each function returns exactly what
+    JsonSerializable.deserialize would for its trait.
+    """
+    decoders = _DECODERS.get(cls)
+    if decoders is None:
+        decoders = [
+            (name, _compile_decoder(trait))
+            for (name, trait) in cls.class_traits().items()
+        ]
+        _DECODERS[cls] = decoders
+    return decoders
+
+
+def _compile_decoder(trait: traitlets.TraitType) -> typing.Callable:
+    """Return a function converting json to values of trait."""
+    if _is_serializable_instance(trait):
+        return _allow_none(trait.klass.from_dict)
+    elif isinstance(trait, traitlets.List):
+        element_decoder = _compile_decoder(trait._trait)
+
+        def decode_list(json_data):
+            assert isinstance(json_data, list)
+            return [element_decoder(element) for element in json_data]
+
+        return _allow_none(decode_list)
+    elif isinstance(trait, traitlets.Dict):
+        value_decoder = _compile_decoder(getattr(trait, '_trait', None))
+
+        def decode_dict(json_data):
+            # Assume all dictionary keys are strings
+            assert isinstance(json_data, dict)
+            res_dict = dict()
+            for (key, value) in json_data.items():
+                assert type(key) == str
+                res_dict[key] = value_decoder(value)
+            return res_dict
+
+        return _allow_none(decode_dict)
+    elif isinstance(trait, traitlets.Instance) and isinstance(trait.klass, str):
+        # the class hasn't been resolved yet, so decide when decoding
+        return lambda json_data: JsonSerializable.deserialize(trait, json_data)
+    else:
+        return _identity
+
+
+def _is_serializable_instance(trait: traitlets.TraitType) -> bool:
+    return (
+        isinstance(trait, traitlets.Instance) and
+        isinstance(trait.klass, type) and
+        issubclass(trait.klass, JsonSerializable))
+
+
+def _identity(value):
+    return value
+
+
+def _allow_none(function: typing.Callable) -> typing.Callable:
+    """Wrap function so that None, the value of traits with
+    allow_none=True that aren't set, is converted to None."""
+    def wrapped(value):
+        if value is None:
+            return None
+        return function(value)
+    return wrapped
+
+
+def _encode_instance(value):
+    if isinstance(value, JsonSerializable):
+        return value.to_dict()
+    return JsonSerializable.serialize(value)
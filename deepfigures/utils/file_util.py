@@ -17,6 +17,11 @@ from gzip import GzipFile
 import arrow
 import boto3
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 ROOT = abspath(dirname(dirname(dirname(__file__))))
 
 
@@ -389,17 +394,40 @@ def write_json(filename, obj, indent=None, sort_keys=None):
         json.dump(obj, f, indent=indent, sort_keys=sort_keys)
 
 
-def write_json_atomic(filename, obj, indent=None, sort_keys=None):
-    """Write JSON to `filename` such that `filename` never exists in a partially written state."""
+def dumps_json(obj, indent=None, sort_keys=None, compact=False) -> str:
+    """Return `obj` as a JSON string.
+
+    By default the output is the same as `json.dumps`. With `compact`,
+    whitespace is dropped and `indent` is ignored, and orjson is used to
+    encode the JSON when it is installed.
+    """
+    if not compact:
+        return json.dumps(obj, indent=indent, sort_keys=sort_keys)
+    if orjson is not None:
+        return orjson.dumps(
+            obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0
+        ).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys)
+
+
+def write_json_atomic(filename, obj, indent=None, sort_keys=None, compact=False):
+    """Write JSON to `filename` such that `filename` never exists in a partially written state.
+
+    See `dumps_json` for the meaning of `compact`.
+    """
     filename = _expand(filename)
     if filename.startswith('s3://'):
         write_json(
             filename, obj, indent, sort_keys
         )  # s3 operations are already atomic
+    # encode in one shot rather than streaming through json.dump, which
+    # makes a write call for every token in the output
+    json_str = dumps_json(
+        obj, indent=indent, sort_keys=sort_keys, compact=compact)
     with tempfile.NamedTemporaryFile(
         'w', dir=os.path.dirname(filename), delete=False
     ) as f:
-        json.dump(obj, f, indent=indent, sort_keys=sort_keys)
+        f.write(json_str)
         tempname = f.name
     os.rename(tempname, filename)
 
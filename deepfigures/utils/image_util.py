@@ -1,7 +1,7 @@
 import os
 import typing
+import cv2
 import numpy as np
-from scipy.misc.pilutil import imresize
 import imageio
 from deepfigures.utils import file_util
 import logging
@@ -47,18 +47,93 @@ def write_tensor(dst: str, value: np.ndarray) -> None:
         np.savez_compressed(f, value)
 
 
-def imresize_multichannel(im: np.ndarray, target_size: typing.Tuple[int, int],
-                          **kwargs) -> np.ndarray:
-    n_channels = im.shape[2]
-    resized_channels = [
-        imresize(im[:, :, n], target_size, **kwargs) for n in range(n_channels)
-    ]
-    return np.stack(resized_channels, axis=2)
+# the interpolation names accepted by scipy.misc.imresize, mapped to the
+# opencv flags for the same kernels
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'lanczos': cv2.INTER_LANCZOS4,
+    'bilinear': cv2.INTER_LINEAR,
+    'bicubic': cv2.INTER_CUBIC,
+    'cubic': cv2.INTER_CUBIC
+}
 
 
-def imrescale_multichannel(im: np.ndarray, scale_factor: float, **kwargs) -> np.ndarray:
-    n_channels = im.shape[2]
-    resized_channels = [
-        imresize(im[:, :, n], scale_factor, **kwargs) for n in range(n_channels)
-    ]
-    return np.stack(resized_channels, axis=2)
+def imresize_multichannel(im: np.ndarray, target_size: typing.Sequence[int],
+                          interp: str = 'bilinear',
+                          out: typing.Optional[np.ndarray] = None) -> np.ndarray:
+    """Resize all the channels of an image at once.
+
+    A drop-in replacement for resizing each channel with
+    scipy.misc.imresize: non-uint8 channels are scaled to 0-255 the same
+    way, and the result is a uint8 array.
+
+    Parameters
+    ----------
+    im : np.ndarray
+        The (height, width, channels) image to resize.
+    target_size : Sequence[int]
+        The output (height, width); any further entries (e.g. the number
+        of channels of an input shape) are ignored.
+    interp : str
+        The interpolation to use, one of the keys of INTERPOLATIONS.
+        When shrinking the image in both dimensions area averaging is
+        used instead (except for 'nearest'), which is much closer than
+        the bare kernel to PIL's antialiased downsampling.
+    out : Optional[np.ndarray]
+        A (height, width, channels) array to write the result into, such
+        as a slice of a preallocated batch. The result is written in
+        place when out is a contiguous uint8 array, and copied into it
+        (converting its type) otherwise.
+
+    Returns
+    -------
+    np.ndarray
+        The resized image, which is out if it was given.
+    """
+    (height, width) = (int(target_size[0]), int(target_size[1]))
+    if interp not in INTERPOLATIONS:
+        raise ValueError('Unknown interpolation: %s' % interp)
+    interpolation = INTERPOLATIONS[interp]
+    if (interp != 'nearest' and height < im.shape[0] and
+            width < im.shape[1]):
+        interpolation = cv2.INTER_AREA
+    if im.dtype != np.uint8:
+        im = _bytescale_channels(im)
+    if out is not None and out.flags.c_contiguous:
+        resized = cv2.resize(
+            im, (width, height), dst=out, interpolation=interpolation)
+    else:
+        resized = cv2.resize(im, (width, height), interpolation=interpolation)
+    # opencv drops the channel axis of single channel images
+    resized = resized.reshape((height, width, im.shape[2]))
+    if out is None:
+        return resized
+    if not np.shares_memory(resized, out):
+        np.copyto(out, resized)
+    return out
+
+
+def imrescale_multichannel(im: np.ndarray, scale_factor: typing.Union[int, float],
+                           interp: str = 'bilinear',
+                           out: typing.Optional[np.ndarray] = None) -> np.ndarray:
+    """Rescale all the channels of an image at once.
+
+    As with scipy.misc.imresize, an int scale_factor is a percentage and a
+    float one a fraction of the current size. See imresize_multichannel
+    for the other arguments.
+    """
+    if isinstance(scale_factor, (int, np.integer)):
+        scale_factor = scale_factor / 100.0
+    target_size = (
+        int(im.shape[0] * scale_factor), int(im.shape[1] * scale_factor))
+    return imresize_multichannel(im, target_size, interp=interp, out=out)
+
+
+def _bytescale_channels(im: np.ndarray) -> np.ndarray:
+    """Scale each channel of im to span 0-255, as scipy.misc.bytescale."""
+    cmin = im.min(axis=(0, 1), keepdims=True).astype(np.float64)
+    cmax = im.max(axis=(0, 1), keepdims=True).astype(np.float64)
+    cscale = cmax - cmin
+    cscale[cscale == 0] = 1
+    scaled = (im - cmin) * (255. / cscale)
+    return (scaled.clip(0, 255) + 0.5).astype(np.uint8)
@@ -0,0 +1,109 @@
+"""Test deepfigures.utils.config."""
+
+import json
+import os
+import tempfile
+import unittest
+
+from deepfigures.extraction.datamodels import (
+    BoxClass,
+    Figure,
+    PdfDetectionResult)
+from deepfigures.utils import (
+    config,
+    file_util)
+
+
+def _serialize_reference(obj):
+    """Serialize obj by inspecting the type of every value."""
+    if isinstance(obj, config.JsonSerializable):
+        return {
+            k: _serialize_reference(v)
+            for (k, v) in obj._trait_values.items()
+        }
+    elif isinstance(obj, list):
+        return [_serialize_reference(v) for v in obj]
+    elif isinstance(obj, dict):
+        return {k: _serialize_reference(v) for (k, v) in obj.items()}
+    else:
+        return obj
+
+
+def _make_result():
+    box = BoxClass(x1=1.5, y1=2, x2=30.25, y2=40)
+    figure = Figure(
+        figure_boundary=box,
+        caption_boundary=box.expand_box(3),
+        caption_text='Figure 1: A figure.',
+        name='1',
+        figure_type='Figure',
+        page=2)
+    return PdfDetectionResult(
+        pdf='paper.pdf',
+        figures=[figure, figure],
+        dpi=100,
+        raw_detected_boxes=[[box], [], [box, box.rescale(2)]],
+        raw_pdffigures_output={'figures': [{'name': '1', 'page': 2}]},
+        error=None)
+
+
+class TestJsonSerializable(unittest.TestCase):
+    """Test deepfigures.utils.config.JsonSerializable."""
+
+    def test_to_dict_matches_reference(self):
+        """Test the compiled encoder matches walking every value."""
+        result = _make_result()
+        self.assertEqual(
+            json.dumps(result.to_dict(), indent=2, sort_keys=True),
+            json.dumps(_serialize_reference(result), indent=2, sort_keys=True))
+
+    def test_round_trips(self):
+        """Test from_dict inverts to_dict."""
+        result_dict = _make_result().to_dict()
+        self.assertEqual(
+            PdfDetectionResult.from_dict(result_dict).to_dict(),
+            result_dict)
+
+    def test_none_fields_round_trip(self):
+        """Test unset list, dict and instance fields stay None."""
+        result = PdfDetectionResult(
+            pdf='a.pdf',
+            figures=[],
+            dpi=100,
+            raw_detected_boxes=None,
+            raw_pdffigures_output=None,
+            error=None)
+        result_dict = result.to_dict()
+        self.assertEqual(result_dict, _serialize_reference(result))
+        self.assertIsNone(result_dict['raw_detected_boxes'])
+        self.assertIsNone(result_dict['raw_pdffigures_output'])
+        self.assertEqual(
+            PdfDetectionResult.from_dict(result_dict).to_dict(),
+            result_dict)
+
+
+class TestWriteJsonAtomic(unittest.TestCase):
+    """Test deepfigures.utils.file_util.write_json_atomic."""
+
+    def test_matches_json_dump(self):
+        """Test the default output is byte for byte that of json.dump."""
+        obj = _make_result().to_dict()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'result.json')
+            file_util.write_json_atomic(path, obj, indent=2, sort_keys=True)
+            with open(path, 'r') as f_in:
+                self.assertEqual(
+                    f_in.read(),
+                    json.dumps(obj, indent=2, sort_keys=True))
+
+    def test_compact(self):
+        """Test compact output loads back to the same object."""
+        obj = _make_result().to_dict()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'result.json')
+            file_util.write_json_atomic(
+                path, obj, sort_keys=True, compact=True)
+            with open(path, 'r') as f_in:
+                contents = f_in.read()
+            self.assertNotIn('\n', contents)
+            self.assertEqual(json.loads(contents), obj)
@@ -0,0 +1,116 @@
+"""Test deepfigures.utils.image_util."""
+
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from deepfigures.utils import image_util
+
+
+# the PIL filters scipy.misc.imresize used for each interpolation
+PIL_FILTERS = {
+    'nearest': Image.NEAREST,
+    'bilinear': Image.BILINEAR,
+    'cubic': Image.BICUBIC
+}
+
+
+def reference_imresize_multichannel(im, target_size, interp='bilinear'):
+    """Resize each channel with PIL, as scipy.misc.imresize did."""
+    return np.stack([
+        np.asarray(
+            Image.fromarray(im[:, :, n]).resize(
+                (target_size[1], target_size[0]),
+                resample=PIL_FILTERS[interp]))
+        for n in range(im.shape[2])
+    ], axis=2)
+
+
+def make_page(height, width, n_channels, seed=0):
+    """Make a white page image with dark blocks scattered over it."""
+    random_state = np.random.RandomState(seed)
+    page = np.full((height, width, n_channels), 255, dtype=np.uint8)
+    for _ in range(height * width // 200):
+        y = random_state.randint(0, height - 8)
+        x = random_state.randint(0, width - 8)
+        page[y:y + random_state.randint(1, 9),
+             x:x + random_state.randint(1, 9)] = random_state.randint(0, 256)
+    return page
+
+
+class TestImresizeMultichannel(unittest.TestCase):
+    """Test deepfigures.utils.image_util.imresize_multichannel."""
+
+    def test_matches_per_channel_resize_when_enlarging(self):
+        """Test enlarging matches resizing each channel with PIL."""
+        page = make_page(110, 85, 4)
+        for interp in ['nearest', 'bilinear', 'cubic']:
+            expected = reference_imresize_multichannel(
+                page, (220, 170), interp=interp).astype(int)
+            resized = image_util.imresize_multichannel(
+                page, (220, 170, 4), interp=interp)
+            self.assertEqual(resized.shape, (220, 170, 4))
+            self.assertEqual(resized.dtype, np.uint8)
+            self.assertLess(np.abs(resized - expected).mean(), 0.5, interp)
+
+    def test_close_to_per_channel_resize_when_shrinking(self):
+        """Test shrinking is close to resizing each channel with PIL."""
+        page = make_page(1100, 850, 4)
+        for interp in ['bilinear', 'cubic']:
+            expected = reference_imresize_multichannel(
+                page, (640, 480), interp=interp).astype(int)
+            resized = image_util.imresize_multichannel(
+                page, (640, 480), interp=interp)
+            self.assertEqual(resized.shape, (640, 480, 4))
+            self.assertLess(np.abs(resized - expected).mean(), 1.5, interp)
+
+    def test_single_channel(self):
+        """Test the channel axis is kept for single channel images."""
+        page = make_page(110, 85, 1)
+        self.assertEqual(
+            image_util.imresize_multichannel(page, (55, 40)).shape,
+            (55, 40, 1))
+
+    def test_non_uint8_channels_are_bytescaled(self):
+        """Test non-uint8 channels are scaled to 0-255 independently."""
+        im = np.zeros((10, 10, 2), dtype=np.float32)
+        im[:5, :, 0] = 0.5
+        im[:, :5, 1] = 1000.
+        resized = image_util.imresize_multichannel(
+            im, (10, 10), interp='nearest')
+        self.assertEqual(resized.dtype, np.uint8)
+        np.testing.assert_array_equal(
+            resized, (im > 0).astype(np.uint8) * 255)
+
+    def test_out(self):
+        """Test resizing into contiguous and strided output buffers."""
+        page = make_page(110, 85, 4)
+        expected = image_util.imresize_multichannel(page, (64, 48))
+        out = np.zeros((64, 48, 4), dtype=np.uint8)
+        self.assertIs(
+            image_util.imresize_multichannel(page, (64, 48), out=out), out)
+        np.testing.assert_array_equal(out, expected)
+        batch = np.zeros((2, 64, 48, 5), dtype=np.uint8)
+        image_util.imresize_multichannel(
+            page, (64, 48), out=batch[1, :, :, :4])
+        np.testing.assert_array_equal(batch[1, :, :, :4], expected)
+        self.assertFalse(batch[0].any() or batch[1, :, :, 4].any())
+
+    def test_unknown_interpolation(self):
+        """Test an unknown interpolation raises a ValueError."""
+        with self.assertRaises(ValueError):
+            image_util.imresize_multichannel(
+                make_page(20, 20, 3), (10, 10), interp='trilinear')
+
+
+class TestImrescaleMultichannel(unittest.TestCase):
+    """Test deepfigures.utils.image_util.imrescale_multichannel."""
+
+    def test_scale_factor(self):
+        """Test int scale factors are percentages and floats fractions."""
+        page = make_page(101, 75, 3)
+        self.assertEqual(
+            image_util.imrescale_multichannel(page, 50).shape, (50, 37, 3))
+        self.assertEqual(
+            image_util.imrescale_multichannel(page, 1.5).shape, (151, 112, 3))
@@ -0,0 +1,136 @@
+"""Test deepfigures.utils.watchdog."""
+
+import os
+import signal
+import subprocess
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from deepfigures.utils import watchdog
+
+
+def add(a, b):
+    return a + b
+
+
+def fail():
+    raise ValueError('bad paper')
+
+
+def exit_abruptly():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def hang_in_subprocess(pid_path):
+    """Start a subprocess that hangs, like a stuck pdflatex, and wait."""
+    process = subprocess.Popen(['sleep', '60'])
+    with open(pid_path, 'w') as f_out:
+        f_out.write(str(process.pid))
+    process.wait()
+
+
+def use_memory(n_bytes):
+    data = np.ones(n_bytes, dtype=np.uint8)
+    time.sleep(60)
+    return int(data.sum())
+
+
+def is_running(pid):
+    """Return whether pid is running, and not a zombie."""
+    try:
+        with open('/proc/%d/stat' % pid) as f_in:
+            stat = f_in.read()
+    except OSError:
+        return False
+    return stat[stat.rfind(')') + 2] != 'Z'
+
+
+class TestRunWithWatchdog(unittest.TestCase):
+    """Test ``run_with_watchdog``."""
+
+    def test_returns_value(self):
+        """Test the function's value is returned from the child."""
+        self.assertEqual(
+            watchdog.run_with_watchdog(add, args=(1,), kwargs={'b': 2}),
+            3)
+        self.assertNotEqual(watchdog.run_with_watchdog(os.getpid), os.getpid())
+
+    def test_error(self):
+        """Test an exception in the child raises a WatchdogError."""
+        with self.assertRaises(watchdog.WatchdogError) as context:
+            watchdog.run_with_watchdog(fail)
+        self.assertEqual(context.exception.reason, watchdog.ERROR)
+        self.assertIn('ValueError: bad paper', context.exception.detail)
+
+    def test_crash(self):
+        """Test a child that dies without returning is reported."""
+        with self.assertRaises(watchdog.WatchdogError) as context:
+            watchdog.run_with_watchdog(exit_abruptly)
+        self.assertEqual(context.exception.reason, watchdog.CRASH)
+        self.assertIn(str(int(signal.SIGKILL)), context.exception.detail)
+
+    def test_timeout_kills_process_group(self):
+        """Test a timeout kills the child's subprocesses too."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pid_path = os.path.join(tmpdir, 'pid')
+            start = time.time()
+            with self.assertRaises(watchdog.WatchdogError) as context:
+                watchdog.run_with_watchdog(
+                    hang_in_subprocess, args=(pid_path,), timeout=1.)
+            self.assertLess(time.time() - start, 10.)
+            self.assertEqual(context.exception.reason, watchdog.TIMEOUT)
+            self.assertGreaterEqual(context.exception.elapsed, 1.)
+            with open(pid_path) as f_in:
+                sleep_pid = int(f_in.read())
+        # the orphaned sleep is reaped by init, so give it a moment
+        for _ in range(50):
+            if not is_running(sleep_pid):
+                break
+            time.sleep(0.1)
+        self.assertFalse(is_running(sleep_pid))
+
+    def test_memory_limit(self):
+        """Test a child using too much memory is killed."""
+        with self.assertRaises(watchdog.WatchdogError) as context:
+            watchdog.run_with_watchdog(
+                use_memory, args=(256 * 1024 ** 2,), timeout=30.,
+                max_memory=64 * 1024 ** 2, poll_interval=0.1)
+        self.assertEqual(context.exception.reason, watchdog.MEMORY)
+        self.assertLess(context.exception.elapsed, 30.)
+
+    def test_initializer(self):
+        """Test the initializer runs in the child before the function."""
+        # unlike python's random module, numpy doesn't reseed after a fork
+        np.random.seed(0)
+        copied = watchdog.run_with_watchdog(np.random.random)
+        reseeded = watchdog.run_with_watchdog(
+            np.random.random, initializer=lambda: np.random.seed(1))
+        np.random.seed(0)
+        self.assertEqual(copied, np.random.random())
+        np.random.seed(1)
+        self.assertEqual(reseeded, np.random.random())
+
+
+class TestFailureManifest(unittest.TestCase):
+    """Test ``record_failure`` and ``read_failure_manifest``."""
+
+    def test_round_trip(self):
+        """Test failures are appended to and read from the manifest."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest_path = os.path.join(tmpdir, 'manifests', 'failed.jsonl')
+            self.assertEqual(watchdog.read_failure_manifest(manifest_path), [])
+            watchdog.record_failure(
+                manifest_path, 'a.gz',
+                watchdog.WatchdogError(watchdog.TIMEOUT, 'Killed', 600.))
+            watchdog.record_failure(
+                manifest_path, 'b.gz',
+                watchdog.WatchdogError(watchdog.ERROR, 'Traceback', 1.5))
+            records = watchdog.read_failure_manifest(manifest_path)
+        self.assertEqual(
+            [(record.name, record.reason, record.detail, record.elapsed)
+             for record in records],
+            [('a.gz', 'timeout', 'Killed', 600.),
+             ('b.gz', 'error', 'Traceback', 1.5)])
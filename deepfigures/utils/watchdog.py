@@ -0,0 +1,268 @@
+"""Run functions in child processes that are killed when they run too long.
+
+pdflatex and ghostscript sometimes hang for days on a malformed paper,
+and a thread can't be killed, so a timeout on a thread doesn't free
+its worker. Here each call runs in a forked child, in a process group
+of its own. A watchdog in the parent kills the whole group, including
+any pdflatex or ghostscript processes it started, when the call runs
+too long or uses too much memory.
+"""
+
+import json
+import os
+import pickle
+import select
+import signal
+import sys
+import time
+import traceback
+import typing
+
+import traitlets
+
+from deepfigures.utils import file_util
+from deepfigures.utils.config import JsonSerializable
+
+
+TIMEOUT = 'timeout'
+MEMORY = 'memory'
+ERROR = 'error'
+CRASH = 'crash'
+
+
+class WatchdogError(RuntimeError):
+    """An exception thrown when a watched call doesn't return a value."""
+
+    def __init__(self, reason: str, detail: str, elapsed: float):
+        """
+        :param str reason: TIMEOUT or MEMORY if the watchdog killed the
+          call, ERROR if the call raised an exception, or CRASH if its
+          process died.
+        :param str detail: a description of the failure.
+        :param float elapsed: the wall clock time in seconds the call ran.
+        """
+        super().__init__(reason, detail, elapsed)
+        self.reason = reason
+        self.detail = detail
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return '%s: %s' % (self.reason, self.detail)
+
+
+class FailureRecord(JsonSerializable):
+    """A call that failed, as recorded in a failure manifest."""
+    name = traitlets.Unicode()
+    reason = traitlets.Unicode()
+    detail = traitlets.Unicode()
+    elapsed = traitlets.Float()
+    timestamp = traitlets.Float()
+
+
+def get_process_group_memory(pgid: int) -> int:
+    """Return the memory in bytes used by the processes in process group
+    pgid, read from /proc.
+
+    Only a process's private memory is counted where the kernel reports
+    it, so pages a forked child still shares with its parent aren't.
+    Otherwise its resident set size is used.
+    """
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % pid) as f_in:
+                stat = f_in.read()
+            # the command name may contain spaces, so split after it
+            fields = stat[stat.rfind(')') + 2:].split()
+            if int(fields[2]) != pgid:
+                continue
+            total += _get_private_memory(pid, int(fields[21]) * page_size)
+        except (OSError, IndexError, ValueError):
+            # the process exited while we were reading it
+            continue
+    return total
+
+
+def _get_private_memory(pid: str, rss: int) -> int:
+    """Return the private memory of process pid, or rss if the kernel
+    doesn't report it."""
+    try:
+        with open('/proc/%s/smaps_rollup' % pid) as f_in:
+            lines = f_in.readlines()
+    except OSError:
+        return rss
+    private_kb = [
+        int(line.split()[1]) for line in lines
+        if line.startswith(('Private_Clean:', 'Private_Dirty:'))
+    ]
+    return 1024 * sum(private_kb) if private_kb else rss
+
+
+def _kill_process_group(pgid: int) -> None:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # every process in the group has already exited
+        pass
+
+
+def _run_child(
+        fn: typing.Callable, args: tuple, kwargs: dict,
+        initializer: typing.Optional[typing.Callable], write_fd: int
+) -> None:
+    """Run fn in the forked child and write its pickled outcome to
+    write_fd. Never returns."""
+    exit_code = 0
+    try:
+        os.setpgid(0, 0)
+        try:
+            if initializer is not None:
+                initializer()
+            payload = pickle.dumps((True, fn(*args, **kwargs)))
+        except BaseException:
+            payload = pickle.dumps((False, traceback.format_exc()))
+        with os.fdopen(write_fd, 'wb') as f_out:
+            f_out.write(payload)
+    except BaseException:
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # skip the parent's atexit handlers and finalizers
+        os._exit(exit_code)
+
+
+def run_with_watchdog(
+        fn: typing.Callable,
+        args: tuple = (),
+        kwargs: typing.Optional[dict] = None,
+        timeout: typing.Optional[float] = None,
+        max_memory: typing.Optional[int] = None,
+        initializer: typing.Optional[typing.Callable] = None,
+        poll_interval: float = 1.
+) -> typing.Any:
+    """Call fn(*args, **kwargs) in a child process and return its value.
+
+    The child is forked rather than started with multiprocessing, since
+    daemonic processes like torch DataLoader workers can't start
+    multiprocessing children, so fn doesn't need to be picklable but its
+    return value does.
+
+    :param callable fn: the function to call.
+    :param tuple args: the positional arguments to pass to fn.
+    :param dict kwargs: the keyword arguments to pass to fn.
+    :param float timeout: the wall clock time in seconds after which the
+      call is killed, or None to never kill it for running too long.
+    :param int max_memory: the memory in bytes the call's process group
+      may use before it's killed, or None for no limit.
+    :param callable initializer: if given, called in the child before fn,
+      e.g. to reseed random states the child copied from its parent.
+    :param float poll_interval: the time in seconds between checks of
+      the process group's memory.
+
+    :returns: fn's return value.
+
+    :raises WatchdogError: if fn raises, its process dies, or the
+      watchdog kills it.
+    """
+    kwargs = kwargs or {}
+    # so buffered output isn't written by both processes
+    sys.stdout.flush()
+    sys.stderr.flush()
+    (read_fd, write_fd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        _run_child(fn, args, kwargs, initializer, write_fd)
+    os.close(write_fd)
+    try:
+        # also set the group here so it exists before we might kill it
+        os.setpgid(pid, pid)
+    except OSError:
+        pass
+    start_time = time.time()
+    chunks = []
+    try:
+        while True:
+            wait_time = poll_interval
+            if timeout is not None:
+                wait_time = max(min(wait_time, start_time + timeout - time.time()), 0)
+            (readable, _, _) = select.select([read_fd], [], [], wait_time)
+            if readable:
+                chunk = os.read(read_fd, 1 << 16)
+                if not chunk:
+                    # the child closed the pipe, so it's done
+                    break
+                chunks.append(chunk)
+                continue
+            elapsed = time.time() - start_time
+            if timeout is not None and elapsed >= timeout:
+                raise WatchdogError(
+                    TIMEOUT, 'Killed after %.1f seconds' % elapsed, elapsed)
+            if max_memory is not None:
+                memory = get_process_group_memory(pid)
+                if memory > max_memory:
+                    raise WatchdogError(
+                        MEMORY,
+                        'Killed using %d bytes, more than the limit of %d' % (memory, max_memory),
+                        elapsed)
+    finally:
+        # kill whatever is left of the group, e.g. a ghostscript process
+        # orphaned by an exception or anything stuck after a timeout
+        _kill_process_group(pid)
+        os.close(read_fd)
+        (_, status) = os.waitpid(pid, 0)
+    elapsed = time.time() - start_time
+    try:
+        (succeeded, value) = pickle.loads(b''.join(chunks))
+    except Exception:
+        # the child died before writing all of its outcome
+        if os.WIFSIGNALED(status):
+            detail = 'Process killed by signal %d' % os.WTERMSIG(status)
+        else:
+            detail = 'Process exited with code %d' % os.WEXITSTATUS(status)
+        raise WatchdogError(CRASH, detail, elapsed)
+    if not succeeded:
+        raise WatchdogError(ERROR, value, elapsed)
+    return value
+
+
+def record_failure(
+        manifest_path: str, name: str, error: WatchdogError
+) -> FailureRecord:
+    """Append a failed call to the failure manifest at manifest_path.
+
+    The manifest has a json line per failure. Each line is written with
+    a single append, so many processes can record failures in the same
+    manifest.
+    """
+    record = FailureRecord(
+        name=name,
+        reason=error.reason,
+        detail=error.detail,
+        elapsed=error.elapsed,
+        timestamp=time.time())
+    if os.path.dirname(manifest_path):
+        file_util.safe_makedirs(os.path.dirname(manifest_path))
+    line = (json.dumps(record.to_dict(), sort_keys=True) + '\n').encode('utf-8')
+    fd = os.open(manifest_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+    return record
+
+
+def read_failure_manifest(manifest_path: str) -> typing.List[FailureRecord]:
+    """Return the failures recorded in the manifest at manifest_path, or
+    none if it doesn't exist."""
+    if not os.path.isfile(manifest_path):
+        return []
+    with open(manifest_path) as f_in:
+        return [
+            FailureRecord.from_dict(json.loads(line))
+            for line in f_in if line.strip()
+        ]
@@ -34,7 +34,7 @@ logger = logging.getLogger(__name__)
     type=click.Path(
         exists=True,
         file_okay=True,
-        dir_okay=False,
+        dir_okay=True,
         resolve_path=True))
 def detectfigures(
         output_directory,
@@ -43,14 +43,18 @@ def detectfigures(
     """Run figure extraction on the PDF at PDF_PATH.
 
     Run figure extraction on the PDF at PDF_PATH and write the results
-    to OUTPUT_DIRECTORY.
+    to OUTPUT_DIRECTORY. If PDF_PATH is a directory, every PDF in it is
+    processed by a single container so the model is only loaded once.
     """
     if not skip_dependencies:
         build.build.callback()
 
     cpu_docker_img = settings.DEEPFIGURES_IMAGES['cpu']
 
-    pdf_directory, pdf_name = os.path.split(pdf_path)
+    if os.path.isdir(pdf_path):
+        pdf_directory, pdf_name = pdf_path, ''
+    else:
+        pdf_directory, pdf_name = os.path.split(pdf_path)
 
     internal_output_directory = '/work/host-output'
     internal_pdf_directory = '/work/host-input'
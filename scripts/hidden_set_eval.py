@@ -2,8 +2,8 @@ import os
 import json
 import glob
 import logging
-from typing import Dict, List, Tuple
-from deepfigures.extraction.datamodels import BoxClass
+from typing import Dict, List, Tuple, Union
+from deepfigures.extraction.datamodels import BoxArray, BoxClass
 from deepfigures.extraction import figure_utils
 from gold_standard.metadata_reader_utils import get_year_for_image_name
 
@@ -16,19 +16,22 @@ def rect_to_box_class(rect: Dict) -> BoxClass:
     return BoxClass(x1=rect['x1'], y1=rect['y1'], x2=rect['x2'], y2=rect['y2'])
 
 
-def compute_page_ious(pred_boxes: List[BoxClass], true_boxes: List[BoxClass], iou_thresh: float) -> Tuple[
-    List[float], int, int, int]:
+def compute_page_ious(pred_boxes: Union[List[BoxClass], BoxArray], true_boxes: Union[List[BoxClass], BoxArray],
+                      iou_thresh: float) -> Tuple[List[float], int, int, int]:
     """
     Reference: https://towardsdatascience.com/evaluating-performance-of-an-object-detection-model-137a349c517b
     :param pred_boxes:
     :param true_boxes:
     :return:
     """
+    if not isinstance(pred_boxes, BoxArray):
+        pred_boxes = BoxArray.from_boxes(pred_boxes)
+    if not isinstance(true_boxes, BoxArray):
+        true_boxes = BoxArray.from_boxes(true_boxes)
     (true_indices, pred_indices) = figure_utils.pair_boxes(true_boxes, pred_boxes)
     tp, fp, fn = 0, 0, 0
     ious = []
-    for (true_idx, pred_idx) in zip(true_indices, pred_indices):
-        iou = true_boxes[true_idx].iou(pred_boxes[pred_idx])
+    for iou in true_boxes[true_indices].iou(pred_boxes[pred_indices]).tolist():
         ious.append(iou)
         if iou >= iou_thresh:
             tp = tp + 1
@@ -44,8 +47,8 @@ def compute_mean_iou_for_annos(annos: list, iou_thresh: float) -> Tuple[float, i
     ious = []
     tp, fp, fn = 0, 0, 0
     for anno in annos:
-        true_boxes = [rect_to_box_class(rect) for rect in anno['rects']]
-        pred_boxes = [rect_to_box_class(rect) for rect in anno['hidden_set_rects']]
+        true_boxes = BoxArray.from_dicts(anno['rects'])
+        pred_boxes = BoxArray.from_dicts(anno['hidden_set_rects'])
         _ious, _tp, _fp, _fn = compute_page_ious(pred_boxes, true_boxes, iou_thresh)
         ious = ious + _ious
         tp = tp + _tp
@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+import argparse
+import multiprocessing
+from typing import Dict, List
+
+import imageio
+from pprint import pformat
+
+from deepfigures import settings
+from deepfigures.extraction import page_triage
+from deepfigures.utils import file_util
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(os.path.basename(__file__))
+logger.setLevel(logging.DEBUG)
+
+
+def get_page_score(image_path: str) -> float:
+    return page_triage.get_page_statistics(imageio.imread(image_path)).get_score()
+
+
+def get_triage_report(page_scores: List[float], page_figure_counts: List[int],
+                      recall_targets: List[float]) -> List[Dict]:
+    """
+    For each recall target, count the pages page triage would skip and the figures on them.
+    :param page_scores: the triage score of each page.
+    :param page_figure_counts: the number of annotated figures on each page.
+    :param recall_targets: the recall targets to report on.
+    :return: a list with a dict of results per recall target.
+    """
+    figure_page_scores = [score for score, n_figures in zip(page_scores, page_figure_counts)
+                          for _ in range(n_figures)]
+    n_figures = sum(page_figure_counts)
+    n_text_pages = sum(1 for n in page_figure_counts if n == 0)
+    report = []
+    for recall_target in recall_targets:
+        threshold = page_triage.get_threshold_for_recall(figure_page_scores, recall_target)
+        skipped = [score < threshold for score in page_scores]
+        figures_lost = sum(n for n, skip in zip(page_figure_counts, skipped) if skip)
+        text_pages_skipped = sum(1 for n, skip in zip(page_figure_counts, skipped) if skip and n == 0)
+        report.append({
+            'recall_target': recall_target,
+            'threshold': threshold,
+            'pages_skipped': sum(skipped),
+            'pages_skipped_fraction': sum(skipped) / max(len(page_scores), 1),
+            'text_pages_skipped_fraction': text_pages_skipped / max(n_text_pages, 1),
+            'figures_lost': figures_lost,
+            'recall': (n_figures - figures_lost) / max(n_figures, 1),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    """
+    Score every page of the gold standard with page triage, report how many pages would skip detection and how many
+    figures would be lost at each recall target, and save the scores as the calibration page triage loads.
+    Command:
+    python scripts/page_triage_benchmark.py --gold_standard_dir /home/sampanna/deepfigures-results/gold_standard_dataset
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gold_standard_dir',
+                        default='/home/sampanna/deepfigures-results/gold_standard_dataset',
+                        type=str)
+    parser.add_argument('--images_sub_dir',
+                        default='images',
+                        type=str)
+    parser.add_argument('--figure_boundaries_file_name',
+                        default='figure_boundaries.json',
+                        type=str)
+    parser.add_argument('--recall_targets',
+                        default=[0.9, 0.95, 0.98, 0.99, 0.995, 1.0],
+                        nargs='+',
+                        type=float)
+    parser.add_argument('--calibration_path',
+                        default=settings.PAGE_TRIAGE_CALIBRATION_PATH,
+                        type=str)
+    args = parser.parse_args()
+    print("Args: {}".format(pformat(args)))
+
+    annos = file_util.read_json(os.path.join(args.gold_standard_dir, args.figure_boundaries_file_name))
+    image_paths = [os.path.join(args.gold_standard_dir, args.images_sub_dir, anno['image_path']) for anno in annos]
+    start_time = time.time()
+    with multiprocessing.Pool(multiprocessing.cpu_count()) as pool:
+        page_scores = pool.map(get_page_score, image_paths, chunksize=64)
+    elapsed = time.time() - start_time
+    page_figure_counts = [len(anno['rects']) for anno in annos]
+    print("Scored {} pages in {:.1f}s ({:.2f}ms per page per process)".format(
+        len(page_scores), elapsed, 1000 * elapsed * multiprocessing.cpu_count() / max(len(page_scores), 1)))
+    for row in get_triage_report(page_scores, page_figure_counts, args.recall_targets):
+        print("recall target {recall_target:.3f}: threshold {threshold:.4f}, {pages_skipped} pages skipped "
+              "({pages_skipped_fraction:.1%} of pages, {text_pages_skipped_fraction:.1%} of text only pages), "
+              "{figures_lost} figures lost (recall {recall:.4f})".format(**row))
+
+    file_util.write_json_atomic(
+        args.calibration_path,
+        {
+            'figure_page_scores': sorted(
+                score for score, n_figures in zip(page_scores, page_figure_counts) for _ in range(n_figures)),
+            'n_pages': len(page_scores),
+        },
+        indent=2)
+    print("Wrote the calibration to {}".format(args.calibration_path))
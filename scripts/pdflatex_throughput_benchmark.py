@@ -0,0 +1,149 @@
+import os
+import glob
+import json
+import time
+import random
+import shutil
+import tarfile
+import logging
+import argparse
+import statistics
+from typing import Callable, Dict, List
+
+from pprint import pformat
+
+from deepfigures import settings
+from deepfigures.data_generation import arxiv_pipeline
+from deepfigures.extraction import figure_utils
+from deepfigures.extraction.exceptions import LatexException
+from deepfigures.utils import file_util
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(os.path.basename(__file__))
+logger.setLevel(logging.DEBUG)
+
+
+def compile_serially(src_texs: List[str], src_dir: str, dest_dir: str, timeout: int,
+                     draft_first_pass: bool) -> List[str]:
+    return [figure_utils.call_pdflatex(src_tex, src_dir, dest_dir, timeout=timeout, draft_first_pass=draft_first_pass)
+            for src_tex in src_texs]
+
+
+# each strategy, and the number of pdflatex runs it takes to compile the color and black variants of a paper
+STRATEGIES = {
+    'serial': (compile_serially, 4),
+    'shared_first_pass': (figure_utils.call_pdflatex_with_shared_first_pass, 3),
+}
+
+
+def sample_paper_tarnames(file_list_json: str, n_papers: int, extract_dir: str, cache_dir: str,
+                          seed: int) -> List[str]:
+    """
+    Extract the arxiv tars listed in file_list_json, in order, until they hold at least n_papers paper tars, and
+    sample n_papers of them.
+    """
+    random.seed(seed)
+    paper_tarnames = []
+    for tarname in json.load(open(file_list_json)):
+        if len(paper_tarnames) >= n_papers:
+            break
+        tar_extract_dir = os.path.join(extract_dir, os.path.splitext(os.path.basename(tarname))[0]) + '/'
+        arxiv_pipeline.download_and_extract_tar(tarname, extract_dir=tar_extract_dir, cache_dir=cache_dir)
+        paper_tarnames.extend(sorted(glob.glob(os.path.join(tar_extract_dir, '*/*.gz'))))
+    return random.sample(paper_tarnames, min(n_papers, len(paper_tarnames)))
+
+
+def time_strategy(compile_fn: Callable, papers: List[Dict], work_dir: str, timeout: int,
+                  draft_first_pass: bool) -> Dict:
+    """
+    Compile the color and black variants of each paper with compile_fn.
+    :param compile_fn: a function with the signature of figure_utils.call_pdflatex_with_shared_first_pass.
+    :param papers: a dict per paper with its source directory and its color and black tex files.
+    :param work_dir: the directory to write the pdfs to.
+    :return: a dict with the time taken to compile each paper and the number of papers that compiled.
+    """
+    seconds_per_paper = []
+    n_compiled = 0
+    for idx, paper in enumerate(papers):
+        dest_dir = os.path.join(work_dir, str(idx)) + '/'
+        if os.path.exists(dest_dir):
+            shutil.rmtree(dest_dir)
+        start_time = time.time()
+        try:
+            compile_fn([paper['color_tex'], paper['black_tex']], paper['src_dir'], dest_dir, timeout=timeout,
+                       draft_first_pass=draft_first_pass)
+            n_compiled += 1
+        except LatexException:
+            pass
+        seconds_per_paper.append(time.time() - start_time)
+    return {
+        'seconds_per_paper': seconds_per_paper,
+        'n_compiled': n_compiled,
+    }
+
+
+if __name__ == "__main__":
+    """
+    Time compiling the color and black variants of a sample of arxiv papers serially and with a shared first pass,
+    and report the throughput of each.
+    Command:
+    python scripts/pdflatex_throughput_benchmark.py --file_list_json hpc/files_random/files_0.json --n_papers 50
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file_list_json',
+                        default='hpc/files_random/files_0.json',
+                        type=str)
+    parser.add_argument('--n_papers',
+                        default=50,
+                        type=int)
+    parser.add_argument('--work_dir',
+                        default=os.path.join(settings.ARXIV_DATA_TMP_DIR, 'pdflatex_benchmark'),
+                        type=str)
+    parser.add_argument('--cache_dir',
+                        default=settings.ARXIV_DATA_CACHE_DIR,
+                        type=str)
+    parser.add_argument('--strategies',
+                        default=list(STRATEGIES),
+                        nargs='+',
+                        choices=list(STRATEGIES),
+                        type=str)
+    parser.add_argument('--draft_first_pass',
+                        action='store_true')
+    parser.add_argument('--timeout',
+                        default=arxiv_pipeline.PDFLATEX_TIMEOUT,
+                        type=int)
+    parser.add_argument('--seed',
+                        default=0,
+                        type=int)
+    args = parser.parse_args()
+    print("Args: {}".format(pformat(args)))
+
+    paper_tarnames = sample_paper_tarnames(args.file_list_json, args.n_papers,
+                                           extract_dir=os.path.join(args.work_dir, 'tars'),
+                                           cache_dir=args.cache_dir, seed=args.seed)
+    papers = []
+    for paper_tarname in paper_tarnames:
+        paper_name = os.path.splitext(os.path.basename(paper_tarname))[0]
+        paper_dir = os.path.join(args.work_dir, 'src', paper_name)
+        try:
+            file_util.extract_tarfile(paper_tarname, paper_dir)
+        except tarfile.ReadError:
+            logger.debug('File %s is not a tar' % paper_tarname)
+            continue
+        tex_filenames = arxiv_pipeline.write_color_and_black_tex(paper_dir)
+        if tex_filenames is not None:
+            papers.append({'src_dir': paper_dir, 'color_tex': tex_filenames[0], 'black_tex': tex_filenames[1]})
+    print("Compiling {} of {} sampled papers with a single .tex file".format(len(papers), len(paper_tarnames)))
+
+    for strategy in args.strategies:
+        (compile_fn, pdflatex_runs) = STRATEGIES[strategy]
+        result = time_strategy(compile_fn, papers, os.path.join(args.work_dir, strategy), timeout=args.timeout,
+                               draft_first_pass=args.draft_first_pass)
+        seconds_per_paper = result['seconds_per_paper']
+        total_seconds = sum(seconds_per_paper)
+        print("{}: {} pdflatex runs per paper, {}/{} papers compiled, {:.1f} papers per minute, "
+              "mean {:.2f}s and median {:.2f}s per paper".format(
+                  strategy, pdflatex_runs, result['n_compiled'], len(papers),
+                  60 * len(papers) / max(total_seconds, 1e-6),
+                  statistics.mean(seconds_per_paper) if seconds_per_paper else 0.,
+                  statistics.median(seconds_per_paper) if seconds_per_paper else 0.))
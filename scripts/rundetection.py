@@ -1,5 +1,7 @@
-"""Detect the figures in a PDF."""
+"""Detect the figures in a PDF or a batch of PDFs."""
 
+import glob
+import json
 import logging
 import os
 
@@ -8,29 +10,88 @@ import click
 
 logger = logging.getLogger(__name__)
 
+BATCH_RESULTS_FILE_NAME = 'deepfigures-batch-results.jsonl'
+
+
+def get_pdf_paths(pdf_path):
+    """Return the PDF paths referred to by ``pdf_path``.
+
+    :param str pdf_path: the path to a PDF, a directory containing
+      PDFs, or a manifest file listing one PDF path per line. Relative
+      paths in a manifest are relative to the manifest's directory.
+
+    :returns: a list of paths to PDFs.
+    """
+    if os.path.isdir(pdf_path):
+        return sorted(glob.glob(os.path.join(pdf_path, '*.pdf')))
+    if pdf_path.lower().endswith('.pdf'):
+        return [pdf_path]
+    manifest_dir = os.path.dirname(os.path.abspath(pdf_path))
+    with open(pdf_path, 'r') as f_in:
+        return [
+            os.path.join(manifest_dir, line.strip())
+            for line in f_in
+            if line.strip() and not line.startswith('#')
+        ]
+
 
 @click.command(
     context_settings={
         'help_option_names': ['-h', '--help']
         })
+@click.option(
+    '--no-page-images',
+    is_flag=True,
+    help='stream pages into detection without saving page renderings.')
 @click.argument(
     'output_directory',
     type=click.Path(file_okay=False))
 @click.argument(
     'pdf_path',
-    type=click.Path(exists=True, dir_okay=False))
-def rundetection(output_directory, pdf_path):
-    """Detect figures from the pdf at PDF_PATH.
+    type=click.Path(exists=True))
+def rundetection(output_directory, pdf_path, no_page_images=False):
+    """Detect figures from the pdf(s) at PDF_PATH.
 
     Detect the figures from the pdf located at PDF_PATH and write the
     detection results to the directory specified by OUTPUT_DIRECTORY.
+
+    PDF_PATH may also be a directory of PDFs or a manifest file listing
+    one PDF path per line, in which case every PDF is processed by the
+    same warm pipeline and a line of JSON describing each result is
+    appended to OUTPUT_DIRECTORY/deepfigures-batch-results.jsonl as soon
+    as that PDF finishes.
     """
     # import lazily to speed up response time for returning help text
     from deepfigures.extraction import pipeline
 
     figure_extractor = pipeline.FigureExtractionPipeline()
 
-    figure_extractor.extract(pdf_path, output_directory)
+    if os.path.isfile(pdf_path) and pdf_path.lower().endswith('.pdf'):
+        figure_extractor.extract(
+            pdf_path,
+            output_directory,
+            write_page_images=not no_page_images)
+        return
+
+    pdf_paths = get_pdf_paths(pdf_path)
+    logger.info('Detecting figures in {} PDFs.'.format(len(pdf_paths)))
+    os.makedirs(output_directory, exist_ok=True)
+    batch_results_path = os.path.join(
+        output_directory, BATCH_RESULTS_FILE_NAME)
+    with open(batch_results_path, 'a') as f_out:
+        for path, figure_extraction, error in figure_extractor.extract_batch(
+                pdf_paths,
+                output_directory,
+                write_page_images=not no_page_images):
+            f_out.write(json.dumps({
+                'pdf': path,
+                'deepfigures_json_path':
+                    figure_extraction and figure_extraction.deepfigures_json_path,
+                'stage_timings':
+                    figure_extraction and figure_extraction.stage_timings,
+                'error': error
+            }) + '\n')
+            f_out.flush()
 
 
 if __name__ == '__main__':
@@ -15,7 +15,7 @@ from imgaug import augmenters as iaa
 import logging.config
 from typing import List
 from deepfigures.utils import image_util
-from deepfigures.extraction.datamodels import BoxClass
+from deepfigures.extraction.datamodels import BoxClass, crop_whitespace_edges_many
 import matplotlib
 from pprint import pformat
 
@@ -121,16 +121,20 @@ def rezoom(
     )
 
 
-def build_forward(H, x, phase, reuse):
+def build_forward(H, x, phase, reuse, is_training=True):
     '''
     Construct the forward model
+
+    is_training is passed to the slim backbone. When it is False, batch norm
+    uses its moving statistics rather than the statistics of the current batch,
+    so each image's output is independent of the rest of the batch.
     '''
 
     grid_size = H['grid_width'] * H['grid_height']
     outer_size = grid_size * H['batch_size']
     input_mean = 117.
     x -= input_mean
-    cnn, early_feat = googlenet_load.model(x, H, reuse)
+    cnn, early_feat = googlenet_load.model(x, H, reuse, is_training=is_training)
     early_feat_channels = H['early_feat_channels']
     early_feat = early_feat[:, :, :, :early_feat_channels]
 
@@ -665,17 +669,16 @@ def get_hidden_detections(sess, H, hidden_x_in, hidden_pred_boxes, hidden_pred_c
             np_pred_boxes,
             use_stitching=True,
             min_conf=conf_threshold,
-            show_suppressed=False)
+            show_suppressed=False,
+            draw=False)
         detected_boxes = [
             BoxClass(x1=r.x1, y1=r.y1, x2=r.x2, y2=r.y2).resize_by_page(
                 input_shape, page_data['orig_size'])
             for r in rects if r.score > conf_threshold
         ]
         if crop_whitespace:
-            detected_boxes = [
-                box.crop_whitespace_edges(page_data['page_image'])
-                for box in detected_boxes
-            ]
+            detected_boxes = crop_whitespace_edges_many(
+                detected_boxes, page_data['page_image'])
             detected_boxes = list(filter(None, detected_boxes))
         page_data['detected_boxes'] = detected_boxes
     return [page_data['detected_boxes'] for page_data in page_datas]